@@ -1,2 +1,3 @@
 from .matchmaking import MatchmakingConsumer
-from .game import GameConsumer
\ No newline at end of file
+from .game import GameConsumer
+from .spectator import SpectatorConsumer
@@ -1,305 +1,684 @@
 import json
-import math
 import asyncio
-import random
+import logging
 import time
+import secrets
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
+from channels.layers import get_channel_layer, InMemoryChannelLayer
 from collections import defaultdict
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from pong.engine.batch import get_batch_physics
+from pong.engine.bot import Bot
+from pong.engine.checkpoint import get_checkpointer, take_restored_room
+from pong.engine.physics import STEP_RATE, PhysicsEngine, move_paddle, new_paddle, step_paddle
+from pong.engine.replay import InputLog, replay_path, write_replay
+from pong.engine.results import GameResult, get_result_writer
+from pong.engine.scheduler import get_scheduler
+from pong.engine.sharding import is_local_room, shard_channel, shard_count, shard_for, spectator_group
+from pong.engine.state import COUNTDOWN, ENDED, GOAL_PAUSE, PLAYING, WAITING, Ball, RoomState
+from pong.utils import metrics
+from pong.utils.rate_limit import TokenBucket
+from .outbound import OutboundQueue
+from .shard import get_shard_listener
+from .protocol import (
+    BINARY_SUBPROTOCOL, build_game_message,
+    encode_state_frame, encode_state_text, decode_client_frame,
+)
+
+logger = logging.getLogger('pong.game')
 
 class GameConsumer(AsyncWebsocketConsumer):
     # ゲームごとのプレイヤー管理を改善
     game_players = {}  # {game_room: {channel_name: player_number}}
     # ゲーム状態の追跡
-    game_states = {}  # {game_room: {'ended': False, 'ball': {...}, 'paddles': {...}, 'score': {...}}}
+    game_states = {}  # {game_room: RoomState}
     game_tasks = {}  # ゲームごとのタスク管理
+    end_tasks = {}  # {game_room: asyncio.Task} 終了処理 (結果の保存と通知) が終わるまで参照を持つ
+    game_connections = {}  # {game_room: {channel_name: consumer}} このプロセスの接続
+    keyframe_interval = getattr(settings, 'PONG_KEYFRAME_INTERVAL', 60)  # キーフレームを送るフレーム間隔
+    input_rate_limit = getattr(settings, 'PONG_INPUT_RATE_LIMIT', 120)  # 接続ごとのパドル入力数の上限 (毎秒)
+    load_shed_budget = getattr(settings, 'PONG_LOAD_SHED_BUDGET', 0.8)  # 送信頻度を下げ始めるティック予算の使用率
+    min_snapshot_rate = getattr(settings, 'PONG_MIN_SNAPSHOT_RATE', 20)  # 送信頻度を下げるときの下限 (Hz)
+    reconnect_grace = getattr(settings, 'PONG_RECONNECT_GRACE', 20)  # 切断したプレイヤーの再接続を待つ秒数 (0 で待たない)
+    spectator_rate = getattr(settings, 'PONG_SPECTATOR_RATE', 15)  # 観戦者へのゲーム状態の送信頻度 (Hz)
+    spectator_limit = getattr(settings, 'PONG_SPECTATOR_LIMIT', 50)  # ルームごとの観戦者数の上限
+    countdown_seconds = getattr(settings, 'PONG_COUNTDOWN_SECONDS', 3)  # 2人揃ってからゲーム開始までの秒数
+    goal_pause_seconds = getattr(settings, 'PONG_GOAL_PAUSE_SECONDS', 1)  # ゴール後にボールを止めておく秒数
+    bot_difficulty = getattr(settings, 'PONG_BOT_DIFFICULTY', 'normal')  # 難易度の指定がないときのボットの難易度
 
     async def connect(self):
         self.game_room = None
         self.player_number = None
-        print("New WebSocket connection established")
-        await self.accept()
+        # パドル入力の受け付け数の上限 (超えた分は捨てる)
+        self.input_limit = TokenBucket(self.input_rate_limit)
+        # クライアントがバイナリ形式のサブプロトコルを要求していれば使う
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        logger.debug('WebSocket connected (%s)', 'binary' if self.binary else 'json')
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        self.start_outbound()
+        # 複数ワーカーでルームを分担しているときは、このワーカーの担当分の転送を受け付ける
+        if shard_count() > 1:
+            get_shard_listener()
 
     async def disconnect(self, close_code):
+        # 接続の確立前に失敗した場合は送信キューがない
+        outbound = getattr(self, 'outbound', None)
+        if outbound is not None:
+            outbound.stop()
         if self.game_room:
-            print(f"⚠️ Player {self.player_number} disconnecting from game {self.game_room}")
-            
-            # もしゲームがまだ終了していない場合は中断と見なす
-            if self.game_room in self.game_states and not self.game_states[self.game_room]['ended']:
-                print(f"🚨 Game interrupted by disconnect: Player {self.player_number} from {self.game_room}")
-                
-                # ゲーム状態を終了に設定
-                self.game_states[self.game_room]['ended'] = True
-                
-                # 残っているプレイヤーに通知
-                await self.channel_layer.group_send(
-                    self.game_room,
-                    {
-                        'type': 'game_message',
-                        'event': 'game_interrupted',
-                        'player_number': self.player_number,
-                        'reason': 'disconnect'
-                    }
-                )
-                
-                # ゲームタスクをキャンセル
-                if self.game_room in self.game_tasks and self.game_tasks[self.game_room]:
-                    print(f"🚨 Cancelling game loop due to disconnect")
-                    self.game_tasks[self.game_room].cancel()
-                    del self.game_tasks[self.game_room]
+            logger.info('Player %s disconnecting', self.player_number, extra={'room': self.game_room})
             
-            if self.game_room in self.game_players:
-                if self.channel_name in self.game_players[self.game_room]:
-                    del self.game_players[self.game_room][self.channel_name]
-                
-                if not self.game_players[self.game_room]:
-                    # 部屋からプレイヤーがいなくなった場合
-                    print(f"⚠️ No players left in game {self.game_room}, cleaning up")
-                    if self.game_room in self.game_tasks and self.game_tasks[self.game_room]:
-                        print(f"Cancelling game loop for {self.game_room}")
-                        self.game_tasks[self.game_room].cancel()
-                        del self.game_tasks[self.game_room]
-                    
-                    # ゲーム状態の削除
-                    if self.game_room in self.game_states:
-                        del self.game_states[self.game_room]
-                    
-                    del self.game_players[self.game_room]
+            connections = self.game_connections.get(self.game_room)
+            if connections is not None:
+                connections.pop(self.channel_name, None)
+                if not connections:
+                    del self.game_connections[self.game_room]
             
             await self.channel_layer.group_discard(
                 self.game_room,
                 self.channel_name
             )
+            
+            # ルームの状態を持つワーカーでプレイヤーを退出させる
+            await self.route_to_room({
+                'type': 'room.leave',
+                'game_room': self.game_room,
+                'channel': self.channel_name,
+                'player_number': self.player_number,
+            })
+
+    def start_outbound(self):
+        """この接続の送信キューを作り、送信タスクを動かす"""
+        self.outbound = OutboundQueue(self.send, super().close)
+        self.outbound.start()
 
-    async def receive(self, text_data):
+    async def close(self, code=None):
+        # キューに残っているメッセージを送ってから閉じる
+        outbound = getattr(self, 'outbound', None)
+        if outbound is None:
+            await super().close(code)
+        else:
+            outbound.put_close(code)
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            if bytes_data is not None:
+                data = decode_client_frame(bytes_data)
+            else:
+                data = json.loads(text_data)
             
-            # ログレベルを最小限に: パドル移動のログは出力しない
+            # パドル移動はログに出さない (他のメッセージも内容には再接続トークンが含まれるので種類だけ)
             if data['type'] != 'paddle_move':
-                print(f"Received data: {data}")
+                logger.debug('Received %s', data['type'], extra={'room': self.game_room})
             
             # ゲーム中断の処理を特別扱い
             if data['type'] == 'game_interrupted':
-                print(f"🚨 Game {self.game_room} interrupted by player {self.player_number}: {data.get('reason', 'unknown')}")
-                
-                # ゲーム状態を終了状態に設定
-                if self.game_room in self.game_states:
-                    self.game_states[self.game_room]['ended'] = True
-                
-                # ゲームタスクをキャンセル
-                if self.game_room in self.game_tasks and self.game_tasks[self.game_room]:
-                    print(f"🚨 Cancelling game loop for interrupted game {self.game_room}")
-                    self.game_tasks[self.game_room].cancel()
-                    del self.game_tasks[self.game_room]
-                
-                # 中断メッセージを全プレイヤーに送信
-                await self.channel_layer.group_send(
-                    self.game_room,
-                    {
-                        'type': 'game_message',
-                        'event': 'game_interrupted',
+                if self.game_room:
+                    await self.route_to_room({
+                        'type': 'room.interrupt',
+                        'game_room': self.game_room,
                         'player_number': self.player_number,
-                        'reason': data.get('reason', 'unknown')
-                    }
-                )
+                        'reason': data.get('reason', 'unknown'),
+                    })
                 return
             
             elif data['type'] == 'join_game':
                 self.game_room = data['game_id']
                 self.player_number = data['player_number']
                 
-                # ゲームルームがなければ初期化
-                if self.game_room not in self.game_players:
-                    print(f"Creating new game room: {self.game_room}")
-                    self.game_players[self.game_room] = {}
-                    # ゲーム状態も初期化
-                    self.game_states[self.game_room] = {
-                        'ended': False,
-                        'ball': {
-                            'x': 0,
-                            'y': 1,
-                            'z': 0,
-                            'velocity': {
-                                'x': 0.2,
-                                'y': 0,
-                                'z': 0.3,
-                            }
-                        },
-                        'paddles': {
-                            1: {'x': 0},  # プレイヤー1のパドル位置
-                            2: {'x': 0}   # プレイヤー2のパドル位置
-                        },
-                        'score': {
-                            'player1': 0,
-                            'player2': 0
-                        },
-                        'game_started': False,
-                        'last_update': time.time()
-                    }
-                
-                # プレイヤーをゲームに追加
-                self.game_players[self.game_room][self.channel_name] = self.player_number
-                
-                print(f"👤 Player {self.player_number} joining game {self.game_room}")
-                print(f"Current players in game: {self.game_players[self.game_room]}")
-                
+                # この接続はこのプロセスで持ち、ルームの状態は担当のワーカーが持つ
+                self.game_connections.setdefault(self.game_room, {})[self.channel_name] = self
                 await self.channel_layer.group_add(
                     self.game_room,
                     self.channel_name
                 )
                 
-                # 参加通知を送信
-                await self.channel_layer.group_send(
-                    self.game_room,
-                    {
-                        'type': 'game_message',
-                        'event': 'player_joined',
-                        'game_id': self.game_room,
-                        'player_number': self.player_number
-                    }
-                )
+                await self.route_to_room({
+                    'type': 'room.join',
+                    'game_room': self.game_room,
+                    'channel': self.channel_name,
+                    'player_number': self.player_number,
+                    'binary': self.binary,
+                    'resume_token': data.get('resume_token'),
+                    # ボットと対戦する場合は、その難易度
+                    'bot': (data.get('difficulty') or self.bot_difficulty) if data.get('opponent') == 'bot' else None,
+                })
                 
-                # プレイヤーが2人集まったらゲームを開始
-                if len(self.game_players[self.game_room]) == 2 and self.game_room not in self.game_tasks:
-                    print(f"🎮 Two players joined game {self.game_room}, starting game in 3 seconds")
-                    
-                    # 3秒待機してからゲーム開始
-                    await asyncio.sleep(3)
-                    
-                    if self.game_room in self.game_states:  # 切断されていないか確認
-                        print(f"🎮 Starting game {self.game_room}")
-                        self.game_states[self.game_room]['game_started'] = True
-                        self.game_states[self.game_room]['last_update'] = time.time()
-                        
-                        # ゲーム開始メッセージを送信
-                        await self.channel_layer.group_send(
-                            self.game_room,
-                            {
-                                'type': 'game_message',
-                                'event': 'game_start'
-                            }
-                        )
-                        
-                        # ゲームループタスクを開始
-                        print(f"Starting game loop for {self.game_room}")
-                        self.game_tasks[self.game_room] = asyncio.create_task(self.game_loop(self.game_room))
+            elif data['type'] == 'request_keyframe':
+                # クライアントがフレームの欠落を検出したら全項目を送り直す
+                if self.game_room:
+                    await self.route_to_room({
+                        'type': 'room.keyframe',
+                        'game_room': self.game_room,
+                        'channel': self.channel_name,
+                        'binary': self.binary,
+                    })
                 
             elif data['type'] == 'paddle_move':
                 if not self.game_room or self.player_number is None:
                     return
+                if not self.input_limit.allow():
+                    return
                 
-                # パドル位置を更新
-                if self.game_room in self.game_states:
-                    self.game_states[self.game_room]['paddles'][self.player_number]['x'] = data['position']
-                
-                # 他のプレイヤーにパドル移動を通知
-                await self.channel_layer.group_send(
-                    self.game_room,
-                    {
-                        'type': 'game_message',
-                        'event': 'paddle_move',
-                        'position': data['position'],
-                        'player_number': self.player_number
-                    }
-                )
+                # 入力はバッファに入れ、次のティックでまとめて反映する
+                # (位置は次のゲーム状態フレームで相手に届く)
+                await self.route_to_room({
+                    'type': 'room.input',
+                    'game_room': self.game_room,
+                    'player_number': self.player_number,
+                    'seq': int(data.get('seq', 0)),
+                    'position': float(data['position']),
+                })
                 
         except Exception as e:
-            print(f"Error in receive: {e}")
+            logger.warning('Error in receive: %s', e, extra={'room': self.game_room})
+
+    async def route_to_room(self, message):
+        """ルームへの操作を、ルームの状態を持つワーカーで実行する"""
+        game_room = message['game_room']
+        if is_local_room(game_room):
+            handler = getattr(self, message['type'].replace('.', '_'))
+            await handler(message)
+        else:
+            # 担当のワーカーに転送する (channel layer がプロセス間で共有されている必要がある)
+            await self.channel_layer.send(shard_channel(shard_for(game_room)), message)
 
-    async def game_loop(self, game_room):
-        """ゲームループ - ボールの位置を更新し、状態を送信する"""
-        print(f"Game loop started for {game_room}")
+    async def room_join(self, event):
+        """プレイヤーをルームに参加させる (ルームを担当するワーカーで実行)"""
+        game_room = event['game_room']
+        player_number = event['player_number']
         
-        try:
-            while game_room in self.game_states and not self.game_states[game_room]['ended']:
-                # ゲームが開始されていなければスキップ
-                if not self.game_states[game_room]['game_started']:
-                    await asyncio.sleep(0.1)
-                    continue
-                
-                # ゲーム状態を更新
-                self.update_game_state(game_room)
-                
-                # 更新されたゲーム状態を送信
-                await self.send_game_state(game_room)
-                
-                # 約60FPSで実行 (16.6ms)
-                await asyncio.sleep(1/60)
+        # 再接続用のトークンがあれば、切断前のゲームに戻る
+        if event.get('resume_token'):
+            await self.resume_player(event)
+            return
+        
+        reason = await self.join_rejection(game_room, player_number, event.get('bot'))
+        if reason is not None:
+            logger.info('Rejected player %s: %s', player_number, reason, extra={'room': game_room})
+            await self.send_to_channel(game_room, event['channel'], {
+                'type': 'game_message',
+                'event': 'join_rejected',
+                'reason': reason
+            })
+            return
+        
+        # ゲームルームがなければ初期化
+        if game_room not in self.game_players:
+            simulation_rate, snapshot_rate = await self.load_room_rates(game_room)
+        
+        # (読み込みを待つ間に相手のプレイヤーが作成していなければ)
+        if game_room not in self.game_players:
+            logger.info('Creating game room (simulation %sHz, snapshot %sHz)', simulation_rate, snapshot_rate, extra={'room': game_room})
+            self.create_room(game_room, simulation_rate, snapshot_rate)
+        
+        # プレイヤーをゲームに追加
+        self.game_players[game_room][event['channel']] = player_number
+        game_state = self.game_states[game_room]
+        # トークンなしで参加し直した場合も、このプレイヤーの再接続待ちを終える
+        rejoined = self.release_hold(game_state, player_number)
+        if event.get('bot'):
+            self.add_bot(game_room, 3 - player_number, event['bot'])
+        
+        logger.info('Player %s joined (%s players)', player_number, len(self.game_players[game_room]), extra={'room': game_room})
+        
+        # 再接続のためのトークンを発行して、参加したプレイヤーだけに送る
+        token = secrets.token_urlsafe(16)
+        game_state.tokens[player_number] = token
+        await self.send_to_channel(game_room, event['channel'], {
+            'type': 'game_message',
+            'event': 'session',
+            'player_number': player_number,
+            'resume_token': token,
+            'grace': self.reconnect_grace
+        })
+        
+        # 参加したクライアントには差分の基準となるキーフレームを送る
+        await self.send_keyframe(game_room, event['channel'], event['binary'])
+        
+        # 参加通知を送信
+        await self.group_send(
+            game_room,
+            {
+                'type': 'game_message',
+                'event': 'player_reconnected' if rejoined else 'player_joined',
+                'game_id': game_room,
+                'player_number': player_number
+            }
+        )
+        
+        # プレイヤーが2人集まったらカウントダウンを始める (開始はゲームループのティックで行う)
+        # (ボットは参加した時点で揃っているものとして数える)
+        if len(self.game_players[game_room]) + len(game_state.bots or ()) == 2 and game_room not in self.game_tasks:
+            logger.info('Two players joined, starting game in %s seconds', self.countdown_seconds, extra={'room': game_room})
+            self.enter_phase(game_state, COUNTDOWN, self.countdown_seconds)
+            self.game_tasks[game_room] = self.schedule_game_loop(game_room)
+
+    def create_room(self, game_room, simulation_rate, snapshot_rate):
+        """ゲームルームとゲーム状態を初期化する"""
+        self.game_players[game_room] = {}
+        now = time.monotonic()
+        game_state = self.game_states[game_room] = RoomState(
+            ball=Ball(vx=12.0, vz=18.0),  # 速度は1秒あたりの移動量
+            paddle1=new_paddle(now),  # プレイヤー1のパドル
+            paddle2=new_paddle(now),  # プレイヤー2のパドル
+            physics=PhysicsEngine(step_rate=simulation_rate),
+            simulation_rate=simulation_rate,
+            snapshot_rate=snapshot_rate,
+            now=now,
+        )
+        
+        # リプレイ用にシードとパドル入力を記録する
+        if replay_path(game_room.replace('game_', '')) is not None:
+            game_state.physics.log = InputLog(
+                game_state.physics.seed, simulation_rate, snapshot_rate, game_state.ball
+            )
         
-        except asyncio.CancelledError:
-            print(f"⚠️ Game loop for {game_room} was cancelled")
+        batch = get_batch_physics(get_scheduler())
+        if batch is not None:
+            batch.add(game_room, game_state.physics)
+        return game_state
+
+    async def join_rejection(self, game_room, player_number, bot):
+        """参加を断る理由を返す (参加できれば None)
+
+        ボットとの対戦は、対戦相手が決まっているルーム (GamePlayers があるか、他のプレイヤーが参加済み) では
+        受け付けない。ボットが入っている側には人は参加できない。
+        """
+        game_state = self.game_states.get(game_room)
+        if game_state is not None and player_number in (game_state.bots or ()):
+            return 'bot_slot'
+        if bot:
+            players = self.game_players.get(game_room, {})
+            if any(number != player_number for number in players.values()) or await self.room_has_players(game_room):
+                return 'bot_not_allowed'
+        return None
+
+    @database_sync_to_async
+    def room_has_players(self, game_room):
+        """ルームのゲームに GamePlayers が登録されているか (マッチングやトーナメントのゲーム)"""
+        try:
+            from pong.models import GamePlayers
+            
+            game_id = game_room.replace('game_', '')
+            return GamePlayers.objects.filter(game_id=game_id).exists()
+        except ValidationError:
+            # UUID でないゲームIDはデータベースにない
+            return False
         except Exception as e:
-            print(f"Error in game loop: {e}")
+            # 確認できなければボットは入れない
+            logger.warning('Error loading game players: %s', e, extra={'room': game_room})
+            return True
+
+    def add_bot(self, game_room, player_number, difficulty):
+        """空いている側にボットを入れる (ボットの状態はルームの状態に持ち、ゲームループのティックで動かす)"""
+        game_state = self.game_states[game_room]
+        if player_number in self.game_players[game_room].values() or player_number in (game_state.bots or ()):
+            return
+        if game_state.bots is None:
+            game_state.bots = {}
+        # リプレイで同じ動きになるよう、乱数はルームのシードから作る
+        game_state.bots[player_number] = Bot(player_number, difficulty, seed=(game_state.physics.seed << 2) | player_number)
+        logger.info('Bot (%s) joined as player %s', game_state.bots[player_number].difficulty, player_number, extra={'room': game_room})
+
+    async def room_input(self, event):
+        """パドル入力を次のティックまでバッファする (ルームを担当するワーカーで実行)"""
+        game_state = self.game_states.get(event['game_room'])
+        if game_state is not None:
+            game_state.set_input(event['player_number'], event['seq'], event['position'])
+
+    async def room_keyframe(self, event):
+        """キーフレームを送り直す (ルームを担当するワーカーで実行)"""
+        await self.send_keyframe(event['game_room'], event['channel'], event['binary'])
+
+    async def room_interrupt(self, event):
+        """ゲームを中断する (ルームを担当するワーカーで実行)"""
+        game_room = event['game_room']
+        logger.info('Game interrupted by player %s: %s', event['player_number'], event['reason'], extra={'room': game_room})
+        
+        # ゲーム状態を終了状態に設定
+        if game_room in self.game_states:
+            self.game_states[game_room].phase = ENDED
+        
+        # ゲームタスクをキャンセル
+        if game_room in self.game_tasks and self.game_tasks[game_room]:
+            self.game_tasks[game_room].cancel()
+            del self.game_tasks[game_room]
+        
+        # 中断メッセージを中断したプレイヤー以外に送信 (本人は既に画面を離れている)
+        await self.send_to_players(
+            game_room,
+            {
+                'type': 'game_message',
+                'event': 'game_interrupted',
+                'player_number': event['player_number'],
+                'reason': event['reason']
+            },
+            exclude=(event['player_number'],),
+            spectators=True,
+        )
+
+    async def room_leave(self, event):
+        """切断したプレイヤーをルームから外す (ルームを担当するワーカーで実行)"""
+        game_room = event['game_room']
+        player_number = event['player_number']
+        players = self.game_players.get(game_room)
+        if players is not None:
+            players.pop(event['channel'], None)
+            if player_number in players.values():
+                # 先に再接続していれば古い接続が外れただけ
+                return
+        
+        game_state = self.game_states.get(game_room)
+        if game_state is not None and not game_state.ended:
+            # 始まっていないルームは止めずに中断する
+            if self.reconnect_grace > 0 and player_number in game_state.tokens and game_state.phase != WAITING:
+                # すぐには終了せず、猶予期間のあいだ物理演算を止めて再接続を待つ
+                await self.hold_for_reconnect(game_room, player_number)
+                return
+            await self.interrupt_for_disconnect(game_room, player_number)
+        
+        self.cleanup_room(game_room)
+
+    async def hold_for_reconnect(self, game_room, player_number):
+        """切断したプレイヤーの再接続を猶予期間のあいだ待つ"""
+        game_state = self.game_states[game_room]
+        logger.info('Player %s dropped, waiting %ss for reconnect', player_number, self.reconnect_grace, extra={'room': game_room})
+        game_state.paused = True
+        previous = game_state.away.pop(player_number, None)
+        if previous is not None:
+            previous.cancel()
+        game_state.away[player_number] = asyncio.create_task(self.expire_reconnect(game_room, player_number))
+        
+        await self.send_to_players(
+            game_room,
+            {
+                'type': 'game_message',
+                'event': 'player_disconnected',
+                'player_number': player_number,
+                'grace': self.reconnect_grace
+            },
+            exclude=(player_number,),
+        )
+
+    async def expire_reconnect(self, game_room, player_number):
+        """猶予期間内に再接続しなければゲームを中断する"""
+        await asyncio.sleep(self.reconnect_grace)
+        game_state = self.game_states.get(game_room)
+        if game_state is None or game_state.away.get(player_number) is not asyncio.current_task():
+            return
+        del game_state.away[player_number]
+        
+        if not game_state.ended:
+            await self.interrupt_for_disconnect(game_room, player_number)
+        self.cleanup_room(game_room)
+
+    async def interrupt_for_disconnect(self, game_room, player_number):
+        """切断によりゲームを中断する"""
+        logger.info('Game interrupted by disconnect of player %s', player_number, extra={'room': game_room})
+        
+        # ゲーム状態を終了に設定
+        self.game_states[game_room].phase = ENDED
+        
+        # 残っているプレイヤーに通知
+        await self.send_to_players(
+            game_room,
+            {
+                'type': 'game_message',
+                'event': 'game_interrupted',
+                'player_number': player_number,
+                'reason': 'disconnect'
+            },
+            exclude=(player_number,),
+            spectators=True,
+        )
+        
+        # ゲームタスクをキャンセル
+        if game_room in self.game_tasks and self.game_tasks[game_room]:
+            self.game_tasks[game_room].cancel()
+            del self.game_tasks[game_room]
+
+    def cleanup_room(self, game_room):
+        """プレイヤーがいなくなったルームを削除する (再接続待ちのプレイヤーがいれば残す)"""
+        if self.game_players.get(game_room):
+            return
+        game_state = self.game_states.get(game_room)
+        if game_state is not None and game_state.away and not game_state.ended:
+            return
+        
+        # 部屋からプレイヤーがいなくなった場合
+        logger.info('No players left, cleaning up', extra={'room': game_room})
+        if game_room in self.game_tasks and self.game_tasks[game_room]:
+            self.game_tasks[game_room].cancel()
+            del self.game_tasks[game_room]
         
-        print(f"Game loop ended for {game_room}")
+        # ゲーム状態の削除
+        if game_state is not None:
+            for task in game_state.away.values():
+                task.cancel()
+            del self.game_states[game_room]
+        batch = get_batch_physics(get_scheduler())
+        if batch is not None:
+            batch.remove(game_room)
+        
+        self.game_players.pop(game_room, None)
+
+    async def resume_player(self, event):
+        """再接続したプレイヤーをルームに戻し、全員揃えばゲームを再開する"""
+        game_room = event['game_room']
+        player_number = event['player_number']
+        game_state = self.game_states.get(game_room)
+        if game_state is None:
+            # プロセスが再起動していればチェックポイントから戻す
+            game_state = self.restore_room(game_room)
+        token = game_state.tokens.get(player_number) if game_state is not None else None
+        if token is None or game_state.ended or not secrets.compare_digest(token, event['resume_token']):
+            await self.send_to_channel(game_room, event['channel'], {
+                'type': 'game_message',
+                'event': 'game_interrupted',
+                'player_number': player_number,
+                'reason': 'resume_failed'
+            })
+            return
+        
+        logger.info('Player %s reconnected', player_number, extra={'room': game_room})
+        self.game_players[game_room][event['channel']] = player_number
+        self.release_hold(game_state, player_number)
+        
+        # 再接続したクライアントには全項目のキーフレームを送る
+        await self.send_keyframe(game_room, event['channel'], event['binary'])
+        await self.group_send(
+            game_room,
+            {
+                'type': 'game_message',
+                'event': 'player_reconnected',
+                'player_number': player_number
+            }
+        )
+
+    def release_hold(self, game_state, player_number):
+        """戻ったプレイヤーの猶予期間のタイマーを止め、全員揃えば再開する (再接続を待っていたかを返す)"""
+        task = game_state.away.pop(player_number, None)
+        if task is not None:
+            task.cancel()
+        if not game_state.away and game_state.paused:
+            game_state.paused = False
+            game_state.last_update = time.monotonic()
+        return task is not None
+
+    def restore_room(self, game_room):
+        """チェックポイントからルームを復元し、両プレイヤーの再接続を待つ"""
+        game_state = take_restored_room(game_room)
+        if game_state is None:
+            return None
+        
+        logger.info('Restoring game from checkpoint (score %s-%s)', game_state.score1, game_state.score2, extra={'room': game_room})
+        game_state.physics = PhysicsEngine(step_rate=game_state.simulation_rate)
+        # 全員が戻るまで物理演算は止めておく (開始前・ゴール後の停止中だった場合は数え直す)
+        if game_state.phase != PLAYING:
+            self.enter_phase(game_state, COUNTDOWN, self.countdown_seconds)
+        game_state.paused = True
+        self.game_states[game_room] = game_state
+        self.game_players[game_room] = {}
+        batch = get_batch_physics(get_scheduler())
+        if batch is not None:
+            batch.add(game_room, game_state.physics)
+        
+        for player_number in game_state.tokens:
+            game_state.away[player_number] = asyncio.create_task(self.expire_reconnect(game_room, player_number))
+        self.game_tasks[game_room] = self.schedule_game_loop(game_room)
+        return game_state
+
+    def schedule_game_loop(self, game_room):
+        """ゲームループをプロセス共通のティックスケジューラに登録する"""
+        logger.debug('Game loop started', extra={'room': game_room})
+
+        def step(now):
+            game_state = self.game_states.get(game_room)
+            if game_state is None or game_state.ended:
+                # ゲームが終了したらスケジューラから外す
+                ticket.cancel()
+                batch = get_batch_physics(get_scheduler())
+                if batch is not None:
+                    batch.remove(game_room)
+                logger.debug('Game loop ended', extra={'room': game_room})
+                return
+            game_state.tick += 1
+            if game_state.bots:
+                self.drive_bots(game_state, now)
+            self.apply_inputs(game_state, now)
+            self.advance_phase(game_room, game_state, now)
+            self.update_game_state(game_room, now)
+
+        async def flush():
+            # 送信頻度に合わせてティックを間引いて送る (シミュレーションは毎ティック進める)
+            # 変化した項目がなければ何も送られない (ゴール後の停止中もパドルは送る)
+            game_state = self.game_states.get(game_room)
+            if game_state is None:
+                return
+            # フェーズの切り替え (カウントダウン・開始) の通知
+            if game_state.events:
+                events, game_state.events = game_state.events, []
+                for event in events:
+                    await self.group_send(game_room, event)
+            # 観戦者には別の (低い) 頻度で送る
+            if game_state.spectators and game_state.tick % self.spectator_interval() == 0:
+                await self.send_spectator_frame(game_room)
+            if game_state.tick % self.snapshot_interval(game_state):
+                return
+            await self.send_game_state(game_room)
+
+        ticket = get_scheduler().schedule(game_room, step, flush)
+        
+        # 動いているルームの状態を定期的に保存する (設定で有効な場合)
+        checkpointer = get_checkpointer(self.game_states)
+        if checkpointer is not None:
+            checkpointer.ensure_running()
+        # 前回のプロセスが書き込めなかったゲーム結果があれば書き込む
+        get_result_writer().ensure_running()
+        return ticket
+
+    def snapshot_interval(self, game_state):
+        """ゲーム状態を何ティックごとに送るかを返す (負荷が高いときは送信頻度を下げる)"""
+        scheduler = get_scheduler()
+        rate = game_state.snapshot_rate
+        if scheduler.stats.avg_budget > self.load_shed_budget:
+            rate = max(self.min_snapshot_rate, rate // 2)
+        interval = max(1, round(scheduler.rate / rate))
+        game_state.send_rate = scheduler.rate / interval
+        return interval
+
+    @classmethod
+    def room_rates(cls):
+        """ルームごとの現在のシミュレーション頻度と送信頻度 (監視用)"""
+        return {
+            game_room: {
+                'simulation_rate': game_state.simulation_rate,
+                'snapshot_rate': game_state.snapshot_rate,
+                'send_rate': game_state.send_rate,
+                'spectators': len(game_state.spectators or ()),
+            }
+            for game_room, game_state in list(cls.game_states.items())
+        }
 
-    def update_game_state(self, game_room):
+    @database_sync_to_async
+    def load_room_rates(self, game_room):
+        """GameOptions からルームのシミュレーション頻度と送信頻度を読み込む"""
+        default = (STEP_RATE, get_scheduler().rate)
+        try:
+            from pong.models import GameOptions
+            
+            # ゲームIDを取得（game_room形式: "game_{game_id}"）
+            game_id = game_room.replace('game_', '')
+            rates = GameOptions.objects.filter(game_id=game_id).values_list(
+                'simulation_rate', 'snapshot_rate'
+            ).first()
+            return rates or default
+        except Exception as e:
+            logger.warning('Error loading game options: %s', e, extra={'room': game_room})
+            return default
+
+    def apply_inputs(self, game_state, now):
+        """バッファしたパドル入力をゲーム状態に反映する (位置はサーバーが決める)
+
+        1ティックで届かない入力 (通信が止まった後のまとめて届いた入力など) は、着くまで毎ティック近づける。
+        """
+        for paddle, buffered in ((game_state.paddle1, game_state.input1), (game_state.paddle2, game_state.input2)):
+            if buffered is None:
+                if paddle.target is not None:
+                    step_paddle(paddle, now)
+                continue
+            seq, position = buffered
+            move_paddle(paddle, position, now)
+            # クライアントの予測の照合用に処理済みの入力番号を記録
+            paddle.seq = max(paddle.seq, seq)
+        game_state.input1 = game_state.input2 = None
+
+    def drive_bots(self, game_state, now):
+        """ボットの目標位置をパドル入力としてバッファする (人の入力と同じく移動速度の上限がかかる)"""
+        for player_number, bot in game_state.bots.items():
+            target = bot.think(game_state, now)
+            # 目標位置に着いていれば何もしない (ボットのルームのティックの処理を増やさない)
+            if game_state.paddle(player_number).x != target:
+                game_state.set_input(player_number, 0, target)
+
+    def update_game_state(self, game_room, now=None):
         """ゲーム状態を更新する (非同期ではないメソッド)"""
         if game_room not in self.game_states:
             return
         
         game_state = self.game_states[game_room]
+        batch = get_batch_physics(get_scheduler())
         
-        # ゲームが終了していたり、開始していなければスキップ
-        if game_state['ended'] or not game_state['game_started']:
+        # 対戦中 (カウントダウンやゴール後の停止中でない) でなければスキップ
+        if game_state.phase != PLAYING or game_state.paused:
+            if batch is not None and game_room in batch.slots:
+                # バッチエンジンの枠も止める (止めないと再接続待ちの間も配列側でボールが進む)
+                batch.exchange(game_room, game_state)
             return
         
         # 前回の更新からの経過時間を計算
-        current_time = time.time()
-        dt = current_time - game_state['last_update']
-        game_state['last_update'] = current_time
-        
-        # ボールとパドルの参照を取得
-        ball = game_state['ball']
-        paddles = game_state['paddles']
-        
-        # ボールの位置を更新
-        ball['x'] += ball['velocity']['x']
-        ball['z'] += ball['velocity']['z']
-        
-        # 左右の壁との衝突判定
-        if ball['x'] <= -15 or ball['x'] >= 15:
-            ball['velocity']['x'] *= -1
-        
-        # パドル1との衝突判定
-        if (ball['z'] >= 18 and ball['z'] <= 20 and 
-            ball['x'] >= paddles[1]['x'] - 2.5 and 
-            ball['x'] <= paddles[1]['x'] + 2.5):
-            ball['velocity']['z'] *= -1
-            # バウンド角度にランダム性を加える
-            ball['velocity']['x'] = (ball['x'] - paddles[1]['x']) / 5 + (random.random() * 0.1 - 0.05)
-        
-        # パドル2との衝突判定
-        if (ball['z'] <= -18 and ball['z'] >= -20 and 
-            ball['x'] >= paddles[2]['x'] - 2.5 and 
-            ball['x'] <= paddles[2]['x'] + 2.5):
-            ball['velocity']['z'] *= -1
-            # バウンド角度にランダム性を加える
-            ball['velocity']['x'] = (ball['x'] - paddles[2]['x']) / 5 + (random.random() * 0.1 - 0.05)
-        
-        # ゴール判定
-        if ball['z'] > 20:
-            # プレイヤー2の得点
-            game_state['score']['player2'] += 1
-            print(f"⚽ Player 2 scored! Score: {game_state['score']['player1']}-{game_state['score']['player2']}")
-            
-            # 勝者チェック
-            self.check_for_winner(game_room)
-            
-            if not game_state['ended']:
-                self.reset_ball(game_room)
-                
-        elif ball['z'] < -20:
-            # プレイヤー1の得点
-            game_state['score']['player1'] += 1
-            print(f"⚽ Player 1 scored! Score: {game_state['score']['player1']}-{game_state['score']['player2']}")
+        current_time = time.monotonic() if now is None else now
+        dt = current_time - game_state.last_update
+        game_state.last_update = current_time
+        
+        # 経過時間ぶん固定ステップで物理演算を進める
+        # (バッチエンジンではティックの最初に全ルーム分まとめて計算済み)
+        if batch is not None:
+            scorers = batch.exchange(game_room, game_state)
+        else:
+            scorers = game_state.physics.advance(game_state, dt)
+        
+        for scorer in scorers:
+            game_state.add_point(scorer)
+            logger.info('Player %s scored (%s-%s)', scorer, game_state.score1, game_state.score2, extra={'room': game_room})
             
             # 勝者チェック
             self.check_for_winner(game_room)
             
-            if not game_state['ended']:
+            if not game_state.ended:
                 self.reset_ball(game_room)
 
     def reset_ball(self, game_room):
@@ -309,31 +688,39 @@ class GameConsumer(AsyncWebsocketConsumer):
             
         game_state = self.game_states[game_room]
         
-        # ボールを中央に戻す
-        game_state['ball']['x'] = 0
-        game_state['ball']['y'] = 1
-        game_state['ball']['z'] = 0
-        
-        # 速度を再設定
-        direction = 1 if random.random() > 0.5 else -1
-        game_state['ball']['velocity'] = {
-            'x': random.random() * 0.2 - 0.1,
-            'y': 0,
-            'z': direction * 0.3
-        }
-        
-        # ゲームを一時停止
-        game_state['game_started'] = False
+        # ボールを中央に戻して速度を再設定
+        game_state.physics.serve(game_state)
         
-        # 1秒後に再開するタスクを作成
-        asyncio.create_task(self.resume_game_after_delay(game_room, 1))
+        # 少しの間止めてから再開する (再開はゲームループのティックで行う)
+        self.enter_phase(game_state, GOAL_PAUSE, self.goal_pause_seconds)
 
-    async def resume_game_after_delay(self, game_room, delay):
-        """遅延後にゲームを再開する"""
-        await asyncio.sleep(delay)
-        if game_room in self.game_states and not self.game_states[game_room]['ended']:
-            print(f"Resuming game {game_room} after goal")
-            self.game_states[game_room]['game_started'] = True
+    def enter_phase(self, game_state, phase, seconds=0):
+        """ルームのフェーズを切り替える (seconds を指定すると、その秒数ぶんのティックの後に対戦を始める)"""
+        game_state.phase = phase
+        game_state.phase_ticks = max(1, round(seconds * get_scheduler().rate)) if seconds else 0
+
+    def advance_phase(self, game_room, game_state, now):
+        """カウントダウンとゴール後の停止をティックごとに進める (再接続を待っている間は止める)"""
+        if not game_state.phase_ticks or game_state.paused:
+            return
+        rate = round(get_scheduler().rate)
+        if game_state.phase == COUNTDOWN and game_state.phase_ticks % rate == 0:
+            game_state.events.append({
+                'type': 'game_message',
+                'event': 'countdown',
+                'seconds': game_state.phase_ticks // rate
+            })
+        game_state.phase_ticks -= 1
+        if game_state.phase_ticks:
+            return
+        
+        if game_state.phase == COUNTDOWN:
+            logger.info('Starting game', extra={'room': game_room})
+            game_state.events.append({'type': 'game_message', 'event': 'game_start'})
+        else:
+            logger.debug('Resuming game after goal', extra={'room': game_room})
+        game_state.phase = PLAYING
+        game_state.last_update = now
 
     def check_for_winner(self, game_room):
         """勝者をチェックする"""
@@ -346,38 +733,54 @@ class GameConsumer(AsyncWebsocketConsumer):
         winning_score = 3
         winner = None
         
-        if game_state['score']['player1'] >= winning_score:
+        if game_state.score1 >= winning_score:
             winner = 1
-        elif game_state['score']['player2'] >= winning_score:
+        elif game_state.score2 >= winning_score:
             winner = 2
             
         if winner:
-            print(f"🏆 Player {winner} wins game {game_room}!")
-            game_state['ended'] = True
+            logger.info('Player %s wins', winner, extra={'room': game_room})
+            game_state.phase = ENDED
+            
+            # 終了処理の前にルームが片付けられても結果を失わないように、必要なものはここで取っておく
+            # (ゲームIDは game_room形式: "game_{game_id}" から取る)
+            result = GameResult(game_room.replace('game_', ''), game_state.score1, game_state.score2, winner)
+            replay = None
+            if game_state.physics is not None and game_state.physics.log is not None:
+                replay = game_state.physics.log.encode(game_state.score1, game_state.score2, game_state.physics.steps)
             
-            # ゲーム終了を全プレイヤーに通知するタスクを作成
-            asyncio.create_task(self.send_game_end(game_room, winner))
+            # ゲーム終了の通知と結果の保存はティックを止めないように別のタスクで行う
+            self.start_game_end(game_room, result, replay)
 
-    async def send_game_end(self, game_room, winner):
-        """ゲーム終了メッセージを送信し、スコアをデータベースに保存"""
-        
-        # 現在のスコア情報を取得
-        current_score = self.game_states[game_room]['score']
-        
-        # ゲームIDを取得（game_room形式: "game_{game_id}"）
-        game_id = game_room.replace('game_', '')
+    def start_game_end(self, game_room, result, replay=None):
+        """終了処理のタスクを作り、終わるまで end_tasks に残す (失敗したらログに残す)"""
+        task = asyncio.get_running_loop().create_task(self.send_game_end(game_room, result, replay))
+        self.end_tasks[game_room] = task
+
+        def done(task):
+            if self.end_tasks.get(game_room) is task:
+                del self.end_tasks[game_room]
+            if not task.cancelled() and task.exception() is not None:
+                logger.error('Error ending game', exc_info=task.exception(), extra={'room': game_room})
+
+        task.add_done_callback(done)
+        return task
+
+    async def send_game_end(self, game_room, result, replay=None):
+        """ゲーム終了メッセージを送信し、スコアと勝者の保存を依頼する (ルームが片付けられた後でも動く)"""
         
-        # データベースにスコアと勝者を保存
-        await self.update_game_score_and_winner(game_id, current_score, winner)
+        # スコアと勝者はアウトボックスに残してから、他のゲームの結果とまとめてデータベースに保存する
+        with metrics.RESULT_WRITE_LATENCY.time():
+            await get_result_writer().submit(result)
         
         # WebSocketで結果を通知
-        await self.channel_layer.group_send(
+        await self.broadcast(
             game_room,
             {
                 'type': 'game_message',
                 'event': 'game_end',
-                'winner': winner,
-                'score': current_score
+                'winner': result.winner,
+                'score': {'player1': result.score1, 'player2': result.score2}
             }
         )
         
@@ -385,81 +788,240 @@ class GameConsumer(AsyncWebsocketConsumer):
         if game_room in self.game_tasks:
             self.game_tasks[game_room].cancel()
             del self.game_tasks[game_room]
+        
+        # リプレイの書き込みはスレッドに任せる
+        if replay is not None:
+            await self.save_replay(result.game_id, replay)
 
-    @database_sync_to_async
-    def update_game_score_and_winner(self, game_id, score, winner):
-        """ゲームスコアと勝者をデータベースに保存"""
+    async def save_replay(self, game_id, data):
+        """リプレイをファイルに書き込む"""
+        path = replay_path(game_id)
         try:
-            from pong.models import Game, GamePlayers
-            
-            # ゲームを取得
-            game = Game.objects.get(id=game_id)
-            
-            # プレイヤー情報を更新
-            players = GamePlayers.objects.filter(game=game)
-            winner_player = None
-            
-            for player in players:
-                if player.player_number == 1:
-                    player.score = score['player1']
-                elif player.player_number == 2:
-                    player.score = score['player2']
-                
-                # 勝者を記録
-                if winner and player.player_number == winner:
-                    winner_player = player
-                
-                player.save()
-            
-            # 勝者を設定
-            if winner_player:
-                game.winner = winner_player.user
-                game.save()
-                print(f"Game {game_id}: Winner saved: player{winner} (user: {game.winner})")
-            
-            return True
-        except Exception as e:
-            print(f"Error updating game score and winner: {e}")
-            return False
+            await asyncio.get_running_loop().run_in_executor(None, write_replay, path, data)
+            logger.info('Saved replay (%s bytes)', len(data), extra={'game_id': game_id})
+        except OSError as e:
+            logger.error('Error saving replay: %s', e, extra={'game_id': game_id})
 
     async def send_game_state(self, game_room):
-        """現在のゲーム状態を全プレイヤーに送信する"""
+        """現在のゲーム状態 (前回から変化した項目のみ) を全プレイヤーに送信する"""
         if game_room not in self.game_states:
             return
             
         game_state = self.game_states[game_room]
         
-        # ゲーム状態を送信
-        await self.channel_layer.group_send(
-            game_room,
-            {
+        # 一定間隔でキーフレーム (全項目) を送り、それ以外は差分だけ送る
+        seq = game_state.frame_seq + 1
+        keyframe = seq % self.keyframe_interval == 0
+        fields = self.snapshot_fields(game_state, keyframe)
+        if not fields:
+            return
+        game_state.frame_seq = seq
+        tick = game_state.tick
+        
+        # ルームごとに1回だけエンコードして、全員に同じデータを送る
+        if self.is_local_fanout(game_room):
+            # 全員がこのプロセスにいれば channel layer を通さず直接送る
+            # (使われている形式だけをエンコードする)
+            # 送信キューに入れるだけなので、受信が遅いクライアントがいてもティックは止まらない
+            text = data = None
+            sent = size = 0
+            for consumer in list(self.game_connections.get(game_room, {}).values()):
+                if consumer.binary:
+                    if data is None:
+                        data = encode_state_frame(seq, tick, fields, keyframe)
+                    consumer.outbound.put_frame(data=data, keyframe=keyframe)
+                    size += len(data)
+                else:
+                    if text is None:
+                        text = encode_state_text(seq, tick, fields, keyframe)
+                    consumer.outbound.put_frame(text=text, keyframe=keyframe)
+                    size += len(text)
+                sent += 1
+            metrics.FRAMES_SENT.labels('direct').inc(sent)
+            metrics.FRAME_BYTES_SENT.labels('direct').inc(size)
+            return
+        
+        await self.group_send_frame(game_room, seq, tick, fields, keyframe)
+
+    def snapshot_fields(self, game_state, keyframe):
+        """前回送信してから変化した項目を返す (キーフレームなら全項目)"""
+        fields = {}
+        ball_key = game_state.ball.key()
+        if keyframe or ball_key != game_state.sent_ball:
+            fields['ball'] = game_state.ball.to_dict()
+            game_state.sent_ball = ball_key
+        
+        paddle1, paddle2 = game_state.paddle1, game_state.paddle2
+        paddles_key = (paddle1.x, paddle2.x)
+        if keyframe or paddles_key != game_state.sent_paddles:
+            fields['paddles'] = game_state.paddles()
+            game_state.sent_paddles = paddles_key
+        acks_key = (paddle1.seq, paddle2.seq)
+        if keyframe or acks_key != game_state.sent_acks:
+            fields['acks'] = game_state.acks()
+            game_state.sent_acks = acks_key
+        
+        # スコアはゴールで変わったときだけ送る
+        if keyframe or game_state.score_changed:
+            fields['score'] = game_state.score()
+            game_state.score_changed = False
+        return fields
+
+    async def send_keyframe(self, game_room, channel, binary):
+        """1つの接続だけに現在のゲーム状態のキーフレームを送る (参加時や再同期の要求時)"""
+        game_state = self.game_states.get(game_room)
+        if game_state is None:
+            return
+        
+        fields = self.keyframe_fields(game_state)
+        seq, tick = game_state.frame_seq, game_state.tick
+        if binary:
+            frame = {'type': 'game_frame', 'bytes': encode_state_frame(seq, tick, fields, keyframe=True), 'keyframe': True}
+        else:
+            frame = {'type': 'game_frame', 'text': encode_state_text(seq, tick, fields, keyframe=True), 'keyframe': True}
+        await self.send_to_channel(game_room, channel, frame)
+
+    def keyframe_fields(self, game_state):
+        """キーフレームに含める全項目"""
+        return {
+            'ball': game_state.ball.to_dict(),
+            'score': game_state.score(),
+            'paddles': game_state.paddles(),
+            'acks': game_state.acks(),
+        }
+
+    async def send_spectator_frame(self, game_room):
+        """観戦者全員に現在のゲーム状態を送る (毎回キーフレーム、グループ全体で1回だけエンコード)"""
+        game_state = self.game_states[game_room]
+        fields = self.keyframe_fields(game_state)
+        await self.group_send_frame(spectator_group(game_room), game_state.frame_seq, game_state.tick, fields, keyframe=True)
+
+    async def group_send_frame(self, group, seq, tick, fields, keyframe):
+        """ゲーム状態を両方の形式で1回だけエンコードしてグループに送る"""
+        text = encode_state_text(seq, tick, fields, keyframe)
+        data = encode_state_frame(seq, tick, fields, keyframe)
+        await self.group_send(group, {'type': 'game_frame', 'text': text, 'bytes': data, 'keyframe': keyframe})
+        metrics.FRAMES_SENT.labels('group').inc()
+        metrics.FRAME_BYTES_SENT.labels('group').inc(len(text) + len(data))
+
+    async def group_send(self, group, event):
+        """channel layer の group_send (かかった時間を記録する)"""
+        with metrics.GROUP_SEND_LATENCY.time():
+            await self.channel_layer.group_send(group, event)
+
+    def spectator_interval(self):
+        """観戦者に何ティックごとに送るか"""
+        return max(1, round(get_scheduler().rate / self.spectator_rate))
+
+    async def broadcast(self, game_room, event):
+        """プレイヤーと観戦者の両方にイベントを送る"""
+        await self.group_send(game_room, event)
+        game_state = self.game_states.get(game_room)
+        if game_state is not None and game_state.spectators:
+            await self.group_send(spectator_group(game_room), event)
+
+    async def send_to_players(self, game_room, event, players=None, exclude=(), spectators=False):
+        """ルームのプレイヤーの一部だけにイベントを送る (ルームを担当するワーカーで実行)
+
+        players (player_number の集合、None なら全員) のうち exclude 以外の接続に1つずつ送る。
+        spectators が True なら観戦者にも送る。
+        """
+        for channel, player_number in list(self.game_players.get(game_room, {}).items()):
+            if player_number in exclude or (players is not None and player_number not in players):
+                continue
+            await self.send_to_channel(game_room, channel, event)
+        if spectators:
+            game_state = self.game_states.get(game_room)
+            if game_state is not None and game_state.spectators:
+                await self.group_send(spectator_group(game_room), event)
+
+    async def room_spectate(self, event):
+        """観戦者をルームの観戦グループに加える (ルームを担当するワーカーで実行)"""
+        game_room = event['game_room']
+        channel = event['channel']
+        game_state = self.game_states.get(game_room)
+        if game_state is None or game_state.ended:
+            reason = 'not_found'
+        elif game_state.spectators and len(game_state.spectators) >= self.spectator_limit:
+            reason = 'full'
+        else:
+            reason = None
+        if reason is not None:
+            await self.send_to_channel(game_room, channel, {
                 'type': 'game_message',
-                'event': 'game_state_update',
-                'ball': game_state['ball'],
-                'score': game_state['score']
-            }
-        )
+                'event': 'spectate_rejected',
+                'reason': reason
+            })
+            return
+        
+        if game_state.spectators is None:
+            game_state.spectators = set()
+        game_state.spectators.add(channel)
+        await self.channel_layer.group_add(spectator_group(game_room), channel)
+        logger.info('Spectator joined (%s watching)', len(game_state.spectators), extra={'room': game_room})
+        
+        # 次の送信を待たずに現在の状態を送る
+        await self.send_keyframe(game_room, channel, event['binary'])
+        await self.send_spectator_count(game_room)
+
+    async def room_unspectate(self, event):
+        """観戦者を観戦グループから外す (ルームを担当するワーカーで実行)"""
+        game_room = event['game_room']
+        await self.channel_layer.group_discard(spectator_group(game_room), event['channel'])
+        game_state = self.game_states.get(game_room)
+        if game_state is None or not game_state.spectators or event['channel'] not in game_state.spectators:
+            return
+        game_state.spectators.discard(event['channel'])
+        await self.send_spectator_count(game_room)
+
+    async def send_spectator_count(self, game_room):
+        """現在の観戦者数をプレイヤーと観戦者に知らせる"""
+        game_state = self.game_states[game_room]
+        await self.broadcast(game_room, {
+            'type': 'game_message',
+            'event': 'spectator_count',
+            'spectators': len(game_state.spectators or ())
+        })
+
+    async def send_to_channel(self, game_room, channel, event):
+        """1つの接続だけにイベントを送る (接続が別のワーカーにあれば channel layer 経由)"""
+        connection = self.game_connections.get(game_room, {}).get(channel)
+        if connection is not None:
+            await getattr(connection, event['type'])(event)
+        else:
+            await self.channel_layer.send(channel, event)
+
+    def is_local_fanout(self, game_room):
+        """ルームの全メンバーがこのプロセスの接続かどうか"""
+        # InMemoryChannelLayer ではグループのメンバーは必ず同じプロセスにいる
+        return isinstance(self.channel_layer, InMemoryChannelLayer) and game_room in self.game_connections
+
+    async def game_frame(self, event):
+        # エンコード済みのフレームをそのまま送信キューに入れる
+        if self.binary:
+            self.outbound.put_frame(data=event['bytes'], keyframe=event.get('keyframe', False))
+        else:
+            self.outbound.put_frame(text=event['text'], keyframe=event.get('keyframe', False))
 
     async def game_message(self, event):
         # イベントをクライアントに送信
-        message = {
-            'type': 'game_message',
-            'event': event.get('event'),
-            'player_number': event.get('player_number'),
-            'position': event.get('position'),
-            'score': event.get('score'),
-            'winner': event.get('winner'),
-            'ball': event.get('ball'),
-            'reason': event.get('reason')
-        }
-        
-        # 必要な項目だけ含めるようにフィルタリング
-        filtered_message = {k: v for k, v in message.items() if v is not None}
+        filtered_message = build_game_message(event)
         
-        # 重要なメッセージのみログに出力（ゲーム状態更新とパドル移動は出力しない）
+        # 重要なメッセージのみログに出力（ゲーム状態更新は出力しない）
         event_type = event.get('event')
-        if event_type and event_type not in ['game_state_update', 'paddle_move']:
-            print(f"📤 Sending to client: {filtered_message}")
+        if event_type and event_type not in ('game_state_update', 'session'):  # 再接続用のトークンはログに残さない
+            logger.debug('Sending %s', event_type, extra={'room': self.game_room})
+        
+        # イベントは受信が遅れていても捨てずに送る
+        self.outbound.put_event(json.dumps(filtered_message))
         
-        # メッセージを送信
-        await self.send(text_data=json.dumps(filtered_message)) 
\ No newline at end of file
+        if event_type == 'join_rejected':
+            # ルームに参加していないので、切断してもルームの状態には触れない
+            connections = self.game_connections.get(self.game_room)
+            if connections is not None:
+                connections.pop(self.channel_name, None)
+                if not connections:
+                    del self.game_connections[self.game_room]
+            await self.channel_layer.group_discard(self.game_room, self.channel_name)
+            self.game_room = self.player_number = None
+            await self.close()
@@ -1,16 +1,24 @@
+import asyncio
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from ..engine.rating import DEFAULT_RATING, RatingQueue
 from ..models import Game, GamePlayers
-import uuid
+from ..utils import metrics
 from django.utils import timezone
 
+logger = logging.getLogger('pong.matchmaking')
+
 User = get_user_model()
 
 class MatchmakingConsumer(AsyncWebsocketConsumer):
-    waiting_players = {}  # 待機中のプレイヤーを保持するクラス変数
+    waiting_players = RatingQueue()  # 待機中のプレイヤーをレーティング順に保持するクラス変数
+    widen_task = None  # 待ち時間に応じて相手を探し直すタスク (待っているプレイヤーがいる間だけ動く)
+    ticket = None  # この接続が待機リストに並んでいる番号
     
     async def connect(self):
         """WebSocket接続が確立されたときの処理"""
@@ -19,10 +27,12 @@ class MatchmakingConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """WebSocket接続が切断されたときの処理"""
         # プレイヤーが待機リストにいる場合は削除
-        for player_id, data in list(self.waiting_players.items()):
-            if data.get('channel_name') == self.channel_name:
-                del self.waiting_players[player_id]
-                break
+        self.leave_queue()
+    
+    def leave_queue(self):
+        if self.ticket is not None:
+            self.waiting_players.remove(self.ticket)
+            self.ticket = None
     
     async def receive(self, text_data):
         """WebSocketからメッセージを受信したときの処理"""
@@ -58,8 +68,7 @@ class MatchmakingConsumer(AsyncWebsocketConsumer):
             user_id=player2_data.get('user_id')  # ユーザーIDを追加
         )
         
-        print(f"Created player 1: {player1.nickname} (user_id: {player1_data.get('user_id')})")
-        print(f"Created player 2: {player2.nickname} (user_id: {player2_data.get('user_id')})")
+        logger.debug('Created players for game %s (user_id: %s, %s)', game.id, player1.user_id, player2.user_id)
         
         return {
             'game_id': str(game.id),
@@ -68,75 +77,99 @@ class MatchmakingConsumer(AsyncWebsocketConsumer):
         }
     
     async def handle_match_request(self, data):
-        """マッチングリクエストを処理"""
-        player_id = str(uuid.uuid4())
+        """マッチングリクエストを処理 (レーティングの近い相手が待っていれば対戦させる)"""
+        user = self.scope['user']
+        # 同じ接続から続けてリクエストされたら並び直す
+        self.leave_queue()
         
         # ユーザーIDをデータに含める
-        self.waiting_players[player_id] = {
+        player_data = {
             'channel_name': self.channel_name,
             'username': data.get('username', 'Unknown Player'),
             'avatar': data.get('avatar', None),
-            'user_id': self.scope['user'].id if self.scope['user'].is_authenticated else None  # ユーザーIDを追加
+            'user_id': user.id if user.is_authenticated else None,  # ユーザーIDを追加
+            'queued_at': time.monotonic()  # 待ち時間の計測用
         }
+        rating = getattr(user, 'rating', DEFAULT_RATING) if user.is_authenticated else DEFAULT_RATING
         
-        if len(self.waiting_players) >= 2:
-            players = list(self.waiting_players.items())[:2]
-            player1_id, player1_data = players[0]
-            player2_id, player2_data = players[1]
-            
-            # 待機リストから削除
-            del self.waiting_players[player1_id]
-            del self.waiting_players[player2_id]
-            
-            # ゲームとプレイヤーデータを作成
-            game_data = await self.create_game_and_players(player1_data, player2_data)
-            game_room_id = f"game_{game_data['game_id']}"
-            
-            print(f"Created game: {game_data}")
-            
-            # プレイヤー1に通知
-            await self.channel_layer.send(
-                player1_data['channel_name'],
-                {
-                    'type': 'match_found',
-                    'game_id': game_data['game_id'],
-                    'game_room': game_room_id,
-                    'player_number': 1,
-                    'opponent': {
-                        'username': player2_data['username'],
-                        'avatar': player2_data['avatar']
-                    }
-                }
-            )
-            
-            # プレイヤー2に通知
-            await self.channel_layer.send(
-                player2_data['channel_name'],
-                {
-                    'type': 'match_found',
-                    'game_id': game_data['game_id'],
-                    'game_room': game_room_id,
-                    'player_number': 2,
-                    'opponent': {
-                        'username': player1_data['username'],
-                        'avatar': player1_data['avatar']
-                    }
-                }
-            )
+        opponent_data, self.ticket = self.waiting_players.match(rating, player_data, player_data['queued_at'])
+        if opponent_data is not None:
+            # 先に待っていた方をプレイヤー1にする
+            await self.start_match(opponent_data, player_data)
         else:
+            self.ensure_widening()
             # マッチング待ちを通知
             await self.send(json.dumps({
                 'type': 'match_status',
                 'message': 'Waiting for opponent...'
             }))
     
+    def ensure_widening(self):
+        cls = type(self)
+        task = cls.widen_task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return
+        cls.widen_task = asyncio.get_running_loop().create_task(self.widen_loop())
+    
+    async def widen_loop(self):
+        """待ち時間が延びて許容するレーティングの差が広がったプレイヤーの相手を探し直す"""
+        while True:
+            due = self.waiting_players.next_widen()
+            if due is None:
+                return
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            for player1_data, player2_data in self.waiting_players.widen(time.monotonic()):
+                try:
+                    await self.start_match(player1_data, player2_data)
+                except Exception:
+                    logger.exception('Error starting match')
+    
+    async def start_match(self, player1_data, player2_data):
+        """マッチした2人のゲームを作成して、それぞれに通知する"""
+        now = time.monotonic()
+        metrics.MATCHMAKING_WAIT.observe(now - player1_data['queued_at'])
+        metrics.MATCHMAKING_WAIT.observe(now - player2_data['queued_at'])
+        
+        # ゲームとプレイヤーデータを作成
+        game_data = await self.create_game_and_players(player1_data, player2_data)
+        game_room_id = f"game_{game_data['game_id']}"
+        
+        logger.info('Created game %s', game_data['game_id'])
+        
+        # プレイヤー1に通知
+        await self.channel_layer.send(
+            player1_data['channel_name'],
+            {
+                'type': 'match_found',
+                'game_id': game_data['game_id'],
+                'game_room': game_room_id,
+                'player_number': 1,
+                'opponent': {
+                    'username': player2_data['username'],
+                    'avatar': player2_data['avatar']
+                }
+            }
+        )
+        
+        # プレイヤー2に通知
+        await self.channel_layer.send(
+            player2_data['channel_name'],
+            {
+                'type': 'match_found',
+                'game_id': game_data['game_id'],
+                'game_room': game_room_id,
+                'player_number': 2,
+                'opponent': {
+                    'username': player1_data['username'],
+                    'avatar': player1_data['avatar']
+                }
+            }
+        )
+    
     async def handle_cancel_matching(self):
         """マッチングのキャンセル処理"""
         # このユーザーを待機リストから削除
-        for player_id, data in list(self.waiting_players.items()):
-            if data.get('channel_name') == self.channel_name:
-                del self.waiting_players[player_id]
-                break
+        self.leave_queue()
         
         # キャンセルを確認
         await self.send(json.dumps({
@@ -146,6 +179,8 @@ class MatchmakingConsumer(AsyncWebsocketConsumer):
     
     async def match_found(self, event):
         """マッチングが見つかったときの処理"""
+        # 相手の接続で対戦が決まった場合は、既に待機リストから外れている
+        self.ticket = None
         # クライアントにマッチング結果を送信
         await self.send(json.dumps({
             'type': 'match_found',
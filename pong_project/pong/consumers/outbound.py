@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from django.conf import settings
+from pong.utils import metrics
+
+logger = logging.getLogger('pong.game')
+
+# キューに入れるメッセージの種類
+FRAME = 0     # ゲーム状態の差分 (遅れているときは新しいものだけ送ればよい)
+KEYFRAME = 1  # キーフレーム (次のキーフレームが来るまでは捨てない)
+EVENT = 2     # game_end などのイベント (捨てない)
+CLOSE = 3
+
+SLOW_CLIENT_CLOSE_CODE = 4008  # 受信が遅れ続けたクライアントを切断するときのコード
+
+
+class OutboundQueue:
+    """WebSocket 接続1つ分の送信キュー
+
+    ゲームループや channel layer のハンドラはキューに入れるだけで送信を待たず、
+    この接続のタスクが順番に送る。クライアントの受信が遅れてキューが limit 件に達したら、
+    送れていないゲーム状態の差分を捨てて最新のものだけを残す (クライアントは欠落を検出して
+    キーフレームを要求する)。イベントは捨てない。
+    max_lag 秒より前に入れたメッセージがまだ送れていなければ、遅れ続けているとみなして切断する。
+    """
+
+    def __init__(self, send, close, limit=None, max_lag=None):
+        self.send = send    # AsyncWebsocketConsumer.send
+        self.close = close  # AsyncWebsocketConsumer.close
+        self.limit = limit or getattr(settings, 'PONG_OUTBOUND_LIMIT', 8)
+        self.max_lag = max_lag or getattr(settings, 'PONG_SLOW_CLIENT_TIMEOUT', 5.0)
+        self.items = deque()  # (種類, テキスト, バイト列, キューに入れた時刻)
+        self.ready = asyncio.Event()
+        self.dropped = 0      # 捨てたゲーム状態の数
+        self.lag = 0.0        # 最後に送ったメッセージがキューで待った秒数
+        self.closed = False
+        self.task = None        # 送信タスク
+        self.close_task = None  # 遅れ続けたクライアントを切断するタスク (stop() では止めない)
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        self.closed = True
+        self.items.clear()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def put_frame(self, text=None, data=None, keyframe=False):
+        """ゲーム状態を入れる (text か data のどちらか)"""
+        if self.closed:
+            return
+        now = time.monotonic()
+        if len(self.items) >= self.limit:
+            if now - self.items[0][3] > self.max_lag:
+                self.disconnect_slow()
+                return
+            self.drop_frames(keyframe)
+        self.items.append((KEYFRAME if keyframe else FRAME, text, data, now))
+        self.ready.set()
+
+    def put_event(self, text):
+        """捨ててはいけないメッセージを入れる"""
+        if self.closed:
+            return
+        self.items.append((EVENT, text, None, time.monotonic()))
+        self.ready.set()
+
+    def put_close(self, code=None):
+        """キューに入っているメッセージを送ってから閉じる"""
+        if self.closed:
+            return
+        self.items.append((CLOSE, code, None, time.monotonic()))
+        self.ready.set()
+
+    def drop_frames(self, keyframe):
+        """送れていないゲーム状態の差分を捨てる (新しいものがキーフレームなら古いキーフレームも捨てる)"""
+        kept = deque(item for item in self.items if item[0] >= EVENT or (item[0] == KEYFRAME and not keyframe))
+        dropped = len(self.items) - len(kept)
+        self.items = kept
+        self.dropped += dropped
+        metrics.FRAMES_DROPPED.inc(dropped)
+
+    def disconnect_slow(self):
+        """遅れ続けているクライアントを、残りのメッセージを送らずに切断する"""
+        logger.warning('Disconnecting slow client (%s messages queued, %s frames dropped)', len(self.items), self.dropped)
+        metrics.SLOW_CLIENT_DISCONNECTS.inc()
+        task = self.task
+        self.stop()
+        if task is not None:
+            # 送信中で止まっているかもしれないので、送信タスクとは別に閉じる
+            self.close_task = asyncio.get_running_loop().create_task(self.close(SLOW_CLIENT_CLOSE_CODE))
+
+    async def run(self):
+        while True:
+            if not self.items:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            kind, text, data, queued_at = self.items.popleft()
+            self.lag = time.monotonic() - queued_at
+            metrics.OUTBOUND_LAG.observe(self.lag)
+            try:
+                if kind == CLOSE:
+                    self.closed = True
+                    await self.close(text)
+                    return
+                if data is not None:
+                    await self.send(bytes_data=data)
+                else:
+                    await self.send(text_data=text)
+            except Exception as e:
+                logger.warning('Error sending to client: %s', e)
+                self.closed = True
+                return
@@ -0,0 +1,100 @@
+import json
+import struct
+
+# クライアントに送る game_message に含める項目 (値が None のものは送らない)
+MESSAGE_FIELDS = (
+    'event', 'seq', 'tick', 'keyframe', 'player_number', 'position',
+    'score', 'winner', 'ball', 'paddles', 'acks', 'reason', 'resume_token', 'grace', 'spectators', 'seconds',
+)
+
+
+def build_game_message(event):
+    """channel layer のイベントからクライアントに送るメッセージを作る"""
+    message = {'type': 'game_message'}
+    for field in MESSAGE_FIELDS:
+        value = event.get(field)
+        if value is not None:
+            message[field] = value
+    return message
+
+
+def encode_game_message(event):
+    """クライアントに送るメッセージを JSON 文字列にする"""
+    return json.dumps(build_game_message(event))
+
+
+# バイナリ形式 (WebSocket サブプロトコルで選択。選ばれなければ JSON を使う)
+BINARY_SUBPROTOCOL = 'pong-binary.v1'
+
+POSITION_SCALE = 100  # 座標・速度は 0.01 単位の int16 に量子化する
+
+FRAME_STATE = 0x01        # サーバー → クライアント: ゲーム状態
+FRAME_PADDLE_MOVE = 0x10  # クライアント → サーバー: 自分のパドル位置
+
+# ゲーム状態フレームは「ヘッダ + マスクで示した項目」だけを送る (差分圧縮)
+FIELD_BALL = 0x01
+FIELD_SCORE = 0x02
+FIELD_PADDLES = 0x04
+FIELD_ACKS = 0x08
+FLAG_KEYFRAME = 0x80  # 全項目を含むキーフレーム
+
+# type, seq, tick, mask
+STATE_HEADER = struct.Struct('<BIIB')
+# ball.x, ball.y, ball.z, velocity.x, velocity.z
+BALL_SECTION = struct.Struct('<hhhhh')
+# score.player1, score.player2
+SCORE_SECTION = struct.Struct('<BB')
+# paddles.player1, paddles.player2
+PADDLES_SECTION = struct.Struct('<hh')
+# acks.player1, acks.player2 (各プレイヤーの処理済み入力番号)
+ACKS_SECTION = struct.Struct('<II')
+# type, seq, position
+PADDLE_MOVE_FRAME = struct.Struct('<BIh')
+
+
+def quantize(value):
+    """座標を int16 に量子化する"""
+    return max(-32768, min(32767, round(value * POSITION_SCALE)))
+
+
+def encode_state_frame(seq, tick, fields, keyframe=False):
+    """ゲーム状態 (変化した項目のみ) をバイナリフレームにする"""
+    mask = FLAG_KEYFRAME if keyframe else 0
+    sections = []
+    ball = fields.get('ball')
+    if ball is not None:
+        mask |= FIELD_BALL
+        velocity = ball['velocity']
+        sections.append(BALL_SECTION.pack(
+            quantize(ball['x']),
+            quantize(ball['y']),
+            quantize(ball['z']),
+            quantize(velocity['x']),
+            quantize(velocity['z']),
+        ))
+    score = fields.get('score')
+    if score is not None:
+        mask |= FIELD_SCORE
+        sections.append(SCORE_SECTION.pack(min(score['player1'], 255), min(score['player2'], 255)))
+    paddles = fields.get('paddles')
+    if paddles is not None:
+        mask |= FIELD_PADDLES
+        sections.append(PADDLES_SECTION.pack(quantize(paddles['player1']), quantize(paddles['player2'])))
+    acks = fields.get('acks')
+    if acks is not None:
+        mask |= FIELD_ACKS
+        sections.append(ACKS_SECTION.pack(acks['player1'] & 0xFFFFFFFF, acks['player2'] & 0xFFFFFFFF))
+    return STATE_HEADER.pack(FRAME_STATE, seq & 0xFFFFFFFF, tick & 0xFFFFFFFF, mask) + b''.join(sections)
+
+
+def encode_state_text(seq, tick, fields, keyframe=False):
+    """ゲーム状態 (変化した項目のみ) を JSON 形式のメッセージにする"""
+    return encode_game_message(dict(fields, event='game_state_update', seq=seq, tick=tick, keyframe=keyframe or None))
+
+
+def decode_client_frame(data):
+    """クライアントからのバイナリフレームを JSON と同じ形式の辞書にする"""
+    if len(data) == PADDLE_MOVE_FRAME.size and data[0] == FRAME_PADDLE_MOVE:
+        _, seq, position = PADDLE_MOVE_FRAME.unpack(data)
+        return {'type': 'paddle_move', 'seq': seq, 'position': position / POSITION_SCALE}
+    raise ValueError(f"Unknown binary frame: {data[:1].hex()} ({len(data)} bytes)")
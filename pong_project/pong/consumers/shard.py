@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import sys
+from channels.layers import get_channel_layer
+from pong.engine.sharding import local_shard, shard_channel, shard_count
+
+logger = logging.getLogger('pong.shard')
+
+
+class ShardListener:
+    """他のワーカーから転送されたルームへの操作を受信し、このワーカーのルームに反映する
+
+    接続を受け付けたワーカーとルームの状態を持つワーカーが違う場合、
+    参加・入力・切断などは shard_channel() に送られてくる。
+    """
+
+    def __init__(self, index, channel_layer=None):
+        from .game import GameConsumer
+
+        self.index = index
+        self.channel = shard_channel(index)
+        # 接続を持たないインスタンスで、ルームを担当する側の処理 (room_* メソッド) だけを使う
+        self.owner = GameConsumer()
+        self.owner.channel_layer = channel_layer or get_channel_layer()
+        self._task = None
+        self.joins = set()  # 処理中の参加のタスク (終わるまで参照を持つ)
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            if self._task.get_loop() is asyncio.get_running_loop():
+                return self
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self.joins):
+            task.cancel()
+
+    async def _run(self):
+        logger.info('Shard %s listening on %s', self.index, self.channel)
+        while True:
+            message = await self.owner.channel_layer.receive(self.channel)
+            handler = getattr(self.owner, message['type'].replace('.', '_'), None)
+            if handler is None or not message['type'].startswith('room.'):
+                logger.warning('Unknown shard message: %s', message['type'])
+                continue
+            if message['type'] == 'room.join':
+                # 参加はゲーム開始まで待つことがあるので、受信を止めないよう別タスクで処理する
+                task = asyncio.get_running_loop().create_task(self.handle(handler, message))
+                self.joins.add(task)
+                task.add_done_callback(self.join_done)
+            else:
+                await self.handle(handler, message)
+
+    async def handle(self, handler, message):
+        try:
+            await handler(message)
+        except Exception:
+            logger.exception('Error handling %s on shard %s', message['type'], self.index)
+
+    def join_done(self, task):
+        """参加のタスクが終わったら参照を外し、失敗していればログに残す"""
+        self.joins.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Error in join task on shard %s', self.index, exc_info=task.exception())
+
+
+_listener = None
+
+
+def get_shard_listener():
+    """このプロセスが担当するシャードの受信を開始する"""
+    global _listener
+    if _listener is None:
+        _listener = ShardListener(local_shard())
+    return _listener.start()
+
+
+def start_with_server():
+    """ワーカーの起動時にシャードの受信を始める (asgi.py から呼ぶ)
+
+    接続を1つも受け付けていないワーカーにも、他のワーカーから担当のルームへの参加が転送されてくるので、
+    最初の接続を待たずに受信を始める。daphne は ASGI の lifespan を送らないため、
+    イベントループ (twisted の reactor) が動き始めたときに開始する。
+    """
+    if shard_count() <= 1:
+        return
+    # daphne なら起動前に reactor がインストールされている (ここで import して別の reactor を入れない)
+    reactor = sys.modules.get('twisted.internet.reactor')
+    if reactor is not None:
+        reactor.callLater(0, get_shard_listener)
+
+
+async def lifespan(scope, receive, send):
+    """lifespan を送るサーバー (uvicorn など) では起動時に受信を始め、終了時に止める"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if shard_count() > 1:
+                get_shard_listener()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _listener is not None:
+                _listener.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
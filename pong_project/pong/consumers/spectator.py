@@ -0,0 +1,47 @@
+from pong.engine.sharding import shard_count
+from .game import GameConsumer
+from .protocol import BINARY_SUBPROTOCOL
+from .shard import get_shard_listener
+
+
+class SpectatorConsumer(GameConsumer):
+    """ゲームを観戦するだけの接続 (読み取り専用)
+
+    プレイヤーとは別の観戦グループに入り、低い頻度のキーフレームだけを受け取る。
+    クライアントからのメッセージはすべて無視する。
+    """
+
+    async def connect(self):
+        self.game_room = f"game_{self.scope['url_route']['kwargs']['game_id']}"
+        self.player_number = None
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        self.start_outbound()
+        if shard_count() > 1:
+            get_shard_listener()
+
+        await self.route_to_room({
+            'type': 'room.spectate',
+            'game_room': self.game_room,
+            'channel': self.channel_name,
+            'binary': self.binary,
+        })
+
+    async def disconnect(self, close_code):
+        outbound = getattr(self, 'outbound', None)
+        if outbound is not None:
+            outbound.stop()
+        await self.route_to_room({
+            'type': 'room.unspectate',
+            'game_room': self.game_room,
+            'channel': self.channel_name,
+        })
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # 観戦者はゲームを操作できない
+        pass
+
+    async def game_message(self, event):
+        await super().game_message(event)
+        if event.get('event') == 'spectate_rejected':
+            await self.close()
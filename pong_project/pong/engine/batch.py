@@ -0,0 +1,205 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .physics import (
+    WALL_X, PADDLE_Z, GOAL_Z, PADDLE_HALF_WIDTH, PADDLE_DEFLECTION, SPIN_JITTER,
+    MAX_FRAME_TIME,
+)
+from .state import PLAYING
+
+try:
+    import numpy as np
+except ImportError:  # numpy はバッチエンジンを使う場合のみ必要
+    np = None
+
+
+def fold_wall_array(x, vx):
+    """fold_wall の配列版 (スカラー版と同じ演算順にして結果を一致させる)"""
+    span = 2 * WALL_X
+    u = (x + WALL_X) % (2 * span)
+    reflected = u > span
+    return (
+        np.where(reflected, span - (u - span) - WALL_X, u - WALL_X),
+        np.where(reflected, -vx, vx),
+    )
+
+
+class BatchPhysics:
+    """全ルームのボールとパドルを配列 (structure-of-arrays) で持つ物理エンジン
+
+    ティックごとに1回 tick() を呼ぶと、動いている全ルームの移動・壁の反射・
+    パドルでの跳ね返し・ゴール判定をまとめて計算する。ルームごとの
+    PhysicsEngine は乱数 (サーブとパドルでのランダム性) のためだけに使うので、
+    同じシードならスカラー版と同じ展開になる。
+    """
+
+    # dt はルームごとのシミュレーションの刻み幅 (ルームごとに step_rate を変えられる)
+    # steps は進めたステップ数 (リプレイの入力の記録に使う)
+    FIELDS = ('x', 'z', 'vx', 'vz', 'paddle1', 'paddle2', 'accumulator', 'dt', 'steps')
+
+    def __init__(self, capacity=256):
+        if np is None:
+            raise ImproperlyConfigured('PONG_PHYSICS_BACKEND = "numpy" requires numpy to be installed')
+        self.capacity = 0
+        self.active = np.zeros(0, dtype=bool)
+        for name in self.FIELDS:
+            setattr(self, name, np.zeros(0))
+        self.slots = {}     # {game_room: index}
+        self.engines = []   # index -> PhysicsEngine (乱数用)
+        self.keys = []      # index -> game_room
+        self.free = []
+        self.goals = {}     # {game_room: [得点したプレイヤー番号]} 次の exchange で返す
+        self.last_tick = None
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        for name in self.FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra)]))
+        self.engines.extend([None] * extra)
+        self.keys.extend([None] * extra)
+        self.free.extend(range(self.capacity + extra - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def add(self, key, engine):
+        """ルームを登録する"""
+        if key in self.slots:
+            return self.slots[key]
+        if not self.free:
+            self._grow(self.capacity * 2)
+        index = self.free.pop()
+        self.slots[key] = index
+        self.engines[index] = engine
+        self.keys[index] = key
+        self.active[index] = False
+        self.dt[index] = engine.dt
+        self.steps[index] = engine.steps
+        return index
+
+    def remove(self, key):
+        """ルームの登録を解除する"""
+        index = self.slots.pop(key, None)
+        if index is None:
+            return
+        self.active[index] = False
+        self.engines[index] = None
+        self.keys[index] = None
+        self.goals.pop(key, None)
+        self.free.append(index)
+
+    def exchange(self, key, state):
+        """ゲーム状態 (RoomState) と配列を同期し、前回の tick() 以降に得点したプレイヤー番号を返す"""
+        index = self.slots[key]
+        ball = state.ball
+        running = state.phase == PLAYING and not state.paused
+
+        if not running:
+            self.active[index] = False
+            self.goals.pop(key, None)
+            return []
+
+        self.paddle1[index] = state.paddle1.x
+        self.paddle2[index] = state.paddle2.x
+        engine = self.engines[index]
+        engine.steps = int(self.steps[index])
+        if engine.log is not None:
+            # パドル位置は次の tick() のステップから使われる
+            engine.log.record(engine.steps, state)
+
+        scorers = self.goals.pop(key, None)
+        if not scorers and not self.active[index]:
+            # 開始・再開時はゲーム状態のボールを配列に読み込む
+            self.x[index] = ball.x
+            self.z[index] = ball.z
+            self.vx[index] = ball.vx
+            self.vz[index] = ball.vz
+            self.accumulator[index] = 0.0
+            self.active[index] = True
+            return []
+
+        ball.x = float(self.x[index])
+        ball.z = float(self.z[index])
+        ball.vx = float(self.vx[index])
+        ball.vz = float(self.vz[index])
+        return scorers or []
+
+    def tick(self, now):
+        """動いている全ルームを経過時間ぶん固定ステップで進める (スケジューラの hook)"""
+        elapsed = 0.0 if self.last_tick is None else min(now - self.last_tick, MAX_FRAME_TIME)
+        self.last_tick = now
+        if not self.slots:
+            return
+
+        self.accumulator[self.active] += elapsed
+        while True:
+            indices = np.nonzero(self.active & (self.accumulator >= self.dt))[0]
+            if not len(indices):
+                break
+            self.accumulator[indices] -= self.dt[indices]
+            self.step(indices)
+
+    def step(self, indices):
+        """指定したルームを1ステップ進める"""
+        dt = self.dt[indices]
+        x0 = self.x[indices]
+        z0 = self.z[indices]
+        vx = self.vx[indices]
+        vz = self.vz[indices]
+        z1 = z0 + vz * dt
+
+        # パドル前面を通過したか (移動の線分で判定)
+        cross1 = (vz > 0) & (z0 <= PADDLE_Z) & (PADDLE_Z < z1)
+        cross2 = (vz < 0) & (z0 >= -PADDLE_Z) & (-PADDLE_Z > z1)
+        crossing = cross1 | cross2
+        plane = np.where(cross1, PADDLE_Z, -PADDLE_Z)
+        t = np.divide(plane - z0, z1 - z0, out=np.zeros_like(z0), where=crossing)
+        hit_x, _ = fold_wall_array(x0 + vx * dt * t, vx)
+        paddle_x = np.where(cross1, self.paddle1[indices], self.paddle2[indices])
+        bounce = crossing & (np.abs(hit_x - paddle_x) <= PADDLE_HALF_WIDTH)
+
+        new_x, new_vx = fold_wall_array(x0 + vx * dt, vx)
+        new_z = z1
+        new_vz = vz.copy()
+
+        bounced = np.nonzero(bounce)[0]
+        if len(bounced):
+            # 跳ね返したルームだけ、そのルームの乱数でランダム性を加える
+            jitter = np.array([self.engines[indices[k]].rng.random() for k in bounced])
+            b_vz = -vz[bounced]
+            b_vx = (hit_x[bounced] - paddle_x[bounced]) * PADDLE_DEFLECTION + (jitter * 2 - 1) * SPIN_JITTER
+            rest = dt[bounced] * (1 - t[bounced])
+            new_x[bounced], new_vx[bounced] = fold_wall_array(hit_x[bounced] + b_vx * rest, b_vx)
+            new_z[bounced] = plane[bounced] + b_vz * rest
+            new_vz[bounced] = b_vz
+
+        self.x[indices] = new_x
+        self.z[indices] = new_z
+        self.vx[indices] = new_vx
+        self.vz[indices] = new_vz
+        self.steps[indices] += 1
+
+        # ゴール判定 (結果をルームごとの得点処理に返す)
+        scored1 = ~bounce & (new_z < -GOAL_Z)
+        scored2 = ~bounce & (new_z > GOAL_Z)
+        scored = scored1 | scored2
+        if scored.any():
+            for k in np.nonzero(scored)[0]:
+                self.goals.setdefault(self.keys[indices[k]], []).append(1 if scored1[k] else 2)
+            # ゴール後はサーブまで止める
+            self.active[indices[scored]] = False
+            self.accumulator[indices[scored]] = 0.0
+
+
+_batch = None
+
+
+def get_batch_physics(scheduler=None):
+    """設定でバッチエンジンが選ばれていればプロセス共通のインスタンスを返す"""
+    global _batch
+    if getattr(settings, 'PONG_PHYSICS_BACKEND', 'python') != 'numpy':
+        return None
+    if _batch is None:
+        _batch = BatchPhysics()
+        if scheduler is not None:
+            scheduler.add_hook(_batch.tick)
+    return _batch
@@ -0,0 +1,60 @@
+import random
+from .physics import PADDLE_Z, fold_wall
+
+# 難易度ごとの (反応の間隔 (秒), 予測位置の誤差の最大値)
+# パドルの半分の幅は 2.5 なので、誤差がそれを超えると打ち返せないことがある
+DIFFICULTIES = {
+    'easy': (0.5, 5.0),
+    'normal': (0.3, 3.0),
+    'hard': (0.12, 1.5),
+}
+DEFAULT_DIFFICULTY = 'normal'
+
+
+def predict_x(ball, plane):
+    """ボールが plane (z 座標) に届いたときの x 座標を返す (壁での反射は折り返しで計算する)"""
+    t = (plane - ball.z) / ball.vz
+    x, _ = fold_wall(ball.x + ball.vx * t, ball.vx)
+    return x
+
+
+class Bot:
+    """サーバー側の対戦相手 (RoomState.bots の値)
+
+    反応の間隔ごとにボールの到達位置を解析的に予測し直し、その位置をパドルの入力にする。
+    予測はボールが向かってくる間だけ行い、ティックごとの処理は時刻の比較だけで済む。
+    """
+
+    __slots__ = ('player_number', 'difficulty', 'reaction', 'error', 'rng', 'plane', 'target', 'offset', 'toward', 'next_think')
+
+    def __init__(self, player_number, difficulty=DEFAULT_DIFFICULTY, seed=None):
+        if difficulty not in DIFFICULTIES:
+            difficulty = DEFAULT_DIFFICULTY
+        self.player_number = player_number
+        self.difficulty = difficulty
+        self.reaction, self.error = DIFFICULTIES[difficulty]
+        self.rng = random.Random(seed)
+        self.plane = PADDLE_Z if player_number == 1 else -PADDLE_Z  # 自分のパドルの前面
+        self.target = 0.0
+        self.offset = 0.0       # 今のラリーでの予測の誤差
+        self.toward = False     # 前回見たときにボールが向かってきていたか
+        self.next_think = 0.0   # 次に予測し直す時刻
+
+    def think(self, state, now):
+        """パドルの目標位置を返す"""
+        if now < self.next_think:
+            return self.target
+        # 反応の間隔は少し揺らして、人のように見せる
+        self.next_think = now + self.reaction * (0.75 + self.rng.random() * 0.5)
+
+        ball = state.ball
+        toward = ball.vz > 0 if self.player_number == 1 else ball.vz < 0
+        if toward != self.toward:
+            self.toward = toward
+            self.offset = (self.rng.random() * 2 - 1) * self.error
+        if toward:
+            self.target = predict_x(ball, self.plane) + self.offset
+        else:
+            # 相手側にボールがある間は中央に戻って待つ
+            self.target = 0.0
+        return self.target
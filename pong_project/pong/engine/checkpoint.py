@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from django.conf import settings
+from .bot import Bot
+from .sharding import local_shard
+from .state import Ball, Paddle, RoomState
+
+logger = logging.getLogger('pong.engine')
+
+# 1回のチェックポイントは「ヘッダ + ルームのレコード + CRC」を追記する
+# magic, 書き込み時刻 (UNIX 時間), ルーム数
+BATCH_HEADER = struct.Struct('<4sdI')
+BATCH_MAGIC = b'PCK2'  # レコードの形式を変えたら変える (古い形式のファイルは読まない)
+# crc32 (ヘッダとレコード全体、途中で書き込みが止まったバッチを読み飛ばすため)
+BATCH_TRAILER = struct.Struct('<I')
+# ball.x, ball.y, ball.z, ball.vx, ball.vz, paddle1.x, paddle2.x, paddle1.seq, paddle2.seq,
+# score1, score2, tick, simulation_rate, snapshot_rate, phase
+ROOM_RECORD = struct.Struct('<7f2I2BI2HB')
+# 続けてルーム名、プレイヤー1・2の再接続トークン、プレイヤー1・2のボットの難易度 (それぞれ長さ1バイト + UTF-8)
+STRING_LENGTH = struct.Struct('<B')
+
+
+def _pack_string(value):
+    data = (value or '').encode()
+    return STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(data, offset):
+    (length,) = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+    return data[offset:offset + length].decode(), offset + length
+
+
+def encode_room(game_room, state):
+    """ルームの状態を再開に必要な項目だけのレコードにする"""
+    ball = state.ball
+    bots = state.bots or {}
+    return ROOM_RECORD.pack(
+        ball.x, ball.y, ball.z, ball.vx, ball.vz,
+        state.paddle1.x, state.paddle2.x,
+        state.paddle1.seq & 0xFFFFFFFF, state.paddle2.seq & 0xFFFFFFFF,
+        min(state.score1, 255), min(state.score2, 255),
+        state.tick & 0xFFFFFFFF, state.simulation_rate, state.snapshot_rate,
+        state.phase,
+    ) + _pack_string(game_room) + _pack_string(state.tokens.get(1)) + _pack_string(state.tokens.get(2)) + b''.join(
+        _pack_string(bot.difficulty if bot is not None else None) for bot in (bots.get(1), bots.get(2))
+    )
+
+
+def decode_room(data, offset, now):
+    """レコードを読み、(ゲームルーム名, RoomState, 次のレコードの位置) を返す"""
+    (x, y, z, vx, vz, paddle1, paddle2, seq1, seq2, score1, score2,
+     tick, simulation_rate, snapshot_rate, phase) = ROOM_RECORD.unpack_from(data, offset)
+    offset += ROOM_RECORD.size
+    game_room, offset = _unpack_string(data, offset)
+    token1, offset = _unpack_string(data, offset)
+    token2, offset = _unpack_string(data, offset)
+    bot1, offset = _unpack_string(data, offset)
+    bot2, offset = _unpack_string(data, offset)
+
+    state = RoomState(
+        Ball(x, y, z, vx, vz),
+        Paddle(x=paddle1, seq=seq1, moved_at=now),
+        Paddle(x=paddle2, seq=seq2, moved_at=now),
+        simulation_rate=simulation_rate,
+        snapshot_rate=snapshot_rate,
+        now=now,
+    )
+    state.score1, state.score2 = score1, score2
+    state.tick = tick
+    state.phase = phase
+    state.tokens = {player: token for player, token in ((1, token1), (2, token2)) if token}
+    if bot1 or bot2:
+        state.bots = {player: Bot(player, difficulty) for player, difficulty in ((1, bot1), (2, bot2)) if difficulty}
+    return game_room, state, offset
+
+
+def encode_batch(rooms, written_at=None):
+    """チェックポイント1回分 (終了していない全ルーム) をバイト列にする"""
+    records = [encode_room(game_room, state) for game_room, state in rooms if not state.ended]
+    body = BATCH_HEADER.pack(BATCH_MAGIC, time.time() if written_at is None else written_at, len(records))
+    body += b''.join(records)
+    return body + BATCH_TRAILER.pack(zlib.crc32(body))
+
+
+def read_last_batch(data, now=0.0):
+    """ファイルの内容から最後の完全なチェックポイントを読み、{ゲームルーム名: RoomState} を返す"""
+    rooms = {}
+    offset = 0
+    while offset + BATCH_HEADER.size <= len(data):
+        start = offset
+        try:
+            magic, _, count = BATCH_HEADER.unpack_from(data, offset)
+            if magic != BATCH_MAGIC:
+                break
+            offset += BATCH_HEADER.size
+            batch = {}
+            for _ in range(count):
+                game_room, state, offset = decode_room(data, offset, now)
+                batch[game_room] = state
+            (crc,) = BATCH_TRAILER.unpack_from(data, offset)
+        except (struct.error, UnicodeDecodeError):
+            break  # 書き込み途中で止まったバッチ
+        if crc != zlib.crc32(data[start:offset]):
+            break
+        offset += BATCH_TRAILER.size
+        rooms = batch
+    return rooms
+
+
+def checkpoint_path():
+    """このワーカーのチェックポイントファイル (設定がなければ None で無効)"""
+    path = getattr(settings, 'PONG_CHECKPOINT_PATH', None)
+    return path.format(shard=local_shard()) if path else None
+
+
+class RoomCheckpointer:
+    """動いているルームの状態を一定間隔でファイルに追記する
+
+    ティックの処理とは別のタスクで動き、エンコードだけをイベントループで行って
+    ファイルへの書き込みはスレッドに任せる。ファイルが大きくなったら最新の1回分だけに書き直す。
+    """
+
+    def __init__(self, rooms, path, interval=None, max_bytes=None):
+        self.rooms = rooms  # {game_room: RoomState} (GameConsumer.game_states)
+        self.path = path
+        self.interval = interval or getattr(settings, 'PONG_CHECKPOINT_INTERVAL', 5.0)
+        self.max_bytes = max_bytes or getattr(settings, 'PONG_CHECKPOINT_MAX_BYTES', 1024 * 1024)
+        self.writes = 0
+        self._task = None
+
+    def ensure_running(self):
+        if self._task is not None and not self._task.done():
+            if self._task.get_loop() is asyncio.get_running_loop():
+                return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                rooms = list(self.rooms.items())
+                data = encode_batch(rooms)
+                await loop.run_in_executor(None, self.write, data)
+                if not rooms:
+                    # 全ルームが終わったことを書き込んだら止める (次のルームで再開する)
+                    break
+        except Exception:
+            logger.exception('Error writing room checkpoint')
+        finally:
+            self._task = None
+
+    def write(self, data):
+        """チェックポイントを追記する (スレッドで実行)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+
+        if size + len(data) > self.max_bytes:
+            # 古いチェックポイントは不要なので、最新の1回分だけのファイルに置き換える
+            tmp_path = f'{self.path}.tmp'
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        else:
+            # 再接続トークンを含むので所有者だけが読めるようにする
+            with open(os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), 'ab') as f:
+                f.write(data)
+        self.writes += 1
+
+
+_checkpointer = None
+_restored = None
+
+
+def get_checkpointer(rooms):
+    """チェックポイントが有効ならプロセス共通のインスタンスを返す"""
+    global _checkpointer
+    path = checkpoint_path()
+    if path is None:
+        return None
+    if _checkpointer is None or _checkpointer.path != path:
+        # 新しいチェックポイントで上書きする前に、前回のプロセスの分を読んでおく
+        load_restored_rooms()
+        _checkpointer = RoomCheckpointer(rooms, path)
+    return _checkpointer
+
+
+def load_restored_rooms():
+    """前回のプロセスが最後に書いたチェックポイントを読む (最初の1回だけ)"""
+    global _restored
+    if _restored is None:
+        path = checkpoint_path()
+        _restored = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                _restored = read_last_batch(f.read(), now=time.monotonic())
+            logger.info('Loaded %s rooms from checkpoint %s', len(_restored), path)
+    return _restored
+
+
+def take_restored_room(game_room):
+    """チェックポイントからルームを取り出す (なければ None、二重に復元しないよう取り出したら消す)"""
+    return load_restored_rooms().pop(game_room, None)
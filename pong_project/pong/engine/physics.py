@@ -0,0 +1,142 @@
+import random
+from .state import Paddle
+
+# テーブルの寸法 (remote-game.js の描画と一致させる)
+WALL_X = 15.0            # 左右の壁の位置 (±)
+PADDLE_Z = 18.0          # パドル前面の位置 (プレイヤー1は +、プレイヤー2は -)
+GOAL_Z = 20.0            # これを超えたらゴール
+PADDLE_HALF_WIDTH = 2.5
+PADDLE_LIMIT = 13.0      # パドルの可動範囲 (±)
+
+# 速度はすべて 1秒あたりの移動量
+SERVE_SPEED_Z = 18.0
+SERVE_SPEED_X = 6.0      # サーブ時の横方向速度の最大値 (±)
+PADDLE_DEFLECTION = 12.0  # パドル中心からのずれ1あたりの横方向速度
+SPIN_JITTER = 3.0        # パドルで跳ね返すときのランダムな横方向速度 (±)
+PADDLE_SPEED = 18.0      # パドルの最大速度
+
+STEP_RATE = 60           # 物理演算の固定ステップ (Hz)
+MAX_FRAME_TIME = 0.25    # 1回の advance で処理する経過時間の上限 (秒)
+
+
+def fold_wall(x, vx):
+    """壁での反射を折り返しで計算し、(位置, 速度) を返す"""
+    span = 2 * WALL_X
+    u = (x + WALL_X) % (2 * span)
+    if u > span:
+        # 奇数回反射した
+        return span - (u - span) - WALL_X, -vx
+    return u - WALL_X, vx
+
+
+def move_paddle(paddle, target, now):
+    """パドルを目標位置へ動かす (可動範囲と最大速度はサーバー側で決める)
+
+    入力の到着間隔は揺らぐので、使わなかった移動量は MAX_FRAME_TIME 分まで持ち越せる。
+    届かなかった分は目標位置として残し、step_paddle で次のティック以降に近づける。
+    """
+    paddle.target = max(-PADDLE_LIMIT, min(PADDLE_LIMIT, target))
+    step_paddle(paddle, now)
+
+
+def step_paddle(paddle, now):
+    """パドルを目標位置へ、前回からの経過時間で動ける分だけ近づける (着いたら目標位置を消す)"""
+    budget = min(paddle.budget + (now - paddle.moved_at) * PADDLE_SPEED, PADDLE_SPEED * MAX_FRAME_TIME)
+    distance = max(-budget, min(budget, paddle.target - paddle.x))
+    paddle.x += distance
+    paddle.budget = budget - abs(distance)
+    paddle.moved_at = now
+    if paddle.x == paddle.target:
+        paddle.target = None
+
+
+def new_paddle(now):
+    """パドルの初期状態"""
+    return Paddle(budget=PADDLE_SPEED * MAX_FRAME_TIME, moved_at=now)
+
+
+class PhysicsEngine:
+    """固定タイムステップ・連続衝突判定のボール物理
+
+    Channels には依存しないので、ヘッドレスでテストやベンチマークができる。
+    ゲーム状態は GameConsumer.game_states と同じ RoomState を受け取る。
+    """
+
+    def __init__(self, seed=None, step_rate=STEP_RATE):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.dt = 1 / step_rate
+        self.accumulator = 0.0
+        self.steps = 0
+        self.log = None  # リプレイ用の入力の記録 (replay.InputLog)
+
+    def advance(self, state, elapsed):
+        """経過時間ぶん固定ステップを進め、得点したプレイヤー番号のリストを返す"""
+        self.accumulator += min(elapsed, MAX_FRAME_TIME)
+        scorers = []
+        while self.accumulator >= self.dt:
+            self.accumulator -= self.dt
+            scorer = self.step(state)
+            if scorer:
+                # ゴール後はサーブまで止まるので残りの時間は捨てる
+                scorers.append(scorer)
+                self.accumulator = 0.0
+                break
+        return scorers
+
+    def step(self, state):
+        """1ステップ進める。ゴールした場合は得点したプレイヤー番号を返す"""
+        if self.log is not None:
+            self.log.record(self.steps, state)
+        self.steps += 1
+        ball = state.ball
+        dt = self.dt
+
+        x0, z0 = ball.x, ball.z
+        vx, vz = ball.vx, ball.vz
+        z1 = z0 + vz * dt
+
+        # パドル前面を通過したか (すり抜け防止のため移動の線分で判定)
+        player = None
+        if vz > 0 and z0 <= PADDLE_Z < z1:
+            player = 1
+        elif vz < 0 and z0 >= -PADDLE_Z > z1:
+            player = 2
+
+        if player is not None:
+            plane = PADDLE_Z if player == 1 else -PADDLE_Z
+            t = (plane - z0) / (z1 - z0)
+            hit_x, _ = fold_wall(x0 + vx * dt * t, vx)
+            paddle_x = state.paddle1.x if player == 1 else state.paddle2.x
+            if abs(hit_x - paddle_x) <= PADDLE_HALF_WIDTH:
+                # 当たった位置に応じて角度を変え、ランダム性を加える
+                vz = -vz
+                vx = (hit_x - paddle_x) * PADDLE_DEFLECTION + (self.rng.random() * 2 - 1) * SPIN_JITTER
+                rest = dt * (1 - t)
+                ball.x, ball.vx = fold_wall(hit_x + vx * rest, vx)
+                ball.z = plane + vz * rest
+                ball.vz = vz
+                return None
+
+        ball.x, ball.vx = fold_wall(x0 + vx * dt, vx)
+        ball.z = z1
+
+        # ゴール判定
+        if z1 > GOAL_Z:
+            return 2
+        if z1 < -GOAL_Z:
+            return 1
+        return None
+
+    def serve(self, state):
+        """ボールを中央に戻して速度を再設定する"""
+        ball = state.ball
+        ball.x = 0.0
+        ball.y = 1.0
+        ball.z = 0.0
+        direction = 1 if self.rng.random() > 0.5 else -1
+        ball.vx = self.rng.random() * 2 * SERVE_SPEED_X - SERVE_SPEED_X
+        ball.vz = direction * SERVE_SPEED_Z
+        self.accumulator = 0.0
@@ -0,0 +1,110 @@
+import itertools
+from bisect import bisect_left, insort
+from collections import deque, namedtuple
+from django.conf import settings
+
+DEFAULT_RATING = 1000  # User.rating の初期値 (ゲストもこのレーティングで待つ)
+ELO_K = 32             # 1ゲームでのレーティングの変化の最大値
+
+
+def elo_update(rating1, rating2, winner):
+    """1ゲームの結果から (プレイヤー1, プレイヤー2) の新しいレーティングを返す"""
+    expected = 1 / (1 + 10 ** ((rating2 - rating1) / 400))
+    delta = round(ELO_K * ((1.0 if winner == 1 else 0.0) - expected))
+    return rating1 + delta, rating2 - delta
+
+
+# 待っているプレイヤー1人分 (data は MatchmakingConsumer が通知に使う辞書)
+Waiting = namedtuple('Waiting', ['ticket', 'rating', 'queued_at', 'data'])
+
+
+class RatingQueue:
+    """レーティング順に並べたマッチング待ちの列
+
+    レーティングの近い相手は二分探索で両隣を見るだけで見つかるので、待っている人数が多くても
+    全員を調べることはない。許容するレーティングの差は待ち時間に応じて段階的に広げ、
+    広げるたびにそのプレイヤーだけ相手を探し直す (widen)。
+    """
+
+    def __init__(self, window=None, growth=None, widen_interval=None, max_window=None):
+        self.window = window or getattr(settings, 'PONG_MATCH_WINDOW', 100)
+        self.growth = growth or getattr(settings, 'PONG_MATCH_WINDOW_GROWTH', 50)
+        self.widen_interval = widen_interval or getattr(settings, 'PONG_MATCH_WIDEN_INTERVAL', 5.0)
+        self.max_window = max_window or getattr(settings, 'PONG_MATCH_MAX_WINDOW', 1000)
+        self.keys = []           # (rating, ticket) を昇順に並べたもの
+        self.entries = {}        # {ticket: Waiting}
+        self.widening = deque()  # (次に差を広げる時刻, ticket) 待ち始めた順 (外れたプレイヤーは後で読み飛ばす)
+        self.tickets = itertools.count(1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def allowed(self, entry, now):
+        """待ち時間に応じた、このプレイヤーが許容するレーティングの差"""
+        steps = int((now - entry.queued_at) // self.widen_interval)
+        return min(self.max_window, self.window + self.growth * steps)
+
+    def nearest(self, rating, ticket):
+        """レーティングが最も近い、待っている他のプレイヤーを返す"""
+        index = bisect_left(self.keys, (rating, ticket))
+        best = None
+        for key in self.keys[max(0, index - 1):index + 2]:
+            if key[1] != ticket and (best is None or abs(key[0] - rating) < abs(best[0] - rating)):
+                best = key
+        return self.entries[best[1]] if best is not None else None
+
+    def find(self, entry, now):
+        """entry と対戦できる相手を探す (どちらかの許容する差に入っていれば対戦させる)"""
+        opponent = self.nearest(entry.rating, entry.ticket)
+        if opponent is None:
+            return None
+        difference = abs(opponent.rating - entry.rating)
+        if difference <= max(self.allowed(entry, now), self.allowed(opponent, now)):
+            return opponent
+        return None
+
+    def match(self, rating, data, now):
+        """相手がいれば列から外して (相手の data, None) を、いなければ並んで (None, ticket) を返す"""
+        entry = Waiting(next(self.tickets), rating, now, data)
+        opponent = self.find(entry, now)
+        if opponent is not None:
+            self.remove(opponent.ticket)
+            return opponent.data, None
+        self.entries[entry.ticket] = entry
+        insort(self.keys, (rating, entry.ticket))
+        if self.window < self.max_window:
+            self.widening.append((now + self.widen_interval, entry.ticket))
+        return None, entry.ticket
+
+    def remove(self, ticket):
+        """列から外す (既に外れていれば何もしない)"""
+        entry = self.entries.pop(ticket, None)
+        if entry is None:
+            return None
+        index = bisect_left(self.keys, (entry.rating, ticket))
+        del self.keys[index]
+        return entry
+
+    def next_widen(self):
+        """次に許容する差を広げる時刻 (広げるプレイヤーがいなければ None)"""
+        while self.widening and self.widening[0][1] not in self.entries:
+            self.widening.popleft()
+        return self.widening[0][0] if self.widening else None
+
+    def widen(self, now):
+        """許容する差が広がったプレイヤーの相手を探し直し、対戦させる (先に待っていた方, 後の方) の data のリストを返す"""
+        pairs = []
+        while self.widening and self.widening[0][0] <= now:
+            due, ticket = self.widening.popleft()
+            entry = self.entries.get(ticket)
+            if entry is None:
+                continue
+            opponent = self.find(entry, now)
+            if opponent is not None:
+                self.remove(ticket)
+                self.remove(opponent.ticket)
+                first, second = sorted((entry, opponent), key=lambda waiting: waiting.queued_at)
+                pairs.append((first.data, second.data))
+            elif self.allowed(entry, now) < self.max_window:
+                self.widening.append((due + self.widen_interval, ticket))
+        return pairs
@@ -0,0 +1,130 @@
+import os
+import struct
+import uuid
+import zlib
+from django.conf import settings
+from .physics import PhysicsEngine
+from .state import PLAYING, Ball, Paddle, RoomState
+
+# リプレイはフレームではなく「シード・設定・パドル入力」だけを記録し、物理演算をやり直して再生する
+# magic, バージョン, シード, simulation_rate, snapshot_rate, 最終スコア (2), 全ステップ数,
+# ボールの初期状態 (x, z, vx, vz)、入力の個数
+LOG_HEADER = struct.Struct('<4sBIHH2BI4dI')
+LOG_MAGIC = b'PRPL'
+LOG_VERSION = 1
+# 続けて入力を zlib で圧縮したもの: 反映されたステップ番号, プレイヤー番号, パドル位置
+# (位置は移動量の制限をかけた後のサーバー側の値をそのまま記録し、再生時も同じ値になるようにする)
+INPUT_RECORD = struct.Struct('<IBd')
+
+
+class InputLog:
+    """1ゲーム分のパドル入力を記録する (PhysicsEngine.log)
+
+    パドル位置は物理演算のステップの前にだけ読まれるので、前回から変わったときだけ
+    「何ステップ目の前にどの位置になったか」を追記する。
+    """
+
+    def __init__(self, seed, simulation_rate, snapshot_rate, ball):
+        self.seed = seed
+        self.simulation_rate = simulation_rate
+        self.snapshot_rate = snapshot_rate
+        self.ball = (ball.x, ball.z, ball.vx, ball.vz)
+        self.inputs = bytearray()
+        self.count = 0
+        self.positions = [None, None]  # 最後に記録したパドル位置
+
+    def record(self, step, state):
+        """ステップの前のパドル位置を記録する (変わっていなければ何もしない)"""
+        for player, x in ((1, state.paddle1.x), (2, state.paddle2.x)):
+            if x != self.positions[player - 1]:
+                self.positions[player - 1] = x
+                self.inputs += INPUT_RECORD.pack(step, player, x)
+                self.count += 1
+
+    def encode(self, score1, score2, steps):
+        """ファイルに書き込む形式にする"""
+        return LOG_HEADER.pack(
+            LOG_MAGIC, LOG_VERSION, self.seed, self.simulation_rate, self.snapshot_rate,
+            min(score1, 255), min(score2, 255), steps, *self.ball, self.count,
+        ) + zlib.compress(bytes(self.inputs))
+
+
+def decode_log(data):
+    """記録を読み、(ヘッダの辞書, [(ステップ番号, プレイヤー番号, パドル位置)]) を返す"""
+    try:
+        (magic, version, seed, simulation_rate, snapshot_rate, score1, score2, steps,
+         x, z, vx, vz, count) = LOG_HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError('Replay log is truncated')
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise ValueError('Not a replay log')
+    try:
+        inputs = list(INPUT_RECORD.iter_unpack(zlib.decompress(data[LOG_HEADER.size:])))
+    except (zlib.error, struct.error):
+        raise ValueError('Replay log is corrupted')
+    if len(inputs) != count:
+        raise ValueError('Replay log is corrupted')
+    header = {
+        'seed': seed,
+        'simulation_rate': simulation_rate,
+        'snapshot_rate': snapshot_rate,
+        'score': {'player1': score1, 'player2': score2},
+        'steps': steps,
+        'ball': (x, z, vx, vz),
+    }
+    return header, inputs
+
+
+def simulate(data, every=1):
+    """記録から物理演算をやり直し、every ステップごとに (ステップ番号, RoomState) を返すジェネレータ
+
+    ゴールしたステップと最後のステップは必ず返す。
+    """
+    header, inputs = decode_log(data)
+    x, z, vx, vz = header['ball']
+    engine = PhysicsEngine(seed=header['seed'], step_rate=header['simulation_rate'])
+    state = RoomState(
+        Ball(x=x, z=z, vx=vx, vz=vz), Paddle(), Paddle(),
+        physics=engine, simulation_rate=header['simulation_rate'], snapshot_rate=header['snapshot_rate'],
+    )
+    state.phase = PLAYING
+    yield 0, state
+
+    index = 0
+    while engine.steps < header['steps']:
+        while index < len(inputs) and inputs[index][0] <= engine.steps:
+            _, player, position = inputs[index]
+            state.paddle(player).x = position
+            index += 1
+        scorer = engine.step(state)
+        last = engine.steps >= header['steps']
+        if scorer:
+            state.add_point(scorer)
+            state.ended = last
+        if scorer or last or engine.steps % every == 0:
+            yield engine.steps, state
+        if scorer and not last:
+            # 対戦中と同じく、ゴールの直後にサーブする (乱数の順序を合わせる)
+            engine.serve(state)
+
+
+def replay_path(game_id):
+    """ゲームのリプレイファイルの場所 (設定がないかゲームIDが UUID でなければ None で記録しない)"""
+    directory = getattr(settings, 'PONG_REPLAY_DIR', None)
+    if not directory:
+        return None
+    try:
+        # ルーム名はクライアントが決めるので、そのままパスに使わない
+        game_id = uuid.UUID(str(game_id))
+    except ValueError:
+        return None
+    return os.path.join(directory, f'{game_id}.replay')
+
+
+def write_replay(path, data):
+    """リプレイを書き込む (スレッドで実行)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from pong.utils import metrics
+from .rating import elo_update
+from .sharding import local_shard
+
+logger = logging.getLogger('pong.engine')
+
+# 終了したゲームの結果 (game_id はゲームルーム名ではなく Game の ID)
+GameResult = namedtuple('GameResult', ['game_id', 'score1', 'score2', 'winner'])
+
+
+def outbox_path():
+    """このワーカーのアウトボックスファイル (設定がなければ None でファイルに残さない)"""
+    path = getattr(settings, 'PONG_RESULT_OUTBOX', None)
+    return path.format(shard=local_shard()) if path else None
+
+
+def read_outbox(data):
+    """アウトボックスの内容から結果を読む (書き込みの途中で止まった最後の行は読み飛ばす)"""
+    results = []
+    for line in data.splitlines():
+        try:
+            result = GameResult(*json.loads(line))
+            uuid.UUID(result.game_id)
+        except (ValueError, TypeError, AttributeError):
+            continue
+        results.append(result)
+    return results
+
+
+def write_results(results):
+    """結果をまとめてデータベースに保存する (件数に関係なく1トランザクション・一定の数のクエリ)"""
+    from pong.models import Game, GamePlayers
+
+    by_game = {str(result.game_id): result for result in results}
+    with transaction.atomic():
+        players = list(GamePlayers.objects.filter(game_id__in=list(by_game)).only('id', 'game_id', 'player_number', 'user_id'))
+        games = {}
+        users = {}  # {game_id: {player_number: user_id}}
+        for player in players:
+            result = by_game[str(player.game_id)]
+            player.score = result.score1 if player.player_number == 1 else result.score2
+            if player.player_number == result.winner and player.user_id is not None:
+                games[player.game_id] = Game(id=player.game_id, winner_id=player.user_id)
+            if player.user_id is not None:
+                users.setdefault(str(player.game_id), {})[player.player_number] = player.user_id
+        GamePlayers.objects.bulk_update(players, ['score'])
+        Game.objects.bulk_update(list(games.values()), ['winner_id'])
+        update_ratings(by_game.values(), users)
+    return len({player.game_id for player in players})
+
+
+def update_ratings(results, users):
+    """両プレイヤーがユーザーのゲームの結果で、レーティングを順に更新する
+
+    書き込んだ後、アウトボックスから消す前に止まると同じ結果がもう一度書き込まれるので、
+    反映済みのゲーム (Game.rated) は飛ばす。
+    """
+    from pong.models import Game, User
+
+    candidates = [str(result.game_id) for result in results if len(users.get(str(result.game_id), ())) == 2]
+    if not candidates:
+        return
+    unrated = {
+        str(game_id) for game_id in
+        Game.objects.select_for_update().filter(id__in=candidates, rated=False).values_list('id', flat=True)
+    }
+    rated = [(result, users[str(result.game_id)]) for result in results if str(result.game_id) in unrated]
+    if not rated:
+        return
+    user_ids = {user_id for _, players in rated for user_id in players.values()}
+    # 他のワーカーが同じユーザーの結果を書き込んでいても上書きしないよう、行をロックして読む
+    accounts = {user.id: user for user in User.objects.select_for_update().filter(id__in=user_ids).only('id', 'rating')}
+    for result, players in rated:
+        player1, player2 = accounts.get(players[1]), accounts.get(players[2])
+        if player1 is None or player2 is None or player1 is player2:
+            continue
+        player1.rating, player2.rating = elo_update(player1.rating, player2.rating, result.winner)
+    User.objects.bulk_update(list(accounts.values()), ['rating'])
+    Game.objects.filter(id__in=[result.game_id for result, _ in rated]).update(rated=True)
+
+
+class ResultWriter:
+    """終了したゲームの結果をメモリにためて、まとめてデータベースに書き込む
+
+    submit() は結果をアウトボックスファイルに追記してから返るので、データベースに書き込む前に
+    プロセスが止まっても、次に起動したときにファイルから読み直して書き込む。
+    書き込みに成功したら、その結果をファイルから消す。
+    """
+
+    def __init__(self, path, interval=None, batch_size=None):
+        self.path = path
+        self.interval = interval or getattr(settings, 'PONG_RESULT_FLUSH_INTERVAL', 0.5)
+        self.batch_size = batch_size or getattr(settings, 'PONG_RESULT_BATCH_SIZE', 100)
+        self.pending = []  # まだデータベースに書き込んでいない GameResult
+        self.lock = threading.Lock()  # ファイルの追記と書き直しが重ならないようにする
+        self._task = None
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.pending = read_outbox(f.read())
+            if self.pending:
+                logger.info('Loaded %s game results from outbox %s', len(self.pending), path)
+
+    async def submit(self, result):
+        """結果をキューに入れる (アウトボックスに書き込んでから返る)"""
+        try:
+            uuid.UUID(result.game_id)
+        except ValueError:
+            # データベースにないゲーム (ベンチマークなど) は書き込まない
+            logger.warning('Ignoring result for invalid game id %s', result.game_id)
+            return
+        if self.path is not None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.append, result)
+            except OSError as e:
+                # ファイルに残せなくてもデータベースへの書き込みは続ける
+                logger.error('Error writing game result to outbox: %s', e, extra={'game_id': result.game_id})
+        self.pending.append(result)
+        self.ensure_running()
+
+    def ensure_running(self):
+        if not self.pending:
+            return
+        if self._task is not None and not self._task.done():
+            if self._task.get_loop() is asyncio.get_running_loop():
+                return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self.pending:
+                # 少し待って、その間に終わったゲームもまとめて書き込む
+                await asyncio.sleep(self.interval)
+                await self.flush()
+        finally:
+            self._task = None
+
+    async def flush(self):
+        """ためている結果を書き込む。失敗したら残しておき、次の機会に書き込み直す"""
+        batch = self.pending[:self.batch_size]
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            await database_sync_to_async(write_results)(batch)
+        except Exception:
+            metrics.RESULT_FLUSH_ERRORS.inc()
+            logger.exception('Error writing %s game results', len(batch))
+            return 0
+        finally:
+            metrics.RESULT_FLUSH_LATENCY.observe(time.perf_counter() - started)
+        # 書き込んでいる間に追加された結果は残す
+        del self.pending[:len(batch)]
+        if self.path is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.remove, batch)
+        return len(batch)
+
+    def append(self, result):
+        """アウトボックスに1件追記する (スレッドで実行)"""
+        line = json.dumps(list(result)) + '\n'
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self, written):
+        """書き込み済みの結果をアウトボックスから消す (スレッドで実行)
+
+        書き込んでいる間に追記された結果は残すため、ファイルを読み直して書き込んだ分だけを除く。
+        """
+        written = {str(result.game_id) for result in written}
+        with self.lock:
+            with open(self.path) as f:
+                remaining = [result for result in read_outbox(f.read()) if str(result.game_id) not in written]
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.writelines(json.dumps(list(result)) + '\n' for result in remaining)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+_writer = None
+
+
+def get_result_writer():
+    """プロセス共通の ResultWriter を返す (最初の呼び出しで前回のアウトボックスを読む)"""
+    global _writer
+    path = outbox_path()
+    if _writer is None or _writer.path != path:
+        _writer = ResultWriter(path)
+    return _writer
+
+
+def pending_results():
+    """データベースへの書き込みを待っている結果の数 (監視用)"""
+    return len(_writer.pending) if _writer is not None else 0
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from django.conf import settings
+from pong.utils import metrics
+
+logger = logging.getLogger('pong.engine')
+
+
+class TickStats:
+    """ティックごとの処理時間 (予算) の集計"""
+
+    # 負荷判定に使う平均の平滑化係数 (1ティックの外れ値で判定が揺れないように)
+    SMOOTHING = 0.1
+
+    def __init__(self, period):
+        self.period = period
+        self.ticks = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.avg_budget = 0.0   # 予算の使用率の指数移動平均
+        self.overruns = 0       # 予算 (1ティックの周期) を超えたティック数
+        self.skipped = 0        # 遅延が大きすぎて読み飛ばしたティック数
+        self.last_lag = 0.0     # 予定時刻からの起床遅延 (イベントループの遅れ)
+        self.max_lag = 0.0
+
+    def record(self, duration, lag):
+        self.ticks += 1
+        self.last_duration = duration
+        self.total_duration += duration
+        self.avg_budget += (duration / self.period - self.avg_budget) * self.SMOOTHING
+        if duration > self.max_duration:
+            self.max_duration = duration
+        if duration > self.period:
+            self.overruns += 1
+        self.last_lag = lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    @property
+    def budget_used(self):
+        """直近ティックで使った予算の割合 (1.0 で周期いっぱい)"""
+        return self.last_duration / self.period
+
+    def snapshot(self):
+        return {
+            'ticks': self.ticks,
+            'period': self.period,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+            'avg_duration': self.total_duration / self.ticks if self.ticks else 0.0,
+            'budget_used': self.budget_used,
+            'avg_budget': self.avg_budget,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+        }
+
+
+class ScheduledRoom:
+    """スケジューラに登録されたルーム (asyncio.Task と同じく cancel() で止められる)"""
+
+    def __init__(self, scheduler, key, step, flush):
+        self.scheduler = scheduler
+        self.key = key
+        self.step = step      # step(now): 同期的にゲーム状態を進める
+        self.flush = flush    # await flush(): 状態をクライアントに送信する
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+        self.scheduler.unschedule(self.key, self)
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._cancelled
+
+
+class TickScheduler:
+    """全ゲームルームを同じティックで進めるプロセス共通のスケジューラ
+
+    ルームごとに asyncio タスクとタイマーを持たせず、1つのタスクが
+    単調時計で次のティック時刻を積み上げながら全ルームを順に進める。
+    処理時間ぶん sleep を短くするので、負荷がかかっても周期がずれない。
+    """
+
+    # これ以上遅れたら追いつこうとせずティックを読み飛ばす
+    MAX_BEHIND_TICKS = 5
+
+    def __init__(self, rate=None, clock=time.monotonic):
+        self.rate = rate or getattr(settings, 'PONG_TICK_RATE', 60)
+        self.period = 1 / self.rate
+        self.clock = clock
+        self.rooms = {}  # {key: ScheduledRoom}
+        self.hooks = []  # 各ティックの最初に呼ぶ hook(now) (全ルーム一括の処理など)
+        self.tick_count = 0
+        self.stats = TickStats(self.period)
+        self._task = None
+
+    def schedule(self, key, step, flush=None):
+        """ルームを登録する (既に登録済みなら置き換える)"""
+        room = ScheduledRoom(self, key, step, flush)
+        self.rooms[key] = room
+        self._ensure_running()
+        return room
+
+    def add_hook(self, hook):
+        """各ティックの最初に、全ルームの step より前に呼ぶ処理を登録する"""
+        if hook not in self.hooks:
+            self.hooks.append(hook)
+
+    def unschedule(self, key, room=None):
+        """ルームの登録を解除する"""
+        current = self.rooms.get(key)
+        if current is not None and (room is None or current is room):
+            del self.rooms[key]
+
+    def _ensure_running(self):
+        if self._task is not None and not self._task.done():
+            if self._task.get_loop() is asyncio.get_running_loop():
+                return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        next_tick = self.clock()
+        try:
+            while self.rooms:
+                started = self.clock()
+                lag = max(0.0, started - next_tick)
+                await self.run_tick(started)
+                finished = self.clock()
+                self.stats.record(finished - started, lag)
+                metrics.TICK_DURATION.observe(finished - started)
+                metrics.LOOP_LAG.observe(lag)
+                if finished - started > self.period:
+                    metrics.TICK_OVERRUNS.inc()
+
+                # 次のティック時刻は前回の予定時刻から積み上げる (ドリフト補正)
+                next_tick += self.period
+                behind = finished - next_tick
+                if behind > self.period * self.MAX_BEHIND_TICKS:
+                    skipped = int(behind / self.period)
+                    next_tick += skipped * self.period
+                    self.stats.skipped += skipped
+                    metrics.TICKS_SKIPPED.inc(skipped)
+
+                await asyncio.sleep(max(0.0, next_tick - self.clock()))
+        finally:
+            self._task = None
+
+    async def run_tick(self, now):
+        """1ティック分、全ルームの状態更新と送信を行う"""
+        self.tick_count += 1
+        rooms = list(self.rooms.values())
+        metrics.TICK_ROOMS.set(len(rooms))
+
+        for hook in self.hooks:
+            try:
+                hook(now)
+            except Exception:
+                logger.exception('Error in tick hook')
+
+        # まず全ルームのシミュレーションを進めてから、まとめて送信する
+        for room in rooms:
+            if room.cancelled():
+                continue
+            try:
+                room.step(now)
+            except Exception:
+                logger.exception('Error in tick step', extra={'room': room.key})
+
+        for room in rooms:
+            if room.cancelled() or room.flush is None:
+                continue
+            try:
+                await room.flush()
+            except Exception:
+                logger.exception('Error in tick flush', extra={'room': room.key})
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """プロセス共通のスケジューラを取得する"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TickScheduler()
+    return _scheduler
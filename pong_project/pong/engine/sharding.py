@@ -0,0 +1,35 @@
+import zlib
+from django.conf import settings
+
+
+def shard_count():
+    """ゲームルームを分担するワーカープロセスの数"""
+    return getattr(settings, 'PONG_SHARD_COUNT', 1)
+
+
+def local_shard():
+    """このプロセスが担当するシャード番号"""
+    return getattr(settings, 'PONG_SHARD_INDEX', 0)
+
+
+def shard_for(game_room, count=None):
+    """ゲームルームを担当するシャード番号 (ゲームIDのハッシュで決める)
+
+    どのワーカーで計算しても同じ結果になるよう、プロセスごとに値が変わる hash() ではなく crc32 を使う。
+    """
+    return zlib.crc32(game_room.encode()) % (count or shard_count())
+
+
+def is_local_room(game_room):
+    """このプロセスがルームの状態を持つ (担当している) かどうか"""
+    return shard_for(game_room) == local_shard()
+
+
+def shard_channel(index):
+    """シャードの担当ワーカーがルームへの操作を受信するチャンネル名"""
+    return f'pong.shard.{index}'
+
+
+def spectator_group(game_room):
+    """ルームの観戦者のグループ名 (プレイヤーのグループとは分ける)"""
+    return f'{game_room}.spectators'
@@ -0,0 +1,134 @@
+# ルームのフェーズ (WAITING と PLAYING はチェックポイントの以前の game_started の値と同じ)
+WAITING = 0      # プレイヤーが揃うのを待っている
+PLAYING = 1      # 物理演算を進めている
+COUNTDOWN = 2    # 開始前のカウントダウン
+GOAL_PAUSE = 3   # ゴール後の停止
+ENDED = 4
+
+
+class Ball:
+    """ボールの位置と速度 (速度は 1秒あたりの移動量、y 方向には動かない)"""
+
+    __slots__ = ('x', 'y', 'z', 'vx', 'vz')
+
+    def __init__(self, x=0.0, y=1.0, z=0.0, vx=0.0, vz=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.vx = vx
+        self.vz = vz
+
+    def key(self):
+        """差分判定用の値"""
+        return (self.x, self.y, self.z, self.vx, self.vz)
+
+    def to_dict(self):
+        """クライアントに送る形式にする"""
+        return {
+            'x': self.x,
+            'y': self.y,
+            'z': self.z,
+            'velocity': {'x': self.vx, 'y': 0, 'z': self.vz},
+        }
+
+
+class Paddle:
+    """パドルの位置と、サーバー側で管理する移動量の残りと目標位置"""
+
+    __slots__ = ('x', 'seq', 'budget', 'moved_at', 'target')
+
+    def __init__(self, x=0.0, seq=0, budget=0.0, moved_at=0.0, target=None):
+        self.x = x
+        self.seq = seq            # 最後に処理した入力番号
+        self.budget = budget      # 持ち越している移動量
+        self.moved_at = moved_at  # 最後に動かした時刻
+        self.target = target      # 最後の入力の位置 (着くまでティックごとに近づける、None なら止まっている)
+
+
+class RoomState:
+    """ゲームルーム1つ分の状態 (GameConsumer.game_states の値)
+
+    ティックごとに何度も読み書きするので、辞書ではなく __slots__ の属性で持つ。
+    """
+
+    __slots__ = (
+        'phase', 'phase_ticks', 'events', 'ball', 'paddle1', 'paddle2', 'score1', 'score2',
+        'input1', 'input2', 'frame_seq', 'sent_ball', 'sent_paddles', 'sent_acks',
+        'score_changed', 'tick', 'simulation_rate', 'snapshot_rate', 'send_rate',
+        'last_update', 'physics', 'paused', 'tokens', 'away', 'spectators', 'bots',
+    )
+
+    def __init__(self, ball, paddle1, paddle2, physics=None, simulation_rate=60, snapshot_rate=60, now=0.0):
+        self.phase = WAITING
+        self.phase_ticks = 0         # 今のフェーズが終わるまでのティック数 (0 なら時間では終わらない)
+        self.events = []             # 次の送信時にプレイヤーへ送るイベント (フェーズの切り替えなど)
+        self.ball = ball
+        self.paddle1 = paddle1
+        self.paddle2 = paddle2
+        self.score1 = 0
+        self.score2 = 0
+        self.input1 = None           # 次のティックで反映するパドル入力 (seq, position)
+        self.input2 = None
+        self.frame_seq = 0           # 送信したゲーム状態フレームの通し番号
+        self.sent_ball = None        # 最後に送信したボールの状態 (差分判定用)
+        self.sent_paddles = None
+        self.sent_acks = None
+        self.score_changed = False
+        self.tick = 0                # このルームのティック番号
+        self.simulation_rate = simulation_rate  # 物理演算の頻度 (Hz)
+        self.snapshot_rate = snapshot_rate      # ゲーム状態の送信頻度 (Hz, 負荷が高ければ下げる)
+        self.send_rate = snapshot_rate          # 実際の送信頻度 (Hz)
+        self.last_update = now
+        self.physics = physics
+        self.paused = False          # 切断したプレイヤーの再接続を待っている間は物理演算を止める
+        self.tokens = {}             # {player_number: 再接続用のトークン}
+        self.away = {}               # {player_number: 猶予期間のタイマー (asyncio.Task)}
+        self.spectators = None       # 観戦者のチャンネル名の set (最初の観戦者が来るまで作らない)
+        self.bots = None             # {player_number: Bot} サーバー側の対戦相手 (いなければ None)
+
+    @property
+    def ended(self):
+        return self.phase == ENDED
+
+    @ended.setter
+    def ended(self, value):
+        if value:
+            self.phase = ENDED
+
+    @property
+    def game_started(self):
+        """物理演算を進めるフェーズかどうか"""
+        return self.phase == PLAYING
+
+    @game_started.setter
+    def game_started(self, value):
+        if not self.ended:
+            self.phase = PLAYING if value else WAITING
+
+    def paddle(self, player_number):
+        return self.paddle1 if player_number == 1 else self.paddle2
+
+    def set_input(self, player_number, seq, position):
+        if player_number == 1:
+            self.input1 = (seq, position)
+        else:
+            self.input2 = (seq, position)
+
+    def add_point(self, player_number):
+        if player_number == 1:
+            self.score1 += 1
+        else:
+            self.score2 += 1
+        self.score_changed = True
+
+    def score(self):
+        """クライアントに送る形式のスコア"""
+        return {'player1': self.score1, 'player2': self.score2}
+
+    def paddles(self):
+        """クライアントに送る形式のパドル位置"""
+        return {'player1': self.paddle1.x, 'player2': self.paddle2.x}
+
+    def acks(self):
+        """クライアントに送る形式の処理済み入力番号"""
+        return {'player1': self.paddle1.seq, 'player2': self.paddle2.seq}
@@ -0,0 +1,65 @@
+import gc
+import tracemalloc
+from django.core.management.base import BaseCommand
+from pong.engine.physics import new_paddle
+from pong.engine.state import Ball, RoomState
+
+
+def dict_room_state(now):
+    """以前の辞書のゲーム状態 (比較用)"""
+    return {
+        'ended': False,
+        'ball': {'x': 0, 'y': 1, 'z': 0, 'velocity': {'x': 12.0, 'y': 0, 'z': 18.0}},
+        'paddles': {
+            1: {'x': 0.0, 'seq': 0, 'budget': 4.5, 'moved_at': now},
+            2: {'x': 0.0, 'seq': 0, 'budget': 4.5, 'moved_at': now},
+        },
+        'score': {'player1': 0, 'player2': 0},
+        'game_started': False,
+        'frame_seq': 0,
+        'sent_ball': None,
+        'score_changed': False,
+        'inputs': {},
+        'sent_paddles': None,
+        'sent_acks': None,
+        'tick': 0,
+        'simulation_rate': 60,
+        'snapshot_rate': 60,
+        'send_rate': 60,
+        'last_update': now,
+        'physics': None,
+    }
+
+
+def slotted_room_state(now):
+    return RoomState(Ball(vx=12.0, vz=18.0), new_paddle(now), new_paddle(now), now=now)
+
+
+def measure(factory, rooms):
+    """ルームを rooms 個作ったときの1ルームあたりのバイト数を返す"""
+    gc.collect()
+    tracemalloc.start()
+    # 時刻はルームごとに別の float にする (実際のゲームと同じく共有されない)
+    # ルーム名と game_states 自体の分は両方に共通なので含めたまま比べる
+    states = {f'game_{i}': factory(float(i)) for i in range(rooms)}
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del states
+    return size / rooms
+
+
+class Command(BaseCommand):
+    help = 'ゲームルームの状態1つあたりのメモリ使用量を、辞書と RoomState で比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10000, help='作成するルーム数')
+
+    def handle(self, *args, **options):
+        rooms = options['rooms']
+        # 物理エンジン (乱数の状態) はどちらも同じなので含めない
+        before = measure(dict_room_state, rooms)
+        after = measure(slotted_room_state, rooms)
+        self.stdout.write(f'{rooms} rooms')
+        self.stdout.write(f'  dict      : {before:8.0f} bytes/room')
+        self.stdout.write(f'  RoomState : {after:8.0f} bytes/room')
+        self.stdout.write(self.style.SUCCESS(f'  {before - after:.0f} bytes/room saved ({after / before:.0%} of dict)'))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import uuid
+from contextlib import redirect_stdout
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pong.consumers.game import GameConsumer
+from pong.engine.bot import DIFFICULTIES, Bot
+from pong.engine.scheduler import TickStats, get_scheduler
+from pong.engine.state import PLAYING
+from pong.utils.bench import percentiles, rss_kb
+
+
+class RecordingStats(TickStats):
+    """パーセンタイルを出すため、ティックごとの処理時間と起床遅延をすべて残す"""
+
+    def __init__(self, period):
+        super().__init__(period)
+        self.durations = []
+        self.lags = []
+
+    def record(self, duration, lag):
+        super().record(duration, lag)
+        self.durations.append(duration)
+        self.lags.append(lag)
+
+
+class CountingChannelLayer:
+    """送信されたメッセージを数えるだけの channel layer (クライアントへは送らない)"""
+
+    def __init__(self):
+        self.frames = 0
+        self.frame_bytes = 0
+        self.messages = 0
+
+    async def group_send(self, group, message):
+        if message['type'] == 'game_frame':
+            self.frames += 1
+            self.frame_bytes += len(message['bytes'])
+        else:
+            self.messages += 1
+
+    async def send(self, channel, message):
+        await self.group_send(None, message)
+
+    async def group_add(self, group, channel):
+        pass
+
+    async def group_discard(self, group, channel):
+        pass
+
+
+class BenchConsumer(GameConsumer):
+    """ベンチマーク用: 勝敗がついてもゲームを終わらせない (データベースに書き込まない)"""
+
+    def check_for_winner(self, game_room):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'ゲームルームを大量に動かし、ティックの処理時間・遅延・送信フレーム数・CPU時間・メモリを JSON で出力します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=1000, help='同時に動かすルーム数')
+        parser.add_argument('--seconds', type=float, default=10.0, help='計測する秒数')
+        parser.add_argument('--warmup', type=float, default=2.0, help='計測前に動かす秒数')
+        parser.add_argument('--input-rate', type=float, default=30.0, help='プレイヤーごとのパドル入力の頻度 (Hz)')
+        parser.add_argument('--simulation-rate', type=int, default=60, help='ルームのシミュレーション頻度 (Hz)')
+        parser.add_argument('--snapshot-rate', type=int, default=60, help='ルームの送信頻度 (Hz)')
+        parser.add_argument('--seed', type=int, default=1, help='入力を作る乱数のシード')
+        parser.add_argument('--bots', choices=sorted(DIFFICULTIES), help='両方のパドルをこの難易度のボットに動かさせる (入力は送らない)')
+
+    def handle(self, *args, **options):
+        # ゲームのログは stderr に出し、stdout には結果の JSON だけを書く
+        with redirect_stdout(sys.stderr):
+            result = asyncio.run(self.run(options))
+        self.stdout.write(json.dumps(result, indent=2))
+
+    async def run(self, options):
+        scheduler = get_scheduler()
+        layer = CountingChannelLayer()
+        consumer = BenchConsumer()
+        consumer.channel_layer = layer
+        rooms = [f'game_{uuid.UUID(int=i)}' for i in range(options['rooms'])]
+
+        started = time.perf_counter()
+        for index, game_room in enumerate(rooms):
+            game_state = consumer.create_room(game_room, options['simulation_rate'], options['snapshot_rate'])
+            game_state.phase = PLAYING
+            consumer.game_players[game_room] = {f'bench.{game_room}.1': 1, f'bench.{game_room}.2': 2}
+            if options['bots']:
+                game_state.bots = {n: Bot(n, options['bots'], seed=options['seed'] + index * 2 + n) for n in (1, 2)}
+            consumer.game_tasks[game_room] = consumer.schedule_game_loop(game_room)
+        setup_seconds = time.perf_counter() - started
+
+        # ボット同士の場合はボットがティックの中でパドルを動かす
+        driver = None
+        if not options['bots']:
+            driver = asyncio.create_task(self.send_inputs(consumer, rooms, options, scheduler.period))
+        try:
+            await asyncio.sleep(options['warmup'])
+
+            # ここから計測する
+            stats = scheduler.stats = RecordingStats(scheduler.period)
+            layer.frames = layer.frame_bytes = layer.messages = 0
+            cpu = time.process_time()
+            wall = time.perf_counter()
+            await asyncio.sleep(options['seconds'])
+            cpu = time.process_time() - cpu
+            wall = time.perf_counter() - wall
+        finally:
+            if driver is not None:
+                driver.cancel()
+            for game_room in rooms:
+                task = consumer.game_tasks.pop(game_room, None)
+                if task is not None:
+                    task.cancel()
+                consumer.game_players[game_room] = {}
+                consumer.cleanup_room(game_room)
+            scheduler.stats = TickStats(scheduler.period)
+
+        return {
+            'config': {
+                'rooms': options['rooms'],
+                'seconds': options['seconds'],
+                'warmup': options['warmup'],
+                'input_rate': 0 if options['bots'] else options['input_rate'],
+                'bots': options['bots'],
+                'simulation_rate': options['simulation_rate'],
+                'snapshot_rate': options['snapshot_rate'],
+                'tick_rate': scheduler.rate,
+                'physics_backend': getattr(settings, 'PONG_PHYSICS_BACKEND', 'python'),
+                'python': platform.python_version(),
+            },
+            'setup_seconds': setup_seconds,
+            'ticks': stats.ticks,
+            'ticks_per_second': stats.ticks / wall,
+            'tick_ms': percentiles(stats.durations),
+            'loop_lag_ms': percentiles(stats.lags),
+            'avg_budget': stats.total_duration / stats.ticks / scheduler.period if stats.ticks else 0.0,
+            'overruns': stats.overruns,
+            'skipped_ticks': stats.skipped,
+            'frames_per_second': layer.frames / wall,
+            'frame_bytes_per_second': layer.frame_bytes / wall,
+            'messages_per_second': layer.messages / wall,
+            'cpu_seconds': cpu,
+            'cpu_percent': cpu / wall * 100,
+            'rss_kb': rss_kb(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    async def send_inputs(self, consumer, rooms, options, period):
+        """プレイヤーのパドル入力を模擬する (ボールの位置を少しずらして追いかける)"""
+        rng = random.Random(options['seed'])
+        chance = min(1.0, options['input_rate'] * period)
+        seq = 0
+        while True:
+            seq += 1
+            for game_room in rooms:
+                game_state = consumer.game_states.get(game_room)
+                if game_state is None:
+                    continue
+                for player_number in (1, 2):
+                    if rng.random() < chance:
+                        await consumer.route_to_room({
+                            'type': 'room.input',
+                            'game_room': game_room,
+                            'player_number': player_number,
+                            'seq': seq,
+                            'position': game_state.ball.x + rng.uniform(-3.0, 3.0),
+                        })
+            await asyncio.sleep(period)
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from pong.consumers.protocol import BINARY_SUBPROTOCOL, FRAME_PADDLE_MOVE, PADDLE_MOVE_FRAME, quantize
+from pong.utils.bench import percentiles, rss_kb
+
+logger = logging.getLogger('pong.loadtest')
+
+# 相手が先に --duration で打ち切ったための中断とみなす、期限までの残り秒数
+# (同じゲームの2人は参加した時刻が少しずれるので、期限もその分ずれる)
+END_MARGIN = 1.0
+
+
+class LoadStats:
+    """全クライアントの計測値"""
+
+    def __init__(self):
+        self.match_latency = []    # match_request から match_found まで
+        self.start_latency = []    # join_game から game_start まで
+        self.inter_arrival = []    # ゲーム状態フレームの到着間隔
+        self.frames = 0
+        self.inputs = 0
+        self.games_ended = 0       # game_end まで進んだクライアント数
+        self.timed_out = 0         # --duration で打ち切ったクライアント数
+        self.dropped = 0           # 途中で切断・応答がなくなったクライアント数
+        self.errors = {}           # {段階: 件数}
+
+    def drop(self, stage):
+        self.dropped += 1
+        self.errors[stage] = self.errors.get(stage, 0) + 1
+
+
+class LoadClient:
+    """ブラウザと同じ順序でマッチング → 参加 → パドル入力を行う1人分のクライアント"""
+
+    def __init__(self, application, number, stats, options):
+        self.application = application
+        self.number = number
+        self.stats = stats
+        self.options = options
+        self.rng = random.Random(options['seed'] * 100003 + number)
+
+    async def run(self):
+        try:
+            match = await self.find_match()
+            if match is not None:
+                await self.play(match)
+        except Exception as e:
+            logger.warning('Load client %s failed: %r', self.number, e)
+            self.stats.drop('error')
+
+    async def find_match(self):
+        timeout = self.options['timeout']
+        communicator = WebsocketCommunicator(self.application, '/ws/pong/matchmaking/')
+        connected, _ = await communicator.connect(timeout=timeout)
+        if not connected:
+            self.stats.drop('matchmaking_connect')
+            return None
+        try:
+            requested = time.perf_counter()
+            await communicator.send_json_to({'type': 'match_request', 'username': f'load{self.number}'})
+            while True:
+                message = await self.receive(communicator, self.options['match_timeout'])
+                if message is None:
+                    self.stats.drop('matchmaking')
+                    return None
+                if isinstance(message, dict) and message.get('type') == 'match_found':
+                    self.stats.match_latency.append(time.perf_counter() - requested)
+                    return message
+        finally:
+            await self.close(communicator)
+
+    async def play(self, match):
+        timeout = self.options['timeout']
+        binary = self.options['binary']
+        communicator = WebsocketCommunicator(
+            self.application, '/ws/pong/game/',
+            subprotocols=[BINARY_SUBPROTOCOL] if binary else None,
+        )
+        connected, _ = await communicator.connect(timeout=timeout)
+        if not connected:
+            self.stats.drop('game_connect')
+            return
+
+        joined = time.perf_counter()
+        deadline = joined + self.options['duration']
+        sender = None
+        last_frame = None
+        try:
+            await communicator.send_json_to({
+                'type': 'join_game',
+                'game_id': match['game_room'],
+                'player_number': match['player_number'],
+            })
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.stats.timed_out += 1
+                    return
+                message = await self.receive(communicator, min(timeout, remaining))
+                if message is None:
+                    if time.perf_counter() < deadline:
+                        self.stats.drop('game')
+                        return
+                    continue
+
+                # バイナリの場合はゲーム状態、JSON の場合は event で判断する
+                event = message.get('event') if isinstance(message, dict) else 'game_state_update'
+                if event == 'game_state_update':
+                    now = time.perf_counter()
+                    if last_frame is not None and sender is not None:
+                        self.stats.inter_arrival.append(now - last_frame)
+                    last_frame = now
+                    self.stats.frames += 1
+                elif event == 'game_start':
+                    self.stats.start_latency.append(time.perf_counter() - joined)
+                    # 開始前の待ち時間は到着間隔に含めない (game_start は channel layer 経由なので
+                    # 直接送られる最初のフレームより後に届くことがある)
+                    last_frame = None
+                    sender = asyncio.create_task(self.send_inputs(communicator, binary))
+                elif event == 'game_end':
+                    self.stats.games_ended += 1
+                    return
+                elif event == 'game_interrupted':
+                    if message.get('reason') == 'disconnect' and deadline - time.perf_counter() < END_MARGIN:
+                        self.stats.timed_out += 1
+                    else:
+                        self.stats.drop('interrupted')
+                    return
+        finally:
+            if sender is not None:
+                sender.cancel()
+            await self.close(communicator)
+
+    async def send_inputs(self, communicator, binary):
+        """パドル入力を一定の頻度で送る (人の操作のように滑らかに左右へ動かす)"""
+        period = 1 / self.options['input_rate']
+        phase = self.rng.random() * 2 * math.pi
+        seq = 0
+        while True:
+            await asyncio.sleep(period)
+            seq += 1
+            position = 12 * math.sin(phase + seq * period * 1.7)
+            if binary:
+                await communicator.send_to(bytes_data=PADDLE_MOVE_FRAME.pack(FRAME_PADDLE_MOVE, seq, quantize(position)))
+            else:
+                await communicator.send_json_to({'type': 'paddle_move', 'seq': seq, 'position': position})
+            self.stats.inputs += 1
+
+    async def receive(self, communicator, timeout):
+        """次のメッセージ (JSON は辞書、バイナリはバイト列) を返す。切断・タイムアウトなら None"""
+        try:
+            # receive_output() はタイムアウトするとサーバー側の consumer を止めてしまうので、キューを直接待つ
+            output = await asyncio.wait_for(communicator.output_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if output['type'] == 'websocket.close':
+            return None
+        if output.get('bytes') is not None:
+            return output['bytes']
+        return json.loads(output['text'])
+
+    async def close(self, communicator):
+        """接続を閉じる (サーバー側が既に終了していれば何もしない)"""
+        if communicator.future.done():
+            return
+        await communicator.disconnect()
+
+
+class Command(BaseCommand):
+    help = (
+        'プロセス内で ASGI アプリケーションを動かし、多数の WebSocket クライアントで'
+        'マッチングからゲーム終了までを実行して、遅延や切断数を JSON で出力します '
+        '(設定されたデータベースにゲームが作成されます)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='クライアント数 (偶数、2人で1ゲーム)')
+        parser.add_argument('--ramp', type=float, default=5.0, help='全クライアントが接続し終えるまでの秒数')
+        parser.add_argument('--input-rate', type=float, default=30.0, help='クライアントごとのパドル入力の頻度 (Hz)')
+        parser.add_argument('--duration', type=float, default=120.0, help='1ゲームを打ち切るまでの秒数')
+        parser.add_argument('--timeout', type=float, default=10.0, help='応答がなければ切断とみなす秒数')
+        parser.add_argument('--match-timeout', type=float, default=30.0, help='マッチングを待つ秒数')
+        parser.add_argument('--binary', action='store_true', help='バイナリのサブプロトコルを使う')
+        parser.add_argument('--seed', type=int, default=1, help='入力を作る乱数のシード')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 2 or options['clients'] % 2:
+            raise CommandError('--clients must be an even number of at least 2')
+        # ゲームのログは stderr に出し、stdout には結果の JSON だけを書く
+        with redirect_stdout(sys.stderr):
+            result = asyncio.run(self.run(options))
+        self.stdout.write(json.dumps(result, indent=2))
+
+    async def run(self, options):
+        from pong_project.asgi import application
+
+        stats = LoadStats()
+        clients = [LoadClient(application, number, stats, options) for number in range(options['clients'])]
+        interval = options['ramp'] / len(clients)
+
+        started = time.perf_counter()
+        cpu = time.process_time()
+        tasks = []
+        for client in clients:
+            tasks.append(asyncio.create_task(client.run()))
+            await asyncio.sleep(interval)
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+
+        jitter = 0.0
+        if len(stats.inter_arrival) > 1:
+            mean = sum(stats.inter_arrival) / len(stats.inter_arrival)
+            jitter = math.sqrt(sum((d - mean) ** 2 for d in stats.inter_arrival) / len(stats.inter_arrival)) * 1000
+
+        return {
+            'config': {
+                'clients': options['clients'],
+                'ramp': options['ramp'],
+                'input_rate': options['input_rate'],
+                'duration': options['duration'],
+                'binary': options['binary'],
+            },
+            'seconds': wall,
+            'match_latency_ms': percentiles(stats.match_latency),
+            'join_to_start_ms': percentiles(stats.start_latency),
+            'frame_interval_ms': percentiles(stats.inter_arrival),
+            'frame_jitter_ms': jitter,
+            'frames_per_second': stats.frames / wall,
+            'inputs_per_second': stats.inputs / wall,
+            'games_ended': stats.games_ended // 2,
+            'timed_out': stats.timed_out,
+            'dropped': stats.dropped,
+            'drops_by_stage': stats.errors,
+            'cpu_seconds': cpu,
+            'rss_kb': rss_kb(),
+        }
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pong', '0011_tournament_tournamentmatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gameoptions',
+            name='simulation_rate',
+            field=models.IntegerField(choices=[(60, '60Hz'), (120, '120Hz')], default=60),
+        ),
+        migrations.AddField(
+            model_name='gameoptions',
+            name='snapshot_rate',
+            field=models.IntegerField(choices=[(60, '60Hz'), (30, '30Hz'), (20, '20Hz')], default=60),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pong', '0012_gameoptions_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='rating',
+            field=models.IntegerField(default=1000),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pong', '0013_user_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
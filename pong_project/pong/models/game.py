@@ -13,6 +13,8 @@ class Game(models.Model):
     mode = models.CharField(max_length=10, choices=MODE_CHOICES)
     winner_id = models.UUIDField(null=True, blank=True)
     played_at = models.DateTimeField()
+    # 結果をプレイヤーのレーティングに反映済みか (同じ結果が書き込み直されても二重に反映しない)
+    rated = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Game {self.id} - {self.mode}"
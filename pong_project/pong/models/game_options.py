@@ -14,10 +14,24 @@ class GameOptions(models.Model):
         ('fast', '速い'),
     ]
     
+    # サーバーのシミュレーション頻度とクライアントへの送信頻度 (Hz)
+    SIMULATION_RATE_CHOICES = [
+        (60, '60Hz'),
+        (120, '120Hz'),
+    ]
+    
+    SNAPSHOT_RATE_CHOICES = [
+        (60, '60Hz'),
+        (30, '30Hz'),
+        (20, '20Hz'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     game = models.OneToOneField(Game, on_delete=models.CASCADE, related_name='options')
     ball_count = models.IntegerField(choices=BALL_COUNT_CHOICES, default=1)
     ball_speed = models.CharField(max_length=10, choices=BALL_SPEED_CHOICES, default='normal')
+    simulation_rate = models.IntegerField(choices=SIMULATION_RATE_CHOICES, default=60)
+    snapshot_rate = models.IntegerField(choices=SNAPSHOT_RATE_CHOICES, default=60)
     
     def __str__(self):
         return f"Options for Game {self.game.id}" 
\ No newline at end of file
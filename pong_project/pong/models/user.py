@@ -42,6 +42,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     # 42 OAuth用のフィールドを追加
     intra_42_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
 
+    # マッチングに使うレーティング (オンライン対戦の結果で更新)
+    rating = models.IntegerField(default=1000)
+
     objects = UserManager()
 
     USERNAME_FIELD = 'username'
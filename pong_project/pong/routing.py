@@ -4,4 +4,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'ws/pong/matchmaking/$', consumers.MatchmakingConsumer.as_asgi()),
     re_path(r'ws/pong/game/$', consumers.GameConsumer.as_asgi()),
+    re_path(r'ws/pong/spectate/(?P<game_id>[0-9a-f-]+)/$', consumers.SpectatorConsumer.as_asgi()),
 ] 
\ No newline at end of file
@@ -1,5 +1,152 @@
 import { Component } from "../core/component.js";
 
+// バイナリ形式のサブプロトコル (サーバーの pong/consumers/protocol.py と対応)
+const BINARY_SUBPROTOCOL = "pong-binary.v1";
+const POSITION_SCALE = 100; // 座標は 0.01 単位の int16
+const FRAME_STATE = 0x01;
+const FRAME_PADDLE_MOVE = 0x10;
+// ゲーム状態フレームに含まれる項目 (変化した項目だけが送られる)
+const FIELD_BALL = 0x01;
+const FIELD_SCORE = 0x02;
+const FIELD_PADDLES = 0x04;
+const FIELD_ACKS = 0x08;
+const FLAG_KEYFRAME = 0x80;
+
+// サーバー側のパドル速度 (pong/engine/physics.py の PADDLE_SPEED, 単位/秒)
+const PADDLE_SPEED = 18;
+// ボールと相手のパドルは少し過去の時刻で補間して描画する
+const INTERPOLATION_DELAY = 100; // ms
+// これ以上離れた位置に飛んだら補間せずに切り替える (サーブなど)
+const SNAP_DISTANCE = 5;
+
+// サーバーからのバイナリフレームを JSON と同じ形式のメッセージにする
+function decodeBinaryFrame(buffer) {
+  const view = new DataView(buffer);
+  const type = view.getUint8(0);
+
+  if (type === FRAME_STATE) {
+    // type, seq, tick, mask の後にマスクで示した項目が続く
+    const message = {
+      type: "game_message",
+      event: "game_state_update",
+      seq: view.getUint32(1, true),
+      tick: view.getUint32(5, true),
+    };
+    const mask = view.getUint8(9);
+    let offset = 10;
+    if (mask & FLAG_KEYFRAME) {
+      message.keyframe = true;
+    }
+    if (mask & FIELD_BALL) {
+      // ball.x, ball.y, ball.z, velocity.x, velocity.z
+      message.ball = {
+        x: view.getInt16(offset, true) / POSITION_SCALE,
+        y: view.getInt16(offset + 2, true) / POSITION_SCALE,
+        z: view.getInt16(offset + 4, true) / POSITION_SCALE,
+        velocity: {
+          x: view.getInt16(offset + 6, true) / POSITION_SCALE,
+          y: 0,
+          z: view.getInt16(offset + 8, true) / POSITION_SCALE,
+        },
+      };
+      offset += 10;
+    }
+    if (mask & FIELD_SCORE) {
+      message.score = {
+        player1: view.getUint8(offset),
+        player2: view.getUint8(offset + 1),
+      };
+      offset += 2;
+    }
+    if (mask & FIELD_PADDLES) {
+      message.paddles = {
+        player1: view.getInt16(offset, true) / POSITION_SCALE,
+        player2: view.getInt16(offset + 2, true) / POSITION_SCALE,
+      };
+      offset += 4;
+    }
+    if (mask & FIELD_ACKS) {
+      // 各プレイヤーの処理済み入力番号
+      message.acks = {
+        player1: view.getUint32(offset, true),
+        player2: view.getUint32(offset + 4, true),
+      };
+      offset += 8;
+    }
+    return message;
+  }
+
+  return null;
+}
+
+// 自分のパドル位置を入力番号つきのバイナリフレームにする
+function encodePaddleMove(seq, position) {
+  const buffer = new ArrayBuffer(7);
+  const view = new DataView(buffer);
+  const quantized = Math.max(
+    -32768,
+    Math.min(32767, Math.round(position * POSITION_SCALE))
+  );
+  view.setUint8(0, FRAME_PADDLE_MOVE);
+  view.setUint32(1, seq, true);
+  view.setInt16(5, quantized, true);
+  return buffer;
+}
+
+// 受信したスナップショットを時刻つきで保持し、描画時刻の状態を線形補間で求める
+export class InterpolationBuffer {
+  constructor(delay = INTERPOLATION_DELAY, size = 32) {
+    this.delay = delay;
+    this.size = size;
+    this.samples = []; // [{time, state}] 受信順
+  }
+
+  push(time, state) {
+    const last = this.samples[this.samples.length - 1];
+    if (last && InterpolationBuffer.distance(last.state, state) > SNAP_DISTANCE) {
+      // 大きく飛んだときは古い位置から補間しない
+      this.samples = [];
+    }
+    this.samples.push({ time, state });
+    if (this.samples.length > this.size) {
+      this.samples.shift();
+    }
+  }
+
+  sample(now) {
+    const renderTime = now - this.delay;
+    const samples = this.samples;
+    if (samples.length === 0) {
+      return null;
+    }
+    // 描画時刻より新しい最初のスナップショットとその1つ前の間で補間する
+    let i = samples.findIndex((s) => s.time > renderTime);
+    if (i === -1) {
+      return samples[samples.length - 1].state;
+    }
+    if (i === 0) {
+      return samples[0].state;
+    }
+    // 使い終わった古いスナップショットは捨てる
+    samples.splice(0, i - 1);
+    const [from, to] = samples;
+    const t = (renderTime - from.time) / (to.time - from.time);
+    const state = {};
+    for (const key of Object.keys(to.state)) {
+      state[key] = from.state[key] + (to.state[key] - from.state[key]) * t;
+    }
+    return state;
+  }
+
+  clear() {
+    this.samples = [];
+  }
+
+  static distance(a, b) {
+    return Math.hypot(a.ballX - b.ballX, a.ballZ - b.ballZ);
+  }
+}
+
 export class RemoteGame extends Component {
   constructor(router, params, state) {
     super(router, params, state);
@@ -78,8 +225,18 @@ export class RemoteGame extends Component {
     this.paddle2 = null;
     this.ball = null;
 
-    // パドルの移動速度
-    this.paddleSpeed = 0.3;
+    // パドルの移動速度 (単位/秒, サーバーと同じ値)
+    this.paddleSpeed = PADDLE_SPEED;
+
+    // クライアント側予測: 送信した入力のうちサーバーが未処理のもの
+    this.inputSeq = 0;
+    this.pendingInputs = [];
+    this.serverPaddle = null; // サーバーが確定した自分のパドル位置
+    this.ackedInput = 0;
+
+    // ボールと相手のパドルの補間用 (欠けた項目は最後の値を使う)
+    this.snapshots = new InterpolationBuffer();
+    this.latestSnapshot = { ballX: 0, ballY: 0.5, ballZ: 0, opponentX: 0 };
 
     // スコア
     this.score = { player1: 0, player2: 0 };
@@ -89,6 +246,13 @@ export class RemoteGame extends Component {
     this.gameEnded = false;
     this.winnerDeclared = false; // アラート表示済みフラグ
     this.lastUpdateTime = 0;
+    this.lastSnapshotSeq = null; // 最後に受信したゲーム状態フレームの番号
+    this.keyframeRequested = false;
+
+    // 切断時の再接続 (サーバーは猶予期間のあいだゲームを止めて待つ)
+    this.resumeToken = null;
+    this.reconnectDelay = 1000;
+    this.reconnectTimer = null;
 
     // プレイヤー情報
     this.players = {
@@ -164,7 +328,9 @@ export class RemoteGame extends Component {
   initializeWebSocket() {
     const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
     const wsUrl = `${protocol}//${window.location.host}/ws/pong/game/`;
-    this.socket = new WebSocket(wsUrl);
+    // バイナリ形式を要求する (サーバーが選ばなければ JSON のまま)
+    this.socket = new WebSocket(wsUrl, [BINARY_SUBPROTOCOL]);
+    this.socket.binaryType = "arraybuffer";
 
     this.socket.onopen = () => {
       // WebSocket接続時の最低限のログ
@@ -189,25 +355,32 @@ export class RemoteGame extends Component {
         return; // 以降のコードを実行しない
       }
 
-      // 通常のゲーム参加
+      // 通常のゲーム参加 (再接続時はトークンを付けて切断前のゲームに戻る)
+      if (this.resumeToken) {
+        this.lastSnapshotSeq = null;
+        this.snapshots.clear();
+      }
       this.socket.send(
         JSON.stringify({
           type: "join_game",
           game_id: this.gameRoom,
           player_number: this.playerNumber,
+          resume_token: this.resumeToken || undefined,
         })
       );
     };
 
     this.socket.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-
-      // 重要なイベントのみログ出力（game_state_updateとpaddle_moveは出力しない）
-      if (
-        data.type === "game_message" &&
-        data.event !== "game_state_update" &&
-        data.event !== "paddle_move"
-      ) {
+      const data =
+        event.data instanceof ArrayBuffer
+          ? decodeBinaryFrame(event.data)
+          : JSON.parse(event.data);
+      if (!data) {
+        return;
+      }
+
+      // 重要なイベントのみログ出力（game_state_updateは出力しない）
+      if (data.type === "game_message" && data.event !== "game_state_update") {
         console.log(`受信: ${data.event}`);
       }
 
@@ -232,30 +405,45 @@ export class RemoteGame extends Component {
         // その他のメッセージ処理
         if (data.event === "player_joined") {
           console.log(`プレイヤー${data.player_number}がゲームに参加`);
-        } else if (data.event === "paddle_move") {
-          const playerNumber = data.player_number;
-          const position = data.position;
-
-          // 相手のパドル位置を更新
-          if (playerNumber !== this.playerNumber) {
-            if (playerNumber === 1) {
-              this.paddle1.position.x = position;
-            } else if (playerNumber === 2) {
-              this.paddle2.position.x = position;
-            }
-          }
+        } else if (data.event === "session") {
+          // 切断したときに同じゲームに戻るためのトークン
+          this.resumeToken = data.resume_token;
+          this.reconnectDelay = 1000;
+        } else if (data.event === "player_disconnected") {
+          console.log(
+            `プレイヤー${data.player_number}の再接続を${data.grace}秒待っています`
+          );
+        } else if (data.event === "player_reconnected") {
+          console.log(`プレイヤー${data.player_number}が再接続`);
+          this.reconnectDelay = 1000;
         } else if (data.event === "game_state_update") {
-          // サーバーからのゲーム状態更新を処理
+          // サーバーからのゲーム状態更新を処理 (変化した項目のみ含まれる)
+          this.trackSnapshotSeq(data);
+
+          // ボールと相手のパドルは補間バッファ経由で描画する
+          const snapshot = { ...this.latestSnapshot };
           if (data.ball) {
-            this.ball.position.x = data.ball.x;
-            this.ball.position.y = data.ball.y;
-            this.ball.position.z = data.ball.z;
+            snapshot.ballX = data.ball.x;
+            snapshot.ballY = data.ball.y;
+            snapshot.ballZ = data.ball.z;
+          }
+          if (data.paddles) {
+            const opponentNumber = this.playerNumber === 1 ? 2 : 1;
+            snapshot.opponentX = data.paddles[`player${opponentNumber}`];
           }
+          if (data.ball || data.paddles) {
+            this.latestSnapshot = snapshot;
+            this.snapshots.push(performance.now(), snapshot);
+          }
+
+          this.reconcile(data);
 
           if (data.score) {
             this.score = data.score;
             this.updateScoreDisplay();
           }
+        } else if (data.event === "countdown") {
+          console.log("ゲーム開始まで", data.seconds);
         } else if (data.event === "game_start") {
           console.log("ゲーム開始");
           this.gameStarted = true;
@@ -275,9 +463,52 @@ export class RemoteGame extends Component {
 
     this.socket.onclose = (event) => {
       console.log("WebSocket 接続終了");
+
+      // ゲーム中に切れた場合は、サーバーの猶予期間内に再接続を試みる
+      if (!this.gameEnded && this.resumeToken) {
+        this.reconnectTimer = setTimeout(() => {
+          this.reconnectTimer = null;
+          this.initializeWebSocket();
+        }, this.reconnectDelay);
+        this.reconnectDelay = Math.min(this.reconnectDelay * 2, 8000);
+      }
     };
   }
 
+  trackSnapshotSeq(data) {
+    // 差分は直前のフレームを基準にしているので、欠落したらキーフレームを要求する
+    if (data.keyframe) {
+      this.keyframeRequested = false;
+    } else if (
+      this.lastSnapshotSeq !== null &&
+      data.seq !== this.lastSnapshotSeq + 1 &&
+      !this.keyframeRequested &&
+      this.socket.readyState === WebSocket.OPEN
+    ) {
+      this.keyframeRequested = true;
+      this.socket.send(JSON.stringify({ type: "request_keyframe" }));
+    }
+    this.lastSnapshotSeq = data.seq;
+  }
+
+  reconcile(data) {
+    // サーバーが処理済みの入力を捨て、未処理の入力がなければサーバーの位置に合わせる
+    const key = `player${this.playerNumber}`;
+    if (data.acks) {
+      this.ackedInput = data.acks[key];
+      this.pendingInputs = this.pendingInputs.filter(
+        (seq) => seq > this.ackedInput
+      );
+    }
+    if (data.paddles) {
+      this.serverPaddle = data.paddles[key];
+    }
+    if (this.pendingInputs.length === 0 && this.serverPaddle !== null) {
+      // 入力は絶対位置なので、未処理の入力が残っていれば予測した位置のままでよい
+      this.myPaddle.position.x = this.serverPaddle;
+    }
+  }
+
   setupControls() {
     // キーが押された時
     document.addEventListener("keydown", (e) => {
@@ -304,13 +535,19 @@ export class RemoteGame extends Component {
     }
 
     const currentTime = performance.now();
-    const deltaTime = currentTime - this.lastUpdateTime;
+    // 停止からの再開直後などに大きく動かないよう上限を設ける
+    const deltaTime = this.lastUpdateTime
+      ? Math.min(currentTime - this.lastUpdateTime, 100)
+      : 0;
     this.lastUpdateTime = currentTime;
 
     this.animationFrameId = requestAnimationFrame(() => this.animate());
 
-    // パドル位置の更新
-    this.updatePaddlePosition();
+    // パドル位置の更新 (自分のパドルは入力から予測する)
+    this.updatePaddlePosition(deltaTime / 1000);
+
+    // ボールと相手のパドルは補間した位置に置く
+    this.applyInterpolatedState(currentTime);
 
     // ボール位置の更新を追加
     // this.updateBallPosition();
@@ -319,7 +556,16 @@ export class RemoteGame extends Component {
     this.render();
   }
 
-  updatePaddlePosition() {
+  applyInterpolatedState(now) {
+    const state = this.snapshots.sample(now);
+    if (!state) {
+      return;
+    }
+    this.ball.position.set(state.ballX, state.ballY, state.ballZ);
+    this.oppPaddle.position.x = state.opponentX;
+  }
+
+  updatePaddlePosition(dt) {
     // デバッグログを削除（アニメーションごとに出力されるのを防止）
     let moved = false;
     const myPaddle = this.myPaddle;
@@ -337,24 +583,32 @@ export class RemoteGame extends Component {
 
     // パドルの移動範囲を拡大（テーブル端まで移動可能に）
     if (leftKey && myPaddle.position.x > -13) {
-      myPaddle.position.x -= this.paddleSpeed;
+      myPaddle.position.x = Math.max(-13, myPaddle.position.x - this.paddleSpeed * dt);
       moved = true;
     }
     if (rightKey && myPaddle.position.x < 13) {
-      myPaddle.position.x += this.paddleSpeed;
+      myPaddle.position.x = Math.min(13, myPaddle.position.x + this.paddleSpeed * dt);
       moved = true;
     }
 
     // デバッグログを削除
 
     if (moved && this.socket && this.socket.readyState === WebSocket.OPEN) {
-      const message = {
-        type: "paddle_move",
-        game_id: this.gameRoom,
-        player_number: this.playerNumber,
-        position: myPaddle.position.x,
-      };
-      this.socket.send(JSON.stringify(message));
+      // 入力番号をつけて送り、サーバーの確認が来るまで保持する
+      const seq = ++this.inputSeq;
+      this.pendingInputs.push(seq);
+      if (this.socket.protocol === BINARY_SUBPROTOCOL) {
+        this.socket.send(encodePaddleMove(seq, myPaddle.position.x));
+      } else {
+        const message = {
+          type: "paddle_move",
+          game_id: this.gameRoom,
+          player_number: this.playerNumber,
+          seq: seq,
+          position: myPaddle.position.x,
+        };
+        this.socket.send(JSON.stringify(message));
+      }
     }
   }
 
@@ -564,6 +818,11 @@ export class RemoteGame extends Component {
     // アニメーションフレームをキャンセル
     this.pauseGame();
 
+    if (this.reconnectTimer) {
+      clearTimeout(this.reconnectTimer);
+      this.reconnectTimer = null;
+    }
+
     // WebSocketを閉じる
     if (this.socket && this.socket.readyState !== WebSocket.CLOSED) {
       this.socket.close();
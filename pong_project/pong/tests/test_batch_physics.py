@@ -0,0 +1,120 @@
+import uuid
+from unittest import mock, skipIf
+from django.test import SimpleTestCase, override_settings
+from pong.consumers import GameConsumer
+from pong.engine import batch as batch_module
+from pong.engine.batch import BatchPhysics, np
+from pong.engine.physics import PhysicsEngine
+from pong.engine.state import Ball, Paddle, RoomState
+
+# 2進数で正確に表せる周期にして、スカラー版とバッチ版の経過時間を一致させる
+PERIOD = 1 / 64
+
+
+def make_state(paddle_x=0.0):
+    state = RoomState(Ball(), Paddle(x=paddle_x), Paddle(x=-paddle_x))
+    state.game_started = True
+    return state
+
+
+def run_scalar(seed, paddle_x, ticks, step_rate=60):
+    """ルームごとの PhysicsEngine で進め、ゴールの記録を返す"""
+    engine = PhysicsEngine(seed=seed, step_rate=step_rate)
+    state = make_state(paddle_x)
+    engine.serve(state)
+    goals = []
+    for _ in range(ticks):
+        for scorer in engine.advance(state, PERIOD):
+            goals.append((scorer, state.ball.x))
+            engine.serve(state)
+    return goals
+
+
+@skipIf(np is None, 'numpy is not installed')
+class BatchPhysicsTestCase(SimpleTestCase):
+    def test_matches_scalar_engine(self):
+        """同じシードならルームごとのエンジンと同じ展開になることをテスト"""
+        batch = BatchPhysics(capacity=2)  # 途中で配列を拡張させる
+        rooms = {}
+        for i in range(6):
+            key = f'game_{i}'
+            # ルームごとにシミュレーションの刻み幅が違っても一致させる
+            engine = PhysicsEngine(seed=i, step_rate=120 if i % 2 else 60)
+            state = make_state(paddle_x=i - 3)
+            engine.serve(state)
+            batch.add(key, engine)
+            rooms[key] = (engine, state, [])
+
+        ticks = 64 * 20
+        for tick in range(ticks + 1):
+            batch.tick(tick * PERIOD)
+            for key, (engine, state, goals) in rooms.items():
+                for scorer in batch.exchange(key, state):
+                    goals.append((scorer, state.ball.x))
+                    engine.serve(state)
+
+        for i in range(6):
+            expected = run_scalar(i, i - 3, ticks, step_rate=120 if i % 2 else 60)
+            goals = rooms[f'game_{i}'][2]
+            # バッチ版はサーブ後の再開が1ティック遅れるので、揃っている分だけ比較する
+            count = min(len(goals), len(expected))
+            self.assertGreater(count, 1)
+            self.assertEqual(goals[:count], expected[:count])
+
+    def test_paused_rooms_do_not_move(self):
+        """止まっているルームは計算されないことをテスト"""
+        batch = BatchPhysics(capacity=4)
+        engine = PhysicsEngine(seed=1)
+        state = make_state()
+        engine.serve(state)
+        batch.add('game_a', engine)
+
+        batch.tick(0.0)
+        batch.exchange('game_a', state)
+        state.game_started = False
+        batch.exchange('game_a', state)
+        batch.tick(PERIOD * 10)
+
+        self.assertFalse(batch.active[batch.slots['game_a']])
+        self.assertEqual(state.ball.z, 0)
+
+    @override_settings(PONG_PHYSICS_BACKEND='numpy', PONG_REPLAY_DIR=None)
+    def test_reconnect_pause_stops_batch_slot(self):
+        """再接続待ちで止めたルームは配列側でも進まず、再開時に止めた位置から続くことをテスト"""
+        batch = BatchPhysics(capacity=2)
+        consumer = GameConsumer()
+        game_room = f'game_{uuid.uuid4()}'
+        with mock.patch.object(batch_module, '_batch', batch):
+            game_state = consumer.create_room(game_room, 60, 60)
+            self.addCleanup(GameConsumer.game_states.pop, game_room)
+            self.addCleanup(GameConsumer.game_players.pop, game_room)
+            game_state.game_started = True
+
+            def run(ticks, start):
+                for tick in range(start, start + ticks):
+                    batch.tick(tick * PERIOD)
+                    consumer.update_game_state(game_room, tick * PERIOD)
+
+            run(10, 0)
+            game_state.paused = True
+            run(1, 10)
+            paused_z = game_state.ball.z
+            self.assertGreater(paused_z, 0)
+            run(60, 11)
+            self.assertFalse(batch.active[batch.slots[game_room]])
+            self.assertEqual(game_state.ball.z, paused_z)
+
+            game_state.paused = False
+            run(3, 71)
+            # 1ティック目で止めた位置を読み込み、その後の2ティック (1/32秒) で1ステップだけ進む
+            self.assertAlmostEqual(game_state.ball.z, paused_z + 18.0 / 60, places=6)
+
+    def test_slots_are_reused(self):
+        """削除したルームの枠が再利用されることをテスト"""
+        batch = BatchPhysics(capacity=2)
+        batch.add('game_a', PhysicsEngine(seed=1))
+        slot = batch.add('game_b', PhysicsEngine(seed=2))
+        batch.remove('game_b')
+        self.assertEqual(batch.add('game_c', PhysicsEngine(seed=3)), slot)
+        self.assertEqual(batch.capacity, 2)
+
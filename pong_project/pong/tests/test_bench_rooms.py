@@ -0,0 +1,39 @@
+import json
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from pong.consumers import GameConsumer
+
+
+class BenchRoomsTestCase(SimpleTestCase):
+    @override_settings(PONG_REPLAY_DIR=None)
+    def test_bench_rooms_reports_json(self):
+        """ベンチマークの結果が JSON で出力され、ルームが片付けられることをテスト"""
+        out = StringIO()
+        call_command('bench_rooms', rooms=3, seconds=0.3, warmup=0.1, stdout=out)
+        result = json.loads(out.getvalue())
+
+        self.assertEqual(result['config']['rooms'], 3)
+        self.assertGreater(result['ticks'], 0)
+        self.assertGreater(result['frames_per_second'], 0)
+        self.assertEqual(set(result['tick_ms']), {'p50', 'p90', 'p99', 'max'})
+        self.assertGreater(result['rss_kb'], 0)
+        self.assertFalse([room for room in GameConsumer.game_states if room.startswith('game_00000000-')])
+
+
+class LoadTestWsTestCase(TransactionTestCase):
+    @override_settings(PONG_REPLAY_DIR=None)
+    def test_clients_match_and_play(self):
+        """負荷テストのクライアントがマッチングからゲーム開始まで進み、結果が JSON で出力されることをテスト"""
+        out = StringIO()
+        # 打ち切ったゲームは再接続を待たずに片付ける
+        with mock.patch.object(GameConsumer, 'reconnect_grace', 0):
+            call_command('loadtest_ws', clients=2, ramp=0, duration=4, stdout=out)
+        result = json.loads(out.getvalue())
+
+        self.assertEqual(result['dropped'], 0)
+        self.assertGreater(result['match_latency_ms']['max'], 0)
+        self.assertGreater(result['join_to_start_ms']['p50'], 0)
+        self.assertGreater(result['frames_per_second'], 0)
+        self.assertEqual(result['timed_out'] + result['games_ended'] * 2, 2)
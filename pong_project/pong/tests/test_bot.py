@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+from pong.engine.bot import Bot, predict_x
+from pong.engine.physics import PADDLE_Z, PhysicsEngine, move_paddle, new_paddle
+from pong.engine.state import Ball, Paddle, RoomState
+
+
+def play(difficulty1, difficulty2, seconds=60, seed=1):
+    """ボット同士をヘッドレスで対戦させ、{player_number: 得点} を返す"""
+    engine = PhysicsEngine(seed=seed)
+    state = RoomState(Ball(vx=12.0, vz=18.0), new_paddle(0.0), new_paddle(0.0))
+    bots = (Bot(1, difficulty1, seed=seed), Bot(2, difficulty2, seed=seed + 1))
+    goals = {1: 0, 2: 0}
+    for step in range(seconds * 60):
+        now = step / 60
+        for bot in bots:
+            move_paddle(state.paddle(bot.player_number), bot.think(state, now), now)
+        scorer = engine.step(state)
+        if scorer:
+            goals[scorer] += 1
+            engine.serve(state)
+    return goals
+
+
+class BotTestCase(SimpleTestCase):
+    def test_prediction_matches_physics_across_walls(self):
+        """壁で何度跳ね返っても、予測した到達位置が物理演算の結果と一致することをテスト"""
+        for vx in (-40.0, -7.5, 0.0, 13.0, 55.0):
+            state = RoomState(Ball(x=3.0, z=0.0, vx=vx, vz=-18.0), Paddle(x=100.0), Paddle(x=100.0))
+            predicted = predict_x(state.ball, -PADDLE_Z)
+            # 1秒 (60ステップ) でプレイヤー2のパドルの位置に届く
+            engine = PhysicsEngine(seed=1)
+            for _ in range(60):
+                engine.step(state)
+            self.assertAlmostEqual(state.ball.z, -PADDLE_Z)
+            self.assertAlmostEqual(predicted, state.ball.x)
+
+    def test_difficulty_changes_strength(self):
+        """難しいボットほど失点が少ないことをテスト"""
+        self.assertEqual(play('hard', 'hard'), {1: 0, 2: 0})
+        goals = play('hard', 'easy')
+        self.assertGreater(goals[1], 0)
+        self.assertEqual(goals[2], 0)
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+from unittest import mock
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+from pong.consumers import GameConsumer
+from pong.engine import checkpoint
+from pong.engine.bot import Bot
+from pong.engine.checkpoint import RoomCheckpointer, encode_batch, read_last_batch
+from pong.engine.state import Ball, Paddle, RoomState
+
+
+def make_room(score1=0, score2=0, ended=False):
+    state = RoomState(Ball(x=1.5, z=-3.25, vx=6.0, vz=18.0), Paddle(x=2.0, seq=7), Paddle(x=-4.0, seq=3))
+    state.score1, state.score2 = score1, score2
+    state.tick = 1234
+    state.game_started = True
+    state.ended = ended
+    state.tokens = {1: 'token-1', 2: 'token-2'}
+    return state
+
+
+class CheckpointTestCase(SimpleTestCase):
+    def test_last_complete_batch_is_restored(self):
+        """最後に書き終わったチェックポイントだけが読まれることをテスト"""
+        first = encode_batch([('game_a', make_room())])
+        with_bot = make_room(score1=2, score2=1)
+        with_bot.bots = {2: Bot(2, 'hard')}
+        second = encode_batch([('game_a', with_bot), ('game_b', make_room(ended=True))])
+        # 書き込みの途中で止まった3回目は読み飛ばす
+        torn = encode_batch([('game_a', make_room(score1=3))])[:-3]
+
+        rooms = read_last_batch(first + second + torn)
+
+        self.assertEqual(list(rooms), ['game_a'])  # 終了したルームは保存しない
+        state = rooms['game_a']
+        self.assertEqual((state.score1, state.score2, state.tick), (2, 1, 1234))
+        self.assertEqual((state.ball.x, state.ball.z, state.ball.vx), (1.5, -3.25, 6.0))
+        self.assertEqual((state.paddle1.x, state.paddle1.seq, state.paddle2.seq), (2.0, 7, 3))
+        self.assertEqual(state.tokens, {1: 'token-1', 2: 'token-2'})
+        self.assertEqual({player: bot.difficulty for player, bot in state.bots.items()}, {2: 'hard'})
+
+    def test_file_is_compacted(self):
+        """ファイルが大きくなったら最新の1回分だけに書き直すことをテスト"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rooms.bin')
+            data = encode_batch([('game_a', make_room())])
+            writer = RoomCheckpointer({}, path, interval=1, max_bytes=len(data) * 3)
+            for _ in range(5):
+                writer.write(data)
+            self.assertLessEqual(os.path.getsize(path), len(data) * 3)
+            with open(path, 'rb') as f:
+                self.assertIn('game_a', read_last_batch(f.read()))
+
+    async def test_resume_from_checkpoint(self):
+        """プロセスの再起動後も、再接続トークンでチェックポイントのゲームに戻れることをテスト"""
+        game_room = f'game_{uuid.uuid4()}'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rooms-{shard}.bin')
+            with open(path.format(shard=0), 'wb') as f:
+                f.write(encode_batch([(game_room, make_room(score1=2, score2=1))]))
+
+            with override_settings(PONG_CHECKPOINT_PATH=path), \
+                    mock.patch.object(checkpoint, '_restored', None), \
+                    mock.patch.object(checkpoint, '_checkpointer', None), \
+                    mock.patch.object(GameConsumer, 'reconnect_grace', 0.3):
+                communicator = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+                await communicator.connect()
+                await communicator.send_to(text_data=json.dumps({
+                    'type': 'join_game',
+                    'game_id': game_room,
+                    'player_number': 1,
+                    'resume_token': 'token-1',
+                }))
+                message = json.loads(await communicator.receive_from(timeout=5))
+                self.assertTrue(message['keyframe'])
+                self.assertEqual(message['score'], {'player1': 2, 'player2': 1})
+                # もう1人が戻るまでは止まっている
+                self.assertTrue(GameConsumer.game_states[game_room].paused)
+
+                await communicator.disconnect()
+                await asyncio.sleep(0.5)
+                self.assertNotIn(game_room, GameConsumer.game_states)
@@ -0,0 +1,643 @@
+from django.test import SimpleTestCase, override_settings
+from unittest import mock
+from channels.routing import URLRouter
+from asgiref.testing import ApplicationCommunicator
+from channels.testing import WebsocketCommunicator
+import asyncio
+import json
+import uuid
+from pong.consumers import GameConsumer
+from pong.routing import websocket_urlpatterns
+from pong.consumers import game as game_module
+from pong.consumers import shard as shard_module
+from pong.consumers.outbound import SLOW_CLIENT_CLOSE_CODE, OutboundQueue
+from pong.consumers.shard import ShardListener
+from pong.engine.results import GameResult
+from pong.engine.sharding import shard_for
+from pong.engine.state import GOAL_PAUSE, PLAYING, Ball, Paddle, RoomState
+from channels.layers import InMemoryChannelLayer
+from pong.consumers.protocol import (
+    BINARY_SUBPROTOCOL, STATE_HEADER, FRAME_STATE, FLAG_KEYFRAME, PADDLE_MOVE_FRAME, FRAME_PADDLE_MOVE,
+)
+
+
+class FakeConnection:
+    """送信内容を記録するだけの接続"""
+
+    def __init__(self, channel_name, binary=False):
+        self.channel_name = channel_name
+        self.binary = binary
+        self.sent = []
+        self.closed = []
+        self.outbound = OutboundQueue(self.send, self.close)
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.sent.append(bytes_data if self.binary else text_data)
+
+    async def close(self, code=None):
+        self.closed.append(code)
+
+    async def drain(self):
+        """送信キューが空になるまで待つ"""
+        self.outbound.start()
+        while self.outbound.items:
+            await asyncio.sleep(0)
+
+
+class GameConsumerTestCase(SimpleTestCase):
+    def setUp(self):
+        # SimpleTestCase ではデータベースを使えないので、GameOptions は読まずに既定の頻度にする
+        patcher = mock.patch.object(GameConsumer, 'load_room_rates', mock.AsyncMock(return_value=(60, 60)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # GamePlayers のないゲーム (ボットと対戦できる) として扱う
+        patcher = mock.patch.object(GameConsumer, 'room_has_players', mock.AsyncMock(return_value=False))
+        self.room_has_players = patcher.start()
+        self.addCleanup(patcher.stop)
+        # 再接続の猶予期間は専用のテスト以外では使わない (切断したらすぐ終了)
+        patcher = mock.patch.object(GameConsumer, 'reconnect_grace', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect_players(self, game_room=None):
+        """2人のプレイヤーを接続してゲームに参加させる"""
+        game_room = game_room or f'game_{uuid.uuid4()}'
+        players = []
+        for player_number in (1, 2):
+            communicator = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'join_game',
+                'game_id': game_room,
+                'player_number': player_number,
+            }))
+            players.append(communicator)
+        return game_room, players
+
+    async def receive_event(self, communicator, event, timeout=5):
+        """指定したイベントを受信するまで待つ"""
+        while True:
+            message = json.loads(await communicator.receive_from(timeout=timeout))
+            if message.get('event') == event:
+                return message
+
+    async def disconnect_all(self, players):
+        for communicator in players:
+            await communicator.disconnect()
+
+    async def test_state_frame_encoded_once_per_room(self):
+        """ゲーム状態が接続数に関係なくルームごとに1回だけエンコードされることをテスト"""
+        game_room = f'game_{uuid.uuid4()}'
+        consumer = GameConsumer()
+        consumer.channel_layer = InMemoryChannelLayer()
+        connections = {f'channel_{i}': FakeConnection(f'channel_{i}') for i in range(5)}
+        GameConsumer.game_states[game_room] = RoomState(Ball(x=1.0, z=2.0, vz=18.0), Paddle(), Paddle())
+        GameConsumer.game_connections[game_room] = connections
+
+        try:
+            with mock.patch.object(game_module, 'encode_state_text', wraps=game_module.encode_state_text) as encode:
+                await consumer.send_game_state(game_room)
+            self.assertEqual(encode.call_count, 1)
+            for connection in connections.values():
+                await connection.drain()
+        finally:
+            del GameConsumer.game_states[game_room]
+            del GameConsumer.game_connections[game_room]
+
+        sent = [connection.sent for connection in connections.values()]
+        self.assertEqual(len(sent[0]), 1)
+        self.assertTrue(all(texts == sent[0] for texts in sent))
+        self.assertEqual(json.loads(sent[0][0])['event'], 'game_state_update')
+
+    async def test_state_frame_through_channel_layer(self):
+        """ローカル配信が使えない場合は channel layer 経由で届くことをテスト"""
+        with mock.patch.object(GameConsumer, 'is_local_fanout', return_value=False):
+            game_room, players = await self.connect_players()
+            for communicator in players:
+                frame = await self.receive_event(communicator, 'game_state_update')
+                self.assertIn('ball', frame)
+                self.assertIn('score', frame)
+            await self.disconnect_all(players)
+
+    async def test_binary_subprotocol(self):
+        """バイナリ形式のサブプロトコルを選んだクライアントとの送受信をテスト"""
+        game_room = f'game_{uuid.uuid4()}'
+        binary = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/', subprotocols=[BINARY_SUBPROTOCOL])
+        connected, subprotocol = await binary.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, BINARY_SUBPROTOCOL)
+
+        text = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+        await text.connect()
+
+        for player_number, communicator in ((1, binary), (2, text)):
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'join_game',
+                'game_id': game_room,
+                'player_number': player_number,
+            }))
+        await self.receive_event(text, 'game_start')
+
+        # 参加時のキーフレームを含め、ゲーム状態はバイナリで届く
+        while True:
+            response = await binary.receive_output(timeout=5)
+            if 'bytes' in response and response['bytes'] is not None:
+                break
+        frame_type, _, _, mask = STATE_HEADER.unpack_from(response['bytes'])
+        self.assertEqual(frame_type, FRAME_STATE)
+        self.assertTrue(mask & FLAG_KEYFRAME)
+
+        # バイナリのパドル移動は JSON のクライアントにもゲーム状態として届く
+        await binary.send_to(bytes_data=PADDLE_MOVE_FRAME.pack(FRAME_PADDLE_MOVE, 1, 350))
+        while True:
+            message = await self.receive_event(text, 'game_state_update')
+            if 'paddles' in message and message['paddles']['player1'] == 3.5:
+                break
+
+        await self.disconnect_all([binary, text])
+
+    async def test_delta_snapshots(self):
+        """参加時はキーフレーム、その後は変化した項目だけが送られることをテスト"""
+        game_room, players = await self.connect_players()
+
+        keyframe = await self.receive_event(players[0], 'game_state_update')
+        self.assertTrue(keyframe['keyframe'])
+        self.assertIn('score', keyframe)
+
+        await self.receive_event(players[0], 'game_start')
+        delta = await self.receive_event(players[0], 'game_state_update')
+        self.assertNotIn('keyframe', delta)
+        self.assertIn('ball', delta)
+        # スコアはゴールがなければ送られない
+        self.assertNotIn('score', delta)
+
+        # 再同期を要求すると、その接続にだけキーフレームが送られる
+        await players[0].send_to(text_data=json.dumps({'type': 'request_keyframe'}))
+        while True:
+            message = await self.receive_event(players[0], 'game_state_update')
+            if message.get('keyframe'):
+                break
+        self.assertEqual(message['score'], {'player1': 0, 'player2': 0})
+
+        await self.disconnect_all(players)
+
+    async def test_paddle_inputs_are_coalesced_into_tick(self):
+        """パドル入力は即座に中継されず、次のティックのゲーム状態にまとめて載ることをテスト"""
+        game_room, players = await self.connect_players()
+        await self.receive_event(players[1], 'game_start')
+
+        with mock.patch.object(GameConsumer, 'input_rate_limit', 1000):
+            for seq, position in enumerate((1.0, 2.0, 3.0), start=1):
+                await players[0].send_to(text_data=json.dumps({'type': 'paddle_move', 'seq': seq, 'position': position}))
+
+        # 個別の paddle_move は届かず、最後の位置がゲーム状態で届く
+        while True:
+            message = json.loads(await players[1].receive_from(timeout=5))
+            self.assertNotEqual(message.get('event'), 'paddle_move')
+            if message.get('paddles', {}).get('player1') == 3.0:
+                break
+
+        # 最後に処理した入力番号がゲーム状態に載る
+        self.assertEqual(message['acks']['player1'], 3)
+        self.assertIn('tick', message)
+
+        await self.disconnect_all(players)
+
+    def test_paddle_reaches_target_after_stall(self):
+        """通信が止まった後の大きな入力も、届かなかった分はティックごとに近づいて目標位置に着くことをテスト"""
+        consumer = GameConsumer()
+        game_state = RoomState(Ball(), game_module.new_paddle(0.0), game_module.new_paddle(0.0))
+        game_state.set_input(1, 1, 0.5)
+        consumer.apply_inputs(game_state, 0.0)
+
+        # 2秒止まってから、遠くの位置への入力が1つだけ届く (1回で動けるのは持ち越せる移動量まで)
+        game_state.set_input(1, 2, 10.2)
+        consumer.apply_inputs(game_state, 2.0)
+        self.assertLess(game_state.paddle1.x, 10.2)
+        now = 2.0
+        for tick in range(60):
+            now += 1 / 60
+            consumer.apply_inputs(game_state, now)
+        self.assertEqual(game_state.paddle1.x, 10.2)
+        self.assertIsNone(game_state.paddle1.target)
+        self.assertEqual(game_state.paddle1.seq, 2)
+
+    async def test_interrupt_is_not_echoed_to_sender(self):
+        """中断の通知は中断したプレイヤーには送られず、相手にだけ届くことをテスト"""
+        game_room, players = await self.connect_players()
+        await self.receive_event(players[0], 'session')
+        await players[0].send_to(text_data=json.dumps({'type': 'game_interrupted', 'reason': 'leave'}))
+
+        message = await self.receive_event(players[1], 'game_interrupted')
+        self.assertEqual((message['player_number'], message['reason']), (1, 'leave'))
+        events = []
+        while not await players[0].receive_nothing(timeout=0.2):
+            events.append(json.loads(await players[0].receive_from()).get('event'))
+        self.assertNotIn('game_interrupted', events)
+        await self.disconnect_all(players)
+
+    async def test_disconnect_before_outbound_is_started(self):
+        """送信キューを作る前に接続が失敗しても、切断の処理がエラーにならないことをテスト"""
+        consumer = GameConsumer()
+        consumer.game_room = None
+        await consumer.disconnect(1006)
+
+    async def test_input_rate_cap(self):
+        """接続ごとのパドル入力数に上限があることをテスト"""
+        with mock.patch.object(GameConsumer, 'input_rate_limit', 5):
+            game_room, players = await self.connect_players()
+            await self.receive_event(players[0], 'game_state_update')  # 参加時のキーフレーム
+            for position in range(20):
+                await players[0].send_to(text_data=json.dumps({'type': 'paddle_move', 'position': position}))
+            # 応答が返れば、それまでの入力は処理済み
+            await players[0].send_to(text_data=json.dumps({'type': 'request_keyframe'}))
+            message = await self.receive_event(players[0], 'game_state_update')
+            while not message.get('keyframe'):
+                message = await self.receive_event(players[0], 'game_state_update')
+
+            # 上限の5回目までの入力だけが受け付けられている
+            self.assertEqual(GameConsumer.game_states[game_room].input1, (0, 4.0))
+            await self.disconnect_all(players)
+
+    async def test_slow_client_gets_newest_frame_and_all_events(self):
+        """受信が遅れた接続では古いゲーム状態が捨てられ、イベントは捨てられず、遅れ続ければ切断されることをテスト"""
+        connection = FakeConnection('slow')
+        outbound = connection.outbound = OutboundQueue(connection.send, connection.close, limit=3, max_lag=60)
+        outbound.put_frame(text='keyframe-1', keyframe=True)
+        outbound.put_frame(text='delta-2')
+        outbound.put_event('player_joined')
+        outbound.put_frame(text='delta-3')
+        outbound.put_frame(text='delta-4')
+        outbound.put_event('game_end')
+        await connection.drain()
+        self.assertEqual(connection.sent, ['keyframe-1', 'player_joined', 'delta-4', 'game_end'])
+        self.assertEqual(outbound.dropped, 2)
+
+        # 送信が止まったまま max_lag を過ぎたら、残りを送らずに切断する
+        outbound.stop()
+        connection.outbound = outbound = OutboundQueue(connection.send, connection.close, limit=2, max_lag=0.01)
+        outbound.task = asyncio.get_running_loop().create_future()  # 送信中で止まっている
+        outbound.put_frame(text='delta-5')
+        outbound.put_event('spectator_count')
+        await asyncio.sleep(0.02)
+        outbound.put_frame(text='delta-6')
+        # 接続の切断処理で送信キューが止められても、切断のコードは送る
+        outbound.stop()
+        await asyncio.sleep(0)
+        self.assertEqual(connection.closed, [SLOW_CLIENT_CLOSE_CODE])
+        self.assertEqual(len(connection.sent), 4)
+
+    def test_snapshot_rate_is_decoupled_from_tick_rate(self):
+        """送信頻度はティックレートと別に決まり、負荷が高いときは下がることをテスト"""
+        consumer = GameConsumer()
+        scheduler = game_module.get_scheduler()
+        game_state = RoomState(Ball(), Paddle(), Paddle(), snapshot_rate=20)
+
+        with mock.patch.object(scheduler, 'rate', 60), mock.patch.object(scheduler.stats, 'avg_budget', 0.0):
+            self.assertEqual(consumer.snapshot_interval(game_state), 3)
+            self.assertEqual(game_state.send_rate, 20)
+
+            game_state.snapshot_rate = 60
+            self.assertEqual(consumer.snapshot_interval(game_state), 1)
+
+            # 負荷が高いときは半分の頻度にする
+            scheduler.stats.avg_budget = 0.95
+            self.assertEqual(consumer.snapshot_interval(game_state), 2)
+            self.assertEqual(game_state.send_rate, 30)
+
+    async def test_countdown_is_sent_before_game_start(self):
+        """2人揃うとカウントダウンがティックごとに進み、残り秒数のイベントの後に開始することをテスト"""
+        with mock.patch.object(GameConsumer, 'countdown_seconds', 2):
+            game_room, players = await self.connect_players()
+            events = []
+            while not events or events[-1] != 'game_start':
+                message = json.loads(await players[1].receive_from(timeout=5))
+                if message['event'] in ('countdown', 'game_start'):
+                    events.append(message['event'] if message['event'] == 'game_start' else message['seconds'])
+            self.assertEqual(events, [2, 1, 'game_start'])
+            self.assertEqual(GameConsumer.game_states[game_room].phase, PLAYING)
+            await self.disconnect_all(players)
+
+    async def test_single_player_starts_against_bot(self):
+        """ボットとの対戦を指定すると1人でもゲームが始まり、ボットのパドルがティックで動くことをテスト"""
+        game_room = f'game_{uuid.uuid4()}'
+        with mock.patch.object(GameConsumer, 'countdown_seconds', 1):
+            communicator = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'join_game',
+                'game_id': game_room,
+                'player_number': 1,
+                'opponent': 'bot',
+                'difficulty': 'hard',
+            }))
+            await self.receive_event(communicator, 'game_start')
+
+            game_state = GameConsumer.game_states[game_room]
+            self.assertEqual(list(GameConsumer.game_players[game_room].values()), [1])
+            self.assertEqual(game_state.bots[2].difficulty, 'hard')
+            # ボールをボットの側へ向かわせると、到達位置へパドルを動かす
+            game_state.ball.vz = -game_state.ball.vz
+            game_state.ball.x = 10.0
+            while game_state.paddle2.x == 0.0:
+                await asyncio.sleep(0.01)
+            self.assertGreater(game_state.paddle2.x, 0.0)
+            await communicator.disconnect()
+
+    async def join(self, game_room, player_number, **fields):
+        """1人のプレイヤーを接続してゲームに参加させる"""
+        communicator = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_to(text_data=json.dumps({
+            'type': 'join_game', 'game_id': game_room, 'player_number': player_number, **fields,
+        }))
+        return communicator
+
+    async def test_bot_is_refused_in_matched_rooms_and_bot_slots(self):
+        """対戦相手が決まっているルームにはボットを入れず、ボットの側には人が参加できないことをテスト"""
+        # GamePlayers が登録されたゲームではボットとの対戦を断る
+        game_room = f'game_{uuid.uuid4()}'
+        self.room_has_players.return_value = True
+        rejected = await self.join(game_room, 1, opponent='bot', difficulty='easy')
+        message = await self.receive_event(rejected, 'join_rejected')
+        self.assertEqual(message['reason'], 'bot_not_allowed')
+        self.assertEqual((await rejected.receive_output(timeout=1))['type'], 'websocket.close')
+        self.assertNotIn(game_room, GameConsumer.game_states)
+        await rejected.disconnect()
+
+        # 他のプレイヤーが参加済みのルームでも断る
+        player2 = await self.join(game_room, 2)
+        await self.receive_event(player2, 'player_joined')
+        rejected = await self.join(game_room, 1, opponent='bot')
+        self.assertEqual((await self.receive_event(rejected, 'join_rejected'))['reason'], 'bot_not_allowed')
+        self.assertIsNone(GameConsumer.game_states[game_room].bots)
+        await rejected.disconnect()
+        await player2.disconnect()
+
+        # ボットが入っている側に人が参加しても、ボットの対戦はそのまま続く
+        game_room = f'game_{uuid.uuid4()}'
+        self.room_has_players.return_value = False
+        player1 = await self.join(game_room, 1, opponent='bot')
+        await self.receive_event(player1, 'player_joined')
+        intruder = await self.join(game_room, 2)
+        self.assertEqual((await self.receive_event(intruder, 'join_rejected'))['reason'], 'bot_slot')
+        self.assertEqual((await intruder.receive_output(timeout=1))['type'], 'websocket.close')
+        await intruder.disconnect()
+        await asyncio.sleep(0.05)
+        game_state = GameConsumer.game_states[game_room]
+        self.assertEqual(list(GameConsumer.game_players[game_room].values()), [1])
+        self.assertIn(2, game_state.bots)
+        self.assertFalse(game_state.ended)
+        await player1.disconnect()
+
+    def test_goal_pause_resumes_on_tick_clock(self):
+        """ゴール後の停止はタスクを作らず、ティック数だけ経つと対戦に戻ることをテスト"""
+        consumer = GameConsumer()
+        scheduler = game_module.get_scheduler()
+        game_room = f'game_{uuid.uuid4()}'
+        game_state = RoomState(Ball(), Paddle(), Paddle(), physics=game_module.PhysicsEngine())
+        GameConsumer.game_states[game_room] = game_state
+        self.addCleanup(GameConsumer.game_states.pop, game_room)
+
+        with mock.patch.object(scheduler, 'rate', 60), mock.patch.object(game_module.asyncio, 'create_task') as create_task:
+            consumer.reset_ball(game_room)
+            self.assertEqual((game_state.phase, game_state.phase_ticks), (GOAL_PAUSE, 60))
+            for tick in range(59):
+                consumer.advance_phase(game_room, game_state, tick)
+            self.assertEqual(game_state.phase, GOAL_PAUSE)
+            consumer.advance_phase(game_room, game_state, 59.0)
+        create_task.assert_not_called()
+        self.assertEqual(game_state.phase, PLAYING)
+        self.assertEqual(game_state.last_update, 59.0)
+        # ゴール後の再開ではイベントを送らない
+        self.assertEqual(game_state.events, [])
+
+    async def test_game_end_task_is_tracked_and_failures_logged(self):
+        """終了処理のタスクは終わるまで参照され、失敗はログに残ることをテスト"""
+        consumer = GameConsumer()
+        game_room = f'game_{uuid.uuid4()}'
+        game_state = RoomState(Ball(), Paddle(), Paddle(), physics=game_module.PhysicsEngine())
+        game_state.score1 = 3
+        GameConsumer.game_states[game_room] = game_state
+        self.addCleanup(GameConsumer.game_states.pop, game_room)
+
+        failing = mock.AsyncMock(side_effect=RuntimeError('database is down'))
+        with mock.patch.object(GameConsumer, 'send_game_end', failing), \
+                self.assertLogs('pong.game', 'ERROR') as logs:
+            consumer.check_for_winner(game_room)
+            self.assertTrue(game_state.ended)
+            task = GameConsumer.end_tasks[game_room]
+            await asyncio.wait([task])
+            await asyncio.sleep(0)
+        failing.assert_awaited_once_with(game_room, GameResult(game_room.replace('game_', ''), 3, 0, 1), None)
+        self.assertNotIn(game_room, GameConsumer.end_tasks)
+        self.assertIn('Error ending game', logs.output[0])
+        self.assertIn('database is down', logs.output[0])
+
+    async def test_game_end_survives_room_cleanup(self):
+        """終了処理の前にルームが片付けられても、結果の保存と通知が行われることをテスト"""
+        consumer = GameConsumer()
+        game_room = f'game_{uuid.uuid4()}'
+        game_state = RoomState(Ball(), Paddle(), Paddle(), physics=game_module.PhysicsEngine())
+        game_state.score1, game_state.score2 = 1, 3
+        GameConsumer.game_states[game_room] = game_state
+
+        writer = mock.Mock(submit=mock.AsyncMock())
+        with mock.patch.object(game_module, 'get_result_writer', return_value=writer), \
+                mock.patch.object(GameConsumer, 'broadcast', mock.AsyncMock()) as broadcast:
+            consumer.check_for_winner(game_room)
+            task = GameConsumer.end_tasks[game_room]
+            # 最後のプレイヤーが切断してルームが片付けられた
+            consumer.cleanup_room(game_room)
+            self.assertNotIn(game_room, GameConsumer.game_states)
+            await task
+        writer.submit.assert_awaited_once_with(GameResult(game_room.replace('game_', ''), 1, 3, 2))
+        event = broadcast.await_args.args[1]
+        self.assertEqual((event['winner'], event['score']), (2, {'player1': 1, 'player2': 3}))
+
+    @override_settings(PONG_SHARD_COUNT=2, PONG_SHARD_INDEX=0)
+    async def test_room_is_owned_by_its_shard(self):
+        """担当が別のワーカーのルームへの操作は、そのワーカーに転送されることをテスト"""
+        game_room = next(room for room in (f'game_{uuid.uuid4()}' for _ in range(100)) if shard_for(room) == 1)
+        game_room, players = await self.connect_players(game_room)
+
+        # 担当のワーカー (シャード1) が動いていなければ、このワーカーにルームは作られない
+        await players[0].send_to(text_data=json.dumps({'type': 'request_keyframe'}))
+        self.assertTrue(await players[0].receive_nothing(timeout=0.2))
+        self.assertNotIn(game_room, GameConsumer.game_states)
+
+        # シャード1が転送された参加・入力を処理し、結果がグループ経由で届く
+        listener = ShardListener(1).start()
+        try:
+            message = await self.receive_event(players[0], 'game_state_update')
+            self.assertTrue(message['keyframe'])
+            while (await self.receive_event(players[1], 'player_joined'))['player_number'] != 2:
+                pass
+            self.assertEqual(len(GameConsumer.game_players[game_room]), 2)
+
+            await players[1].send_to(text_data=json.dumps({'type': 'paddle_move', 'seq': 1, 'position': 2.0}))
+            await players[1].send_to(text_data=json.dumps({'type': 'request_keyframe'}))
+            while True:
+                message = await self.receive_event(players[1], 'game_state_update')
+                if message.get('keyframe') and message['acks']['player2'] == 0:
+                    # 入力は次のティックで反映されるので、バッファに入っていればよい
+                    self.assertEqual(GameConsumer.game_states[game_room].input2, (1, 2.0))
+                    break
+
+            await self.disconnect_all(players)
+            await players[0].wait(timeout=0.1)
+        finally:
+            listener.stop()
+            if shard_module._listener is not None:
+                shard_module._listener.stop()
+        self.assertNotIn(game_room, GameConsumer.game_states)
+
+    @override_settings(PONG_SHARD_COUNT=2, PONG_SHARD_INDEX=1)
+    async def test_shard_listener_starts_with_server(self):
+        """接続を受け付ける前から、サーバーの起動時に担当シャードの受信が始まることをテスト"""
+        patcher = mock.patch.object(shard_module, '_listener', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # daphne: reactor のループが動き始めたら開始する
+        reactor = mock.Mock()
+        with mock.patch.dict('sys.modules', {'twisted.internet.reactor': reactor}):
+            shard_module.start_with_server()
+        delay, start = reactor.callLater.call_args.args
+        self.assertEqual(delay, 0)
+        listener = start()
+        self.assertEqual(listener.channel, 'pong.shard.1')
+        self.assertFalse(listener._task.done())
+        listener.stop()
+
+        # lifespan を送るサーバー
+        lifespan = ApplicationCommunicator(shard_module.lifespan, {'type': 'lifespan'})
+        await lifespan.send_input({'type': 'lifespan.startup'})
+        self.assertEqual(await lifespan.receive_output(), {'type': 'lifespan.startup.complete'})
+        self.assertFalse(shard_module._listener._task.done())
+        await lifespan.send_input({'type': 'lifespan.shutdown'})
+        self.assertEqual(await lifespan.receive_output(), {'type': 'lifespan.shutdown.complete'})
+        self.assertIsNone(shard_module._listener._task)
+
+    async def test_shard_join_tasks_are_tracked(self):
+        """転送された参加のタスクは終わるまで参照され、終わったら外れることをテスト"""
+        layer = InMemoryChannelLayer()
+        listener = ShardListener(1, channel_layer=layer)
+        release = asyncio.Event()
+
+        async def room_join(message):
+            await release.wait()
+
+        listener.owner.room_join = room_join
+        listener.start()
+        try:
+            await layer.send(listener.channel, {'type': 'room.join', 'game_room': 'game_x'})
+            while not listener.joins:
+                await asyncio.sleep(0.01)
+            task, = listener.joins
+            release.set()
+            await task
+            await asyncio.sleep(0)
+            self.assertEqual(listener.joins, set())
+        finally:
+            listener.stop()
+
+    async def test_reconnect_within_grace_period(self):
+        """切断しても猶予期間内ならトークンで再接続でき、過ぎたらゲームが終了することをテスト"""
+        with mock.patch.object(GameConsumer, 'reconnect_grace', 0.5):
+            game_room, players = await self.connect_players()
+            session = await self.receive_event(players[0], 'session')
+            await self.receive_event(players[1], 'game_start')
+
+            # 切断しても中断されず、物理演算が止まる
+            await players[0].disconnect()
+            message = await self.receive_event(players[1], 'player_disconnected')
+            self.assertEqual(message['player_number'], 1)
+            self.assertTrue(GameConsumer.game_states[game_room].paused)
+
+            # トークンを付けて参加し直すとキーフレームが届き、ゲームが再開する
+            rejoined = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+            await rejoined.connect()
+            await rejoined.send_to(text_data=json.dumps({
+                'type': 'join_game',
+                'game_id': game_room,
+                'player_number': 1,
+                'resume_token': session['resume_token'],
+            }))
+            message = await self.receive_event(rejoined, 'game_state_update')
+            self.assertTrue(message['keyframe'])
+            await self.receive_event(players[1], 'player_reconnected')
+            self.assertFalse(GameConsumer.game_states[game_room].paused)
+
+            # 猶予期間を過ぎても戻らなければ中断される
+            await rejoined.disconnect()
+            message = await self.receive_event(players[1], 'game_interrupted')
+            self.assertEqual(message['reason'], 'disconnect')
+
+            await players[1].disconnect()
+            self.assertNotIn(game_room, GameConsumer.game_states)
+
+    async def test_hold_only_started_rooms_and_rejoin_without_token(self):
+        """始まっていないルームは再接続を待たず、トークンなしで参加し直しても再接続待ちが終わることをテスト"""
+        with mock.patch.object(GameConsumer, 'reconnect_grace', 5):
+            alone = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+            await alone.connect()
+            waiting_room = f'game_{uuid.uuid4()}'
+            await alone.send_to(text_data=json.dumps({'type': 'join_game', 'game_id': waiting_room, 'player_number': 1}))
+            await self.receive_event(alone, 'session')
+            await alone.disconnect()
+            self.assertNotIn(waiting_room, GameConsumer.game_states)
+
+            game_room, players = await self.connect_players()
+            await self.receive_event(players[1], 'countdown')
+            await players[0].disconnect()
+            await self.receive_event(players[1], 'player_disconnected')
+            game_state = GameConsumer.game_states[game_room]
+            self.assertTrue(game_state.paused)
+
+            rejoined = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/pong/game/')
+            await rejoined.connect()
+            await rejoined.send_to(text_data=json.dumps({'type': 'join_game', 'game_id': game_room, 'player_number': 1}))
+            message = await self.receive_event(players[1], 'player_reconnected')
+            self.assertEqual(message['player_number'], 1)
+            self.assertFalse(game_state.paused)
+            self.assertEqual(game_state.away, {})
+            await self.disconnect_all([rejoined, players[1]])
+
+    async def test_spectators_are_read_only_and_capped(self):
+        """観戦者は低頻度のキーフレームだけを受け取り、操作できず、人数に上限があることをテスト"""
+        game_room, players = await self.connect_players()
+        await self.receive_event(players[1], 'game_start')
+        game_id = game_room.replace('game_', '')
+
+        with mock.patch.object(GameConsumer, 'spectator_limit', 1):
+            spectator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/pong/spectate/{game_id}/')
+            connected, _ = await spectator.connect()
+            self.assertTrue(connected)
+            message = await self.receive_event(spectator, 'spectator_count')
+            self.assertEqual(message['spectators'], 1)
+            message = await self.receive_event(players[0], 'spectator_count')
+            self.assertEqual(message['spectators'], 1)
+
+            # 観戦者からのパドル操作は無視される
+            await spectator.send_to(text_data=json.dumps({'type': 'paddle_move', 'seq': 1, 'position': 5.0}))
+            message = await self.receive_event(spectator, 'game_state_update')
+            self.assertTrue(message['keyframe'])
+            self.assertIsNone(GameConsumer.game_states[game_room].input1)
+            # 60Hz のティックに対して15Hz で送る
+            self.assertEqual(GameConsumer().spectator_interval(), 4)
+
+            # 上限を超えた観戦者は断られる
+            rejected = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/pong/spectate/{game_id}/')
+            await rejected.connect()
+            message = await self.receive_event(rejected, 'spectate_rejected')
+            self.assertEqual(message['reason'], 'full')
+            self.assertEqual((await rejected.receive_output(timeout=1))['type'], 'websocket.close')
+
+            await spectator.disconnect()
+            message = await self.receive_event(players[0], 'spectator_count')
+            self.assertEqual(message['spectators'], 0)
+
+        await self.disconnect_all(players)
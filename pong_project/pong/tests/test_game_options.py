@@ -44,7 +44,8 @@ class GameOptionsTestCase(TestCase):
             json.dumps({
                 'game_id': game_id,
                 'ball_count': 2,
-                'ball_speed': 'fast'
+                'ball_speed': 'fast',
+                'snapshot_rate': 30
             }),
             content_type='application/json'
         )
@@ -52,6 +53,8 @@ class GameOptionsTestCase(TestCase):
         data = json.loads(response.content)
         self.assertEqual(data['ball_count'], 2)
         self.assertEqual(data['ball_speed'], 'fast')
+        self.assertEqual(data['simulation_rate'], 60)
+        self.assertEqual(data['snapshot_rate'], 30)
         
         # ゲームオプション取得
         response = self.client.get(f'{self.get_game_options_url}?game_id={game_id}')
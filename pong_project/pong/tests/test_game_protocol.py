@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase
+import json
+from pong.consumers.protocol import (
+    STATE_HEADER, BALL_SECTION, SCORE_SECTION, FRAME_STATE, FIELD_BALL, FIELD_SCORE, FLAG_KEYFRAME,
+    PADDLE_MOVE_FRAME, FRAME_PADDLE_MOVE, POSITION_SCALE,
+    encode_game_message, encode_state_frame, encode_state_text, decode_client_frame,
+)
+
+
+class GameProtocolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.ball = {'x': 3.14159, 'y': 1, 'z': -12.5, 'velocity': {'x': -7.25, 'y': 0, 'z': 18.0}}
+        self.score = {'player1': 2, 'player2': 1}
+
+    def test_keyframe_round_trip(self):
+        """キーフレームが量子化された値で復元できることをテスト"""
+        frame = encode_state_frame(42, 7, {'ball': self.ball, 'score': self.score}, keyframe=True)
+        frame_type, seq, tick, mask = STATE_HEADER.unpack_from(frame)
+        x, y, z, vx, vz = BALL_SECTION.unpack_from(frame, STATE_HEADER.size)
+        score1, score2 = SCORE_SECTION.unpack_from(frame, STATE_HEADER.size + BALL_SECTION.size)
+
+        self.assertEqual(frame_type, FRAME_STATE)
+        self.assertEqual(seq, 42)
+        self.assertEqual(tick, 7)
+        self.assertEqual(mask, FLAG_KEYFRAME | FIELD_BALL | FIELD_SCORE)
+        self.assertAlmostEqual(x / POSITION_SCALE, 3.14, places=2)
+        self.assertEqual(y / POSITION_SCALE, 1)
+        self.assertEqual(z / POSITION_SCALE, -12.5)
+        self.assertEqual(vx / POSITION_SCALE, -7.25)
+        self.assertEqual(vz / POSITION_SCALE, 18.0)
+        self.assertEqual((score1, score2), (2, 1))
+
+    def test_delta_contains_only_changed_fields(self):
+        """差分フレームには変化した項目だけが含まれることをテスト"""
+        frame = encode_state_frame(43, 8, {'ball': self.ball})
+        _, _, _, mask = STATE_HEADER.unpack_from(frame)
+        self.assertEqual(mask, FIELD_BALL)
+        self.assertEqual(len(frame), STATE_HEADER.size + BALL_SECTION.size)
+
+        message = json.loads(encode_state_text(43, 8, {'ball': self.ball}))
+        self.assertEqual(set(message), {'type', 'event', 'seq', 'tick', 'ball'})
+
+    def test_state_frame_is_much_smaller_than_json(self):
+        """バイナリフレームが JSON よりはるかに小さいことをテスト"""
+        fields = {'ball': self.ball, 'score': self.score}
+        frame = encode_state_frame(1, 1, fields, keyframe=True)
+        text = encode_state_text(1, 1, fields, keyframe=True)
+        self.assertLess(len(frame) * 5, len(text.encode()))
+
+    def test_decode_paddle_move(self):
+        """クライアントからのパドル移動フレームをデコードできることをテスト"""
+        data = decode_client_frame(PADDLE_MOVE_FRAME.pack(FRAME_PADDLE_MOVE, 9, -1250))
+        self.assertEqual(data, {'type': 'paddle_move', 'seq': 9, 'position': -12.5})
+
+        with self.assertRaises(ValueError):
+            decode_client_frame(b'\xff\x00\x00')
+
+    def test_json_message_omits_empty_fields(self):
+        """JSON メッセージに None の項目が含まれないことをテスト"""
+        message = json.loads(encode_game_message({'event': 'game_start', 'winner': None}))
+        self.assertEqual(message, {'type': 'game_message', 'event': 'game_start'})
@@ -0,0 +1,51 @@
+import logging
+from io import StringIO
+from django.test import SimpleTestCase
+from pong.utils.log import QueueStreamHandler, SamplingFilter, StructuredFormatter
+
+
+def make_record(msg, args=(), name='pong.game', **extra):
+    record = logging.LogRecord(name, logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class LoggingTestCase(SimpleTestCase):
+    def test_formatter_writes_logfmt_with_extra_fields(self):
+        """ログが key=value 形式になり、extra の項目も出力されることをテスト"""
+        line = StructuredFormatter().format(make_record('Player %s scored', (1,), room='game_1'))
+
+        self.assertIn('level=info logger=pong.game msg="Player 1 scored" room=game_1', line)
+
+    def test_sampling_filter_limits_each_message(self):
+        """同じメッセージだけが間引かれ、間引いた件数が次のレコードに付くことをテスト"""
+        sampling = SamplingFilter(rate=0.001, burst=2)
+        passed = [sampling.filter(make_record('Received %s', ('join_game',))) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        # 書式が違うメッセージは別に数える
+        self.assertTrue(sampling.filter(make_record('Starting game')))
+
+        bucket = sampling.buckets[('pong.game', 'Received %s')]
+        bucket.tokens = 1
+        record = make_record('Received %s', ('leave_game',))
+        self.assertTrue(sampling.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+    def test_queue_handler_writes_from_listener_thread(self):
+        """キューに入れたレコードが別スレッドで書き込まれ、引数の値はその時点のものになることをテスト"""
+        stream = StringIO()
+        handler = QueueStreamHandler(stream)
+        handler.setFormatter(StructuredFormatter())
+        logger = logging.getLogger('pong.tests.queue')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            state = {'score': 1}
+            logger.warning('State %s', state)
+            state['score'] = 2
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        self.assertIn("msg=\"State {'score': 1}\"", stream.getvalue())
+        self.assertEqual(handler.dropped, 0)
@@ -0,0 +1,82 @@
+import json
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase
+from pong.consumers.matchmaking import MatchmakingConsumer
+from pong.engine.rating import RatingQueue, elo_update
+
+User = get_user_model()
+
+
+class RatingQueueTestCase(SimpleTestCase):
+    def test_closest_rating_is_matched(self):
+        """待っている中で最もレーティングの近い相手と対戦し、差が大きすぎれば待つことをテスト"""
+        queue = RatingQueue(window=100, growth=50, widen_interval=5, max_window=300)
+        for index, rating in enumerate(range(0, 20000, 200)):
+            self.assertEqual(queue.match(rating, f'player{index}', now=0.0), (None, index + 1))
+
+        opponent, ticket = queue.match(1230, 'newcomer', now=1.0)
+        self.assertEqual((opponent, ticket), ('player6', None))  # 1200
+        self.assertEqual(len(queue), 99)
+        # 両隣 (1000 と 1400) は差が 100 を超えるので待つ
+        opponent, ticket = queue.match(1250, 'late', now=1.0)
+        self.assertIsNone(opponent)
+        queue.remove(ticket)
+        self.assertEqual(len(queue), 99)
+
+    def test_window_widens_with_wait_time(self):
+        """待ち時間が延びると許容する差が広がり、待っていた2人が対戦することをテスト"""
+        queue = RatingQueue(window=100, growth=50, widen_interval=5, max_window=300)
+        queue.match(1000, 'first', now=0.0)
+        queue.match(1180, 'second', now=2.0)
+
+        self.assertEqual(queue.widen(5.0), [])  # 差は 150 まで
+        self.assertEqual(queue.next_widen(), 7.0)
+        self.assertEqual(queue.widen(10.0), [('first', 'second')])  # 差は 200 まで
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.next_widen())
+
+    def test_elo_update(self):
+        """番狂わせほどレーティングが大きく動き、合計は変わらないことをテスト"""
+        self.assertEqual(elo_update(1000, 1000, 1), (1016, 984))
+        upset = elo_update(1000, 1400, 1)
+        self.assertEqual(sum(upset), 2400)
+        self.assertGreater(upset[0] - 1000, 16)
+
+
+class MatchmakingConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, MatchmakingConsumer, 'waiting_players', MatchmakingConsumer.waiting_players)
+        MatchmakingConsumer.waiting_players = RatingQueue(window=100, growth=50, widen_interval=60, max_window=300)
+
+    async def request_match(self, username, rating):
+        user = await sync_to_async(User.objects.create_user)(
+            username=username, email=f'{username}@example.com', password='testpassword123', rating=rating
+        )
+        communicator = WebsocketCommunicator(MatchmakingConsumer.as_asgi(), '/ws/pong/matchmaking/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_to(text_data=json.dumps({'type': 'match_request', 'username': username}))
+        return communicator
+
+    async def test_players_are_matched_by_rating(self):
+        """先に待っていても、レーティングの離れたプレイヤーとは対戦しないことをテスト"""
+        low = await self.request_match('low', 1000)
+        high = await self.request_match('high', 1500)
+        self.assertEqual(json.loads(await high.receive_from())['type'], 'match_status')
+        self.assertEqual(json.loads(await low.receive_from())['type'], 'match_status')
+
+        close = await self.request_match('close', 1050)
+        found = json.loads(await close.receive_from())
+        self.assertEqual((found['type'], found['player_number']), ('match_found', 2))
+        self.assertEqual(found['opponent']['username'], 'low')
+        self.assertEqual(json.loads(await low.receive_from())['player_number'], 1)
+        self.assertEqual(len(MatchmakingConsumer.waiting_players), 1)
+
+        # 切断したら待機リストから外れる
+        await high.disconnect()
+        self.assertEqual(len(MatchmakingConsumer.waiting_players), 0)
+        await low.disconnect()
+        await close.disconnect()
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from pong.utils.metrics import Counter, Gauge, Histogram, Registry
+
+
+class MetricsTestCase(SimpleTestCase):
+    def test_render_prometheus_text(self):
+        """カウンター・ゲージ・ヒストグラムを Prometheus のテキスト形式で出力することをテスト"""
+        registry = Registry()
+        frames = Counter('frames_total', 'Frames sent', ['path'], registry=registry)
+        Gauge('rooms', 'Active rooms', registry=registry, function=lambda: 3)
+        latency = Histogram('latency_seconds', 'Latency', registry=registry, buckets=(0.01, 0.1))
+        frames.labels('direct').inc(2)
+        frames.labels('group').inc()
+        for value in (0.005, 0.05, 0.5):
+            latency.observe(value)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE frames_total counter', lines)
+        self.assertIn('frames_total{path="direct"} 2', lines)
+        self.assertIn('frames_total{path="group"} 1', lines)
+        self.assertIn('rooms 3', lines)
+        self.assertIn('latency_seconds_bucket{le="0.01"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_count 3', lines)
+
+    @override_settings(PONG_METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint(self):
+        """メトリクスのエンドポイントがゲームサーバーの値を返すことをテスト"""
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        for name in ('pong_active_rooms', 'pong_tick_duration_seconds_bucket', 'pong_matchmaking_queue_depth'):
+            self.assertIn(name, body)
+
+
+@override_settings(PONG_METRICS_TOKEN='scrape-token')
+class MetricsAccessTestCase(TestCase):
+    def test_metrics_requires_staff_or_token(self):
+        """メトリクスはスタッフか正しい Bearer トークンでしか取得できないことをテスト"""
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+        User = get_user_model()
+        User.objects.create_user(username='player', email='player@example.com', password='testpassword123')
+        self.client.login(username='player', password='testpassword123')
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+
+        User.objects.create_user(username='staff', email='staff@example.com', password='testpassword123', is_staff=True)
+        self.client.login(username='staff', password='testpassword123')
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    @override_settings(PONG_METRICS_TOKEN=None)
+    def test_metrics_without_token_setting(self):
+        """トークンが未設定なら Bearer ヘッダーでは取得できないことをテスト"""
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,85 @@
+from django.test import SimpleTestCase
+from pong.engine.physics import (
+    PhysicsEngine, fold_wall, move_paddle, new_paddle, PADDLE_Z, WALL_X, PADDLE_LIMIT, PADDLE_SPEED,
+)
+from pong.engine.state import Ball, Paddle, RoomState
+
+
+def make_state(x=0.0, z=0.0, vx=0.0, vz=18.0, paddle1=0.0, paddle2=0.0):
+    """GameConsumer.game_states と同じ形式のゲーム状態を作る"""
+    return RoomState(Ball(x=x, z=z, vx=vx, vz=vz), Paddle(x=paddle1), Paddle(x=paddle2))
+
+
+class PhysicsEngineTestCase(SimpleTestCase):
+    def test_frame_rate_independent(self):
+        """呼び出し間隔が違っても同じ経過時間なら同じ位置になることをテスト"""
+        smooth = make_state(vx=5.0, vz=6.0)
+        laggy = make_state(vx=5.0, vz=6.0)
+
+        engine = PhysicsEngine(seed=1)
+        for _ in range(60):
+            engine.advance(smooth, 1 / 60)
+
+        engine = PhysicsEngine(seed=1)
+        for _ in range(5):
+            engine.advance(laggy, 0.2)
+
+        self.assertAlmostEqual(smooth.ball.x, laggy.ball.x)
+        self.assertAlmostEqual(smooth.ball.z, laggy.ball.z)
+        self.assertAlmostEqual(smooth.ball.z, 6.0)
+
+    def test_fast_ball_does_not_tunnel_through_paddle(self):
+        """1ステップでパドルを飛び越える速さでも跳ね返ることをテスト"""
+        # 1ステップで10移動する (パドルの厚み2より大きい)
+        state = make_state(z=PADDLE_Z - 1, vz=600.0)
+        scorers = PhysicsEngine(seed=1).advance(state, 1 / 60)
+
+        self.assertEqual(scorers, [])
+        self.assertLess(state.ball.vz, 0)
+        self.assertLess(state.ball.z, PADDLE_Z)
+
+    def test_missed_ball_scores(self):
+        """パドルに当たらなければ相手の得点になることをテスト"""
+        state = make_state(z=PADDLE_Z - 1, vz=600.0, paddle1=10.0)
+        self.assertEqual(PhysicsEngine(seed=1).advance(state, 1 / 60), [2])
+
+        state = make_state(z=-PADDLE_Z + 1, vz=-600.0, paddle2=-10.0)
+        self.assertEqual(PhysicsEngine(seed=1).advance(state, 1 / 60), [1])
+
+    def test_wall_reflection(self):
+        """壁での反射をテスト"""
+        self.assertEqual(fold_wall(WALL_X + 2, 1.0), (WALL_X - 2, -1.0))
+        self.assertEqual(fold_wall(-WALL_X - 3, -1.0), (-WALL_X + 3, 1.0))
+        self.assertEqual(fold_wall(4.0, 1.0), (4.0, 1.0))
+
+    def test_seeded_rng_is_deterministic(self):
+        """同じシードなら同じ展開になることをテスト"""
+        results = []
+        for _ in range(2):
+            engine = PhysicsEngine(seed=42)
+            state = make_state()
+            engine.serve(state)
+            for _ in range(600):
+                if engine.advance(state, 1 / 60):
+                    engine.serve(state)
+            results.append((state.ball.x, state.ball.z))
+
+        self.assertEqual(results[0], results[1])
+
+    def test_paddle_is_server_authoritative(self):
+        """パドルの可動範囲と速度をサーバーが制限することをテスト"""
+        paddle = new_paddle(0.0)
+        move_paddle(paddle, 100.0, 0.0)
+        # 一度に動けるのは持ち越せる移動量 (MAX_FRAME_TIME 分) まで
+        self.assertAlmostEqual(paddle.x, PADDLE_SPEED * 0.25)
+
+        for now in (1.0, 2.0, 3.0):
+            move_paddle(paddle, 100.0, now)
+        # 可動範囲の外には出られない
+        self.assertEqual(paddle.x, PADDLE_LIMIT)
+
+        # 持ち越し分を使い切った後は、1/60秒で最大速度ぶんしか動けない
+        move_paddle(paddle, -100.0, 4.0)
+        position = paddle.x
+        move_paddle(paddle, -100.0, 4.0 + 1 / 60)
+        self.assertAlmostEqual(paddle.x, position - PADDLE_SPEED / 60)
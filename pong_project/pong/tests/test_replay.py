@@ -0,0 +1,139 @@
+import json
+import os
+import random
+import tempfile
+from unittest import skipIf
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from pong.engine.batch import BatchPhysics, np
+from pong.engine.physics import PhysicsEngine, move_paddle, new_paddle
+from pong.engine.replay import InputLog, decode_log, simulate
+from pong.engine.state import Ball, RoomState
+from pong.models import Game, GamePlayers
+
+User = get_user_model()
+
+
+def play(batch=None, seed=42, winning_score=3):
+    """対戦中と同じ順序 (入力 → 物理演算 → 得点処理) でゲームを最後まで進め、(記録, 得点したステップ, 最後の状態) を返す"""
+    engine = PhysicsEngine(seed=seed)
+    state = RoomState(Ball(vx=12.0, vz=18.0), new_paddle(0.0), new_paddle(0.0), physics=engine)
+    engine.log = InputLog(engine.seed, 60, 60, state.ball)
+    state.game_started = True
+    if batch is not None:
+        batch.add('game', engine)
+
+    jitter = random.Random(seed)
+    goals = []
+    now = 0.0
+    while max(state.score1, state.score2) < winning_score:
+        # 到着間隔の揺らぎを再現する
+        now += 1 / 60 * (0.5 + jitter.random())
+        if batch is not None:
+            batch.tick(now)
+        # プレイヤー1はボールを追い、プレイヤー2はランダムに動く
+        move_paddle(state.paddle1, state.ball.x + jitter.uniform(-2, 2), now)
+        move_paddle(state.paddle2, jitter.uniform(-13, 13), now)
+        if batch is not None:
+            scorers = batch.exchange('game', state)
+        else:
+            scorers = engine.advance(state, 1 / 60 * (0.5 + jitter.random()))
+        for scorer in scorers:
+            state.add_point(scorer)
+            goals.append((engine.steps, scorer))
+            if max(state.score1, state.score2) < winning_score:
+                engine.serve(state)
+    return engine.log.encode(state.score1, state.score2, engine.steps), goals, state
+
+
+def replayed(data):
+    """記録を再生し、(得点したステップ, 最後の状態) を返す"""
+    goals = []
+    score = (0, 0)
+    for step, state in simulate(data):
+        if (state.score1, state.score2) != score:
+            goals.append((step, 1 if state.score1 != score[0] else 2))
+            score = (state.score1, state.score2)
+    return goals, state
+
+
+class ReplayTestCase(SimpleTestCase):
+    def test_replay_matches_game(self):
+        """記録から再生したゲームが対戦中と同じ展開になることをテスト"""
+        data, goals, live = play()
+        header, inputs = decode_log(data)
+        self.assertEqual(header['score'], live.score())
+        self.assertLess(len(data), len(inputs) * 13 + 200)
+
+        replay_goals, state = replayed(data)
+        self.assertEqual(replay_goals, goals)
+        self.assertEqual(state.score(), live.score())
+        self.assertEqual(state.ball.key(), live.ball.key())
+        self.assertTrue(state.ended)
+
+    @skipIf(np is None, 'numpy is not installed')
+    def test_replay_matches_batch_game(self):
+        """バッチエンジンで進めたゲームも同じ記録形式で再生できることをテスト"""
+        data, goals, live = play(batch=BatchPhysics(capacity=4))
+        replay_goals, state = replayed(data)
+        self.assertEqual(replay_goals, goals)
+        self.assertEqual(state.ball.key(), live.ball.key())
+
+    def test_corrupted_log_is_rejected(self):
+        """壊れた記録は ValueError になることをテスト"""
+        data, _, _ = play()
+        with self.assertRaises(ValueError):
+            decode_log(data[:-4])
+        with self.assertRaises(ValueError):
+            decode_log(b'XXXX' + data[4:])
+
+
+class ReplayAPITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='replayuser', email='replay@example.com', password='testpassword123')
+        self.client.login(username='replayuser', password='testpassword123')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        game = Game.objects.create(mode='online', played_at=timezone.now())
+        GamePlayers.objects.create(game=game, player_number=1, nickname='replayuser', user=self.user)
+        self.game_id = str(game.id)
+        self.data, _, self.live = play()
+        with open(os.path.join(self.directory.name, f'{self.game_id}.replay'), 'wb') as f:
+            f.write(self.data)
+
+    def test_stream_replay(self):
+        """リプレイのゲーム状態と記録そのものを取得できることをテスト"""
+        with override_settings(PONG_REPLAY_DIR=self.directory.name):
+            response = self.client.get('/pong/api/game-replay/', {'game_id': self.game_id, 'rate': 20})
+            self.assertEqual(response.status_code, 200)
+            frames = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+            self.assertEqual(frames[-1]['score'], self.live.score())
+            self.assertEqual(frames[1]['tick'], 3)  # 60Hz の記録を 20Hz で送る
+
+            response = self.client.get('/pong/api/game-replay/', {'game_id': self.game_id, 'format': 'log'})
+            self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_invalid_replay_request(self):
+        """存在しないゲームや不正なゲームIDを拒否することをテスト"""
+        game = Game.objects.create(mode='online', played_at=timezone.now())
+        GamePlayers.objects.create(game=game, player_number=1, nickname='replayuser', user=self.user)
+        with override_settings(PONG_REPLAY_DIR=self.directory.name):
+            response = self.client.get('/pong/api/game-replay/', {'game_id': str(game.id)})
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get('/pong/api/game-replay/', {'game_id': '../secret'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_replay_only_for_players_and_staff(self):
+        """ゲームに参加していないユーザーはリプレイを取得できず、スタッフは取得できることをテスト"""
+        User.objects.create_user(username='otheruser', email='other@example.com', password='testpassword123')
+        User.objects.create_user(username='staffuser', email='staff@example.com', password='testpassword123', is_staff=True)
+        with override_settings(PONG_REPLAY_DIR=self.directory.name):
+            self.client.login(username='otheruser', password='testpassword123')
+            response = self.client.get('/pong/api/game-replay/', {'game_id': self.game_id, 'format': 'log'})
+            self.assertEqual(response.status_code, 403)
+
+            self.client.login(username='staffuser', password='testpassword123')
+            response = self.client.get('/pong/api/game-replay/', {'game_id': self.game_id, 'format': 'log'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), self.data)
@@ -0,0 +1,102 @@
+import os
+import tempfile
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pong.engine.results import GameResult, ResultWriter, write_results
+from pong.models import Game, GamePlayers
+
+User = get_user_model()
+
+
+class ResultWriterTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='winner', email='winner@example.com', password='testpassword123')
+        self.games = []
+        for _ in range(3):
+            game = Game.objects.create(mode='online', played_at=timezone.now())
+            GamePlayers.objects.create(game=game, player_number=1, nickname='winner', user=self.user)
+            GamePlayers.objects.create(game=game, player_number=2, nickname='guest')
+            self.games.append(game)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'outbox', 'results.jsonl')
+
+    def assert_saved(self, game, score1, score2, winner_id):
+        scores = dict(GamePlayers.objects.filter(game=game).values_list('player_number', 'score'))
+        self.assertEqual(scores, {1: score1, 2: score2})
+        game.refresh_from_db()
+        self.assertEqual(game.winner_id, winner_id)
+
+    def test_results_are_written_in_one_batch(self):
+        """結果の件数に関係なく、まとめて同じ数のクエリで書き込まれることをテスト"""
+        results = [GameResult(str(game.id), 3, index, 1) for index, game in enumerate(self.games)]
+        with CaptureQueriesContext(connection) as single:
+            write_results(results[:1])
+        with CaptureQueriesContext(connection) as batch:
+            self.assertEqual(write_results(results), 3)
+        self.assertEqual(len(batch), len(single))
+        for index, game in enumerate(self.games):
+            self.assert_saved(game, 3, index, self.user.id)
+
+    def test_ratings_are_updated_for_user_games(self):
+        """両プレイヤーがユーザーのゲームだけ、結果の順にレーティングが更新されることをテスト"""
+        rival = User.objects.create_user(username='rival', email='rival@example.com', password='testpassword123')
+        rated = []
+        for _ in range(2):
+            game = Game.objects.create(mode='online', played_at=timezone.now())
+            GamePlayers.objects.create(game=game, player_number=1, nickname='winner', user=self.user)
+            GamePlayers.objects.create(game=game, player_number=2, nickname='rival', user=rival)
+            rated.append(game)
+
+        write_results([GameResult(str(game.id), 3, 1, 1) for game in rated + self.games])
+
+        self.user.refresh_from_db()
+        rival.refresh_from_db()
+        self.assertEqual((self.user.rating, rival.rating), (1031, 969))
+
+    async def test_replayed_outbox_entry_is_rated_once(self):
+        """書き込み後、アウトボックスから消す前に止まって同じ結果が書き込み直されても、レーティングは1回だけ動くことをテスト"""
+        rival = await sync_to_async(User.objects.create_user)(username='rival', email='rival@example.com', password='testpassword123')
+        game = self.games[0]
+        await sync_to_async(GamePlayers.objects.filter(game=game, player_number=2).update)(user=rival)
+        writer = ResultWriter(self.path, interval=60)
+        await writer.submit(GameResult(str(game.id), 3, 1, 1))
+        writer._task.cancel()
+        # データベースには書き込んだが、アウトボックスから消す前に止まったとする
+        with mock.patch.object(ResultWriter, 'remove'):
+            self.assertEqual(await writer.flush(), 1)
+
+        restarted = ResultWriter(self.path)
+        self.assertEqual(len(restarted.pending), 1)
+        self.assertEqual(await restarted.flush(), 1)
+
+        ratings = await sync_to_async(lambda: sorted(User.objects.filter(id__in=[self.user.id, rival.id]).values_list('rating', flat=True)))()
+        self.assertEqual(ratings, [984, 1016])
+
+    async def test_outbox_survives_restart(self):
+        """データベースに書き込む前に止まっても、アウトボックスから書き込み直されることをテスト"""
+        writer = ResultWriter(self.path, interval=60)
+        await writer.submit(GameResult(str(self.games[0].id), 3, 1, 1))
+        await writer.submit(GameResult(str(self.games[1].id), 2, 3, 2))
+        writer._task.cancel()  # ここでプロセスが止まったとする
+        with open(self.path, 'a') as f:
+            f.write('["torn')  # 書き込みの途中で止まった行
+
+        restarted = ResultWriter(self.path)
+        self.assertEqual(len(restarted.pending), 2)
+        self.assertEqual(await restarted.flush(), 2)
+        self.assertEqual(restarted.pending, [])
+        with open(self.path) as f:
+            self.assertEqual(f.read(), '')
+
+        await self.async_assert_saved(self.games[0], 3, 1, self.user.id)
+        # 勝者がゲストなら winner_id は空のまま
+        await self.async_assert_saved(self.games[1], 2, 3, None)
+
+    async def async_assert_saved(self, game, score1, score2, winner_id):
+        await sync_to_async(self.assert_saved)(game, score1, score2, winner_id)
@@ -0,0 +1,79 @@
+from django.test import SimpleTestCase
+import asyncio
+from pong.engine.scheduler import TickScheduler
+
+
+class TickSchedulerTestCase(SimpleTestCase):
+    async def test_all_rooms_step_in_same_tick(self):
+        """全ルームが同じティックで更新・送信されることをテスト"""
+        scheduler = TickScheduler(rate=60)
+        calls = []
+
+        def make_step(key):
+            return lambda now: calls.append(('step', key, now))
+
+        def make_flush(key):
+            async def flush():
+                calls.append(('flush', key))
+            return flush
+
+        for key in ('game_a', 'game_b'):
+            scheduler.schedule(key, make_step(key), make_flush(key))
+        # ループタスクは止めて、ティックを手動で実行する
+        scheduler._task.cancel()
+
+        await scheduler.run_tick(1.0)
+
+        # 先に全ルームの step、その後に flush
+        self.assertEqual(
+            calls,
+            [('step', 'game_a', 1.0), ('step', 'game_b', 1.0), ('flush', 'game_a'), ('flush', 'game_b')]
+        )
+        self.assertEqual(scheduler.tick_count, 1)
+
+    async def test_cancel_removes_room(self):
+        """cancel() でルームがスケジューラから外れることをテスト"""
+        scheduler = TickScheduler(rate=60)
+        ticket = scheduler.schedule('game_a', lambda now: None)
+        self.assertIn('game_a', scheduler.rooms)
+
+        ticket.cancel()
+        self.assertNotIn('game_a', scheduler.rooms)
+        self.assertTrue(ticket.cancelled())
+
+        # ルームがなくなればループタスクも終了する
+        await asyncio.sleep(0.05)
+        self.assertIsNone(scheduler._task)
+
+    async def test_rate_is_kept_under_load(self):
+        """処理時間があってもティック周期が保たれることをテスト"""
+        scheduler = TickScheduler(rate=100)
+        steps = []
+
+        def step(now):
+            steps.append(now)
+            # 周期の半分を消費する処理
+            busy_until = scheduler.clock() + scheduler.period / 2
+            while scheduler.clock() < busy_until:
+                pass
+
+        scheduler.schedule('game_a', step)
+        await asyncio.sleep(0.3)
+        scheduler.unschedule('game_a')
+
+        # sleep を処理の後に固定で入れる方式だと 20 ティック程度になる
+        self.assertGreaterEqual(len(steps), 25)
+        self.assertEqual(scheduler.stats.ticks, len(steps))
+
+    def test_budget_accounting(self):
+        """ティック予算の集計をテスト"""
+        scheduler = TickScheduler(rate=50)
+        scheduler.stats.record(0.01, 0.0)
+        scheduler.stats.record(0.03, 0.002)
+
+        stats = scheduler.stats.snapshot()
+        self.assertEqual(stats['ticks'], 2)
+        self.assertEqual(stats['overruns'], 1)
+        self.assertAlmostEqual(stats['avg_duration'], 0.02)
+        self.assertAlmostEqual(stats['budget_used'], 1.5)
+        self.assertAlmostEqual(stats['max_lag'], 0.002)
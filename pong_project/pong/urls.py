@@ -11,6 +11,8 @@ from .views import create_tournament, get_tournament, setup_final_match
 from .views import reload_notification_api
 from .views import update_game_score
 from .views import get_42_auth_url
+from .views import game_metrics
+from .views import game_replay
 
 urlpatterns = [
     path('api/login/', login_api, name='login_api'),  # ログインAPIのパスを追加
@@ -47,4 +49,6 @@ urlpatterns = [
     path('api/reload-notification/', reload_notification_api, name='reload_notification_api'),
     path('api/update-game-score/', update_game_score, name='update_game_score'),
     path('api/get-42-auth-url/', get_42_auth_url, name='get_42_auth_url'),
+    path('api/game-metrics/', game_metrics, name='game_metrics'),  # ルームごとの送信頻度などの監視用
+    path('api/game-replay/', game_replay, name='game_replay'),  # 終了したゲームのリプレイ
 ]
@@ -0,0 +1,22 @@
+import resource
+
+
+def percentiles(values):
+    """ミリ秒単位の p50 / p90 / p99 / 最大値 (値は秒)"""
+    if not values:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': ordered[-1] * 1000}
+
+
+def rss_kb():
+    """現在の RSS (KB、/proc がなければ最大 RSS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,106 @@
+import copy
+import logging
+import logging.handlers
+import queue
+import time
+from . import metrics
+from .rate_limit import TokenBucket
+
+# LogRecord が最初から持っている属性 (extra で渡された項目と区別するため)
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def quote(value):
+    """logfmt の値 (空白や記号を含む場合は引用符で囲む)"""
+    text = str(value)
+    if text and not any(c in text for c in ' ="\\\n\t'):
+        return text
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+class StructuredFormatter(logging.Formatter):
+    """1行1レコードの key=value 形式 (logfmt) にする。extra で渡した項目もそのまま出力する"""
+
+    def format(self, record):
+        fields = [
+            ('time', time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z'),
+            ('level', record.levelname.lower()),
+            ('logger', record.name),
+            ('msg', record.getMessage()),
+        ]
+        fields.extend((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        line = ' '.join(f'{key}={quote(value)}' for key, value in fields)
+        if record.exc_info:
+            line += ' exc=' + quote(self.formatException(record.exc_info))
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """同じメッセージ (ロガーと書式の組) ごとに1秒あたりの件数を制限する
+
+    頻度の高いイベントだけが間引かれ、間引いた件数は次に出力するレコードの suppressed に入れる。
+    """
+
+    # 書式に値を埋め込んだメッセージが多いと増え続けるので、この数を超えたら数え直す
+    MAX_KEYS = 1000
+
+    def __init__(self, rate=10, burst=20):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}  # {(ロガー名, 書式): TokenBucket}
+
+    def filter(self, record):
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_KEYS:
+                self.buckets.clear()
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        dropped = bucket.dropped
+        if not bucket.allow():
+            return False
+        if dropped:
+            record.suppressed = dropped
+            bucket.dropped = 0
+        return True
+
+
+class QueueStreamHandler(logging.handlers.QueueHandler):
+    """レコードをキューに入れるだけのハンドラ (整形と書き込みは別スレッドで行う)
+
+    イベントループが stdout/stderr への書き込みで止まらないようにする。
+    キューがいっぱいのときは待たずに捨てる。
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # 整形は書き込み側のスレッドで行う
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # 引数だけは今の値で文字列にしておく (後から値が変わっても記録が変わらないように)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+    def close(self):
+        # 終了時 (logging.shutdown) に残りを書き出してからスレッドを止める
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
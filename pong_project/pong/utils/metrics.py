@@ -0,0 +1,237 @@
+import bisect
+import copy
+import math
+import time
+
+
+class Registry:
+    """メトリクスの一覧 (Prometheus のテキスト形式で出力する)"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """メトリクスの基底クラス (labelnames があれば labels() でラベルごとの値を持つ)
+
+    値の更新は属性の加算だけにして、集計や整形は取得されたときにだけ行う。
+    function を渡すと、値を持たずに取得されたときにだけ計算する。
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.children = {}  # {ラベルの値のタプル: 子のメトリクス}
+        self.reset()
+        if registry is not None:
+            registry.register(self)
+
+    def reset(self):
+        pass
+
+    def labels(self, *values):
+        """ラベルの値ごとのメトリクスを返す"""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.child()
+        return child
+
+    def child(self):
+        child = copy.copy(self)
+        child.children = {}
+        child.reset()
+        return child
+
+    def samples(self):
+        """(名前の接尾辞, ラベル, 値) を返す"""
+        if not self.labelnames:
+            yield from self.own_samples(())
+            return
+        for values, child in list(self.children.items()):
+            yield from child.own_samples(tuple(zip(self.labelnames, values)))
+
+    def own_samples(self, labels):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """増えるだけの値 (送信したフレーム数など)"""
+
+    kind = 'counter'
+
+    def reset(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def own_samples(self, labels):
+        yield '', labels, self.function() if self.function is not None else self.value
+
+
+class Gauge(Metric):
+    """現在の値 (ルーム数など)"""
+
+    kind = 'gauge'
+
+    def reset(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def own_samples(self, labels):
+        yield '', labels, self.function() if self.function is not None else self.value
+
+
+# 秒単位の既定のバケット (ティックの周期 16.7ms 前後を細かく見る)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(Metric):
+    """値の分布 (処理時間など)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self):
+        """with ブロックの処理時間を記録する"""
+        return Timer(self)
+
+    def own_samples(self, labels):
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), list(self.counts)):
+            total += count
+            yield '_bucket', labels + (('le', format_value(float(bound))),), total
+        yield '_sum', labels, self.sum
+        yield '_count', labels, total
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def _active_rooms():
+    from pong.consumers.game import GameConsumer
+    return len(GameConsumer.game_states)
+
+
+def _active_players():
+    from pong.consumers.game import GameConsumer
+    return sum(len(players) for players in list(GameConsumer.game_players.values()))
+
+
+def _active_spectators():
+    from pong.consumers.game import GameConsumer
+    return sum(len(state.spectators or ()) for state in list(GameConsumer.game_states.values()))
+
+
+def _matchmaking_queue():
+    from pong.consumers.matchmaking import MatchmakingConsumer
+    return len(MatchmakingConsumer.waiting_players)
+
+
+def _max_outbound_queue():
+    from pong.consumers.game import GameConsumer
+    return max((
+        len(consumer.outbound.items)
+        for connections in list(GameConsumer.game_connections.values())
+        for consumer in list(connections.values())
+    ), default=0)
+
+
+def _pending_results():
+    from pong.engine.results import pending_results
+    return pending_results()
+
+
+def _rss_bytes():
+    from .bench import rss_kb
+    return rss_kb() * 1024
+
+
+# ゲームサーバーのメトリクス (ワーカープロセスごとの値)
+LOOP_LAG = Histogram('pong_event_loop_lag_seconds', 'Delay between the scheduled and actual start of each tick')
+TICK_DURATION = Histogram('pong_tick_duration_seconds', 'Time spent stepping and flushing all rooms in one tick')
+TICK_ROOMS = Gauge('pong_tick_rooms', 'Rooms processed in the last tick')
+TICK_OVERRUNS = Counter('pong_tick_overruns_total', 'Ticks that took longer than the tick period')
+TICKS_SKIPPED = Counter('pong_ticks_skipped_total', 'Ticks skipped because the scheduler fell behind')
+ACTIVE_ROOMS = Gauge('pong_active_rooms', 'Game rooms owned by this worker', function=_active_rooms)
+ACTIVE_PLAYERS = Gauge('pong_active_players', 'Players connected to rooms owned by this worker', function=_active_players)
+ACTIVE_SPECTATORS = Gauge('pong_active_spectators', 'Spectators of rooms owned by this worker', function=_active_spectators)
+FRAMES_SENT = Counter('pong_frames_sent_total', 'State frames sent (direct: per connection, group: per group message)', ['path'])
+FRAME_BYTES_SENT = Counter('pong_frame_bytes_sent_total', 'Encoded bytes of state frames sent', ['path'])
+GROUP_SEND_LATENCY = Histogram('pong_group_send_seconds', 'Time spent in channel layer group_send')
+OUTBOUND_LAG = Histogram('pong_outbound_lag_seconds', 'Time each message waited in its connection outbound queue before being sent')
+OUTBOUND_QUEUE_MAX = Gauge('pong_outbound_queue_max_depth', 'Deepest outbound queue among player connections', function=_max_outbound_queue)
+FRAMES_DROPPED = Counter('pong_frames_dropped_total', 'State frames replaced by a newer frame because the client fell behind')
+SLOW_CLIENT_DISCONNECTS = Counter('pong_slow_client_disconnects_total', 'Connections closed because they stayed behind for too long')
+MATCHMAKING_QUEUE = Gauge('pong_matchmaking_queue_depth', 'Players waiting for an opponent', function=_matchmaking_queue)
+MATCHMAKING_WAIT = Histogram(
+    'pong_matchmaking_wait_seconds', 'Time from match_request to match_found',
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+RESULT_WRITE_LATENCY = Histogram('pong_game_result_write_seconds', 'Time to queue the result of a finished game (outbox append)')
+RESULT_QUEUE = Gauge('pong_game_result_queue_depth', 'Game results waiting to be written to the database', function=_pending_results)
+RESULT_FLUSH_LATENCY = Histogram('pong_game_result_flush_seconds', 'Time to write one batch of game results to the database')
+RESULT_FLUSH_ERRORS = Counter('pong_game_result_flush_errors_total', 'Batches of game results that failed to write and will be retried')
+LOG_RECORDS_DROPPED = Counter('pong_log_records_dropped_total', 'Log records dropped because the log queue was full')
+PROCESS_CPU = Counter('process_cpu_seconds_total', 'CPU time used by this process', function=time.process_time)
+PROCESS_RSS = Gauge('process_resident_memory_bytes', 'Resident memory of this process', function=_rss_bytes)
@@ -0,0 +1,24 @@
+import time
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限 (接続ごとの入力数の上限などに使う)"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate                  # 1秒あたりに補充するトークン数
+        self.burst = burst or rate        # ためておけるトークンの上限
+        self.clock = clock
+        self.tokens = self.burst
+        self.last = clock()
+        self.dropped = 0
+
+    def allow(self):
+        """トークンを1つ使えれば True、上限を超えていれば False"""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.dropped += 1
+            return False
+        self.tokens -= 1
+        return True
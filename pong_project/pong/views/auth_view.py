@@ -1,3 +1,4 @@
+import logging
 from django.http import JsonResponse
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
@@ -15,6 +16,8 @@ from django.core.files import File
 from pong.models import UserStatus  # 追加
 from django.core.cache import cache
 
+logger = logging.getLogger('pong.views')
+
 User = get_user_model()
 
 def set_jwt_cookies(response, user):
@@ -298,9 +301,9 @@ def signup_api(request):
                     
                     # 一時ファイルを削除
                     os.remove(temp_path)
-                    print(f"Created avatar file for user {user.id} using default avatar")
+                    logger.debug('Created avatar file for user %s using default avatar', user.id)
                 else:
-                    print(f"Default avatar file not found at {default_avatar_path}")
+                    logger.warning('Default avatar file not found at %s', default_avatar_path)
             
             user.save()
             
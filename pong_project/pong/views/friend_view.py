@@ -1,3 +1,4 @@
+import logging
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -6,10 +7,11 @@ from django.db.models import Q
 from pong.models import User, Friend, UserStatus
 from django.views.decorators.http import require_http_methods
 
+logger = logging.getLogger('pong.views')
+
 @csrf_exempt
 @login_required
 def user_list_api(request):
-	print("user_list_api")
 	if request.method != 'GET':
 		return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 	try:
@@ -39,13 +41,12 @@ def user_list_api(request):
 			'user_list': user_data
 		})
 	except Exception as e:
-		print(f"Error occurred: {str(e)}")  # エラーの詳細を出力
+		logger.exception('Error in friend API')
 		return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 @csrf_exempt
 @login_required
 def friend_list_api(request):
-    print("friend_list_api")
     if request.method != 'GET':
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
@@ -53,7 +54,6 @@ def friend_list_api(request):
         user_list = User.objects.all()
         # 双方向のフレンド関係を取得（ログインユーザーが送信者または受信者の場合）
         friend_db = Friend.objects.filter(Q(user_id=request.user.id) | Q(friend_id=request.user.id))
-        print(str(friend_db))
         friend_list = {}
         
         for friend in friend_db:
@@ -88,18 +88,16 @@ def friend_list_api(request):
                     'is_online': is_online,
                 }
             except User.DoesNotExist:
-                print(f"User with ID {friend_user_id} not found")
+                logger.warning('User %s not found', friend_user_id)
                 continue
         
         # 自分宛ての保留中のフレンドリクエストを取得
         friend_requests = Friend.objects.filter(friend_id=request.user.id, status='pending')
-        print(friend_requests)
         friend_request_list = {}
         
         for friend_request in friend_requests:
             try:
                 user = user_list.get(id=friend_request.user_id)
-                print(user.id)
                 
                 # ユーザーのオンライン状態を取得
                 is_online = False
@@ -118,10 +116,8 @@ def friend_list_api(request):
                     'is_online': is_online,
                 }
             except User.DoesNotExist:
-                print(f"User with ID {friend_request.user_id} not found")
+                logger.warning('User %s not found', friend_request.user_id)
                 continue
-        
-        print(friend_request_list)
 
         return JsonResponse({
             'status': 'success',
@@ -129,28 +125,23 @@ def friend_list_api(request):
             'friend_request_list': friend_request_list,
         })
     except Exception as e:
-        print(f"Error occurred: {str(e)}")  # エラーの詳細を出力
+        logger.exception('Error in friend API')
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 @csrf_exempt
 @login_required
 def add_friend_api(request):
-    print("add_friend_api")
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 	
     try:
         friend_id = request.POST.get('friend_id')
-        print("user_id")
-        print(request.user.id)
-        print("friend_id")
-        print(friend_id)
         friend_info = User.objects.get(id=friend_id)
         if (Friend.objects.filter(user_id=request.user.id, friend_id=friend_id).exists()): 
-            print("Friend request already sent")
+            logger.debug('Friend request already sent (%s -> %s)', request.user.id, friend_id)
             return JsonResponse({'status': 'error', 'message': 'Friend request already sent'}, status=400)
         Friend.objects.create(user_id=request.user.id, friend_id=friend_id, status='pending')
-        print("Friend request sent")
+        logger.info('Friend request sent (%s -> %s)', request.user.id, friend_id)
         return JsonResponse({'status': 'success', 'message': 'Friend request sent'})
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
@@ -160,16 +151,14 @@ def add_friend_api(request):
 @login_required
 def accept_friend_api(request):
     if request.method != 'POST':
-        print("Invalid request method")
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
     try:
         friend_id = request.POST.get('friend_id')
-        print("friend_id", friend_id)
         friend_request = Friend.objects.get(user_id=friend_id, friend_id=request.user.id)
         friend_request.status = 'accepted'
         friend_request.save()
-        print("Friend request accepted")
+        logger.info('Friend request accepted (%s -> %s)', friend_id, request.user.id)
         return JsonResponse({'status': 'success', 'message': 'Friend request sent'})
     except ObjectDoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'User not found'}, status=404)
@@ -181,17 +170,14 @@ def accept_friend_api(request):
 @login_required
 def reject_friend_api(request):
     if request.method != 'POST':
-        print("Invalid request method")
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
     try:
         friend_id = request.POST.get('friend_id')
-        print("reject_friend_api")
-        print("friend_id", friend_id)
         friend_request = Friend.objects.get(user_id=friend_id, friend_id=request.user.id)
         friend_request.status = 'rejected'
         friend_request.save()
-        print("Friend request rejected")
+        logger.info('Friend request rejected (%s -> %s)', friend_id, request.user.id)
         return JsonResponse({'status': 'success', 'message': 'Friend request rejected'})
     except ObjectDoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'User not found'}, status=404)
@@ -220,5 +206,5 @@ def pending_requests_api(request):
             'pending_requests': pending_ids
         })
     except Exception as e:
-        print(f"Error in pending requests: {str(e)}")
+        logger.exception('Error in pending requests')
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
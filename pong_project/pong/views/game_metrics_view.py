@@ -0,0 +1,14 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from pong.consumers.game import GameConsumer
+from pong.engine.scheduler import get_scheduler
+
+@staff_member_required
+def game_metrics(request):
+    """ティックスケジューラの負荷とルームごとの送信頻度を返す (監視用)"""
+    scheduler = get_scheduler()
+    return JsonResponse({
+        'tick_rate': scheduler.rate,
+        'tick': scheduler.stats.snapshot(),
+        'rooms': GameConsumer.room_rates(),
+    })
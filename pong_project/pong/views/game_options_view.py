@@ -14,6 +14,13 @@ def create_game_options(request):
             game_id = data.get('game_id')
             ball_count = data.get('ball_count', 1)
             ball_speed = data.get('ball_speed', 'normal')
+            simulation_rate = int(data.get('simulation_rate', 60))
+            snapshot_rate = int(data.get('snapshot_rate', 60))
+            
+            if simulation_rate not in dict(GameOptions.SIMULATION_RATE_CHOICES):
+                return JsonResponse({'error': 'Invalid simulation rate'}, status=400)
+            if snapshot_rate not in dict(GameOptions.SNAPSHOT_RATE_CHOICES):
+                return JsonResponse({'error': 'Invalid snapshot rate'}, status=400)
             
             if not game_id:
                 return JsonResponse({'error': 'Game ID is required'}, status=400)
@@ -25,7 +32,9 @@ def create_game_options(request):
                 game=game,
                 defaults={
                     'ball_count': ball_count,
-                    'ball_speed': ball_speed
+                    'ball_speed': ball_speed,
+                    'simulation_rate': simulation_rate,
+                    'snapshot_rate': snapshot_rate
                 }
             )
 
@@ -35,6 +44,8 @@ def create_game_options(request):
                     "game_id": str(game.id),
                     "ball_count": options.ball_count,
                     "ball_speed": options.ball_speed,
+                    "simulation_rate": options.simulation_rate,
+                    "snapshot_rate": options.snapshot_rate,
                     "message": "Game options saved successfully",
                 },
                 status=201 if created else 200,
@@ -60,14 +71,18 @@ def get_game_options(request):
                 'id': str(options.id),
                 'game_id': str(game.id),
                 'ball_count': options.ball_count,
-                'ball_speed': options.ball_speed
+                'ball_speed': options.ball_speed,
+                'simulation_rate': options.simulation_rate,
+                'snapshot_rate': options.snapshot_rate
             }, status=200)
         except GameOptions.DoesNotExist:
             # デフォルトオプションを返す
             return JsonResponse({
                 'game_id': str(game.id),
                 'ball_count': 1,
-                'ball_speed': 'normal'
+                'ball_speed': 'normal',
+                'simulation_rate': 60,
+                'snapshot_rate': 60
             }, status=200)
             
     except Game.DoesNotExist:
@@ -1,3 +1,4 @@
+import logging
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
@@ -5,6 +6,8 @@ from pong.models import Game, GamePlayers, Tournament, TournamentMatch
 import json
 from django.contrib.auth.decorators import login_required
 
+logger = logging.getLogger('pong.views')
+
 @csrf_exempt
 @login_required
 def create_game(request):
@@ -104,14 +107,11 @@ def get_user_game_history(request):
                         
                         # すべてのマッチからプレイヤー情報を集める（全試合を確実に取得）
                         tournament_matches = TournamentMatch.objects.filter(tournament=tournament).select_related('game')
-                        print(f"Found {tournament_matches.count()} matches for tournament {tournament.id}")
                         
                         for match in tournament_matches:
                             if match.game:
-                                print(f"Processing match {match.id}, round: {match.round}, game: {match.game.id}")
                                 # 各試合のプレイヤーを取得
                                 match_players = GamePlayers.objects.filter(game=match.game)
-                                print(f"  Found {match_players.count()} players in this match")
                                 
                                 for player in match_players:
                                     # プレイヤーの一意識別子として nickname を使用（user_idがない場合もあるため）
@@ -129,17 +129,13 @@ def get_user_game_history(request):
                                         }
                                         participants.append(player_info)
                                         participant_nicknames.append(player.nickname)
-                                        
-                                        # デバッグ: 追加したプレイヤー情報
-                                        print(f"  Added player: {player.nickname} (ID: {player.user_id})")
+
                         
                         # 参加者リストを追加
                         game_data['participants'] = participants
                         game_data['participant_nicknames'] = participant_nicknames
                         
-                        # デバッグ用ログ
-                        print(f"Tournament {tournament.id} participants: {participant_nicknames}")
-                        print(f"Total participants count: {len(participants)}")
+                        logger.debug('Tournament %s participants: %s', tournament.id, participant_nicknames)
                         
                         # 決勝戦の情報を取得
                         try:
@@ -168,14 +164,14 @@ def get_user_game_history(request):
                                         game_data['user_won'] = str(winner.user_id) == user_id if winner.user_id else False
                                         game_data['winner_id'] = str(winner.user_id) if winner.user_id else None
                         except Exception as e:
-                            print(f"Error processing final match: {e}")
+                            logger.warning('Error processing final match: %s', e)
                         
                         # 処理済みとしてマーク
                         processed_tournaments.add(game.tournament_id)
                         
                         game_history.append(game_data)
                     except Exception as e:
-                        print(f"Error processing tournament {game.tournament_id}: {e}")
+                        logger.warning('Error processing tournament %s: %s', game.tournament_id, e)
                         # トーナメント情報が取得できない場合は通常ゲームとして表示
                         process_normal_game(game, user, user_id, game_history)
                 else:
@@ -183,11 +179,11 @@ def get_user_game_history(request):
                     process_normal_game(game, user, user_id, game_history)
                     
             except Exception as e:
-                print(f"Error processing game {game.id}: {e}")
+                logger.warning('Error processing game %s: %s', game.id, e)
         
         return JsonResponse({'game_history': game_history}, status=200)
     except Exception as e:
-        print(f"Error in get_user_game_history: {e}")
+        logger.exception('Error in get_user_game_history')
         return JsonResponse({'error': str(e), 'game_history': []}, status=200)  # エラーでも空の配列を返す
 
 def process_normal_game(game, user, user_id, game_history):
@@ -204,11 +200,6 @@ def process_normal_game(game, user, user_id, game_history):
     player_count = all_players.count()
     game_data['player_count'] = player_count
     
-    # デバッグ情報
-    print(f"Game {game.id} has {player_count} players")
-    for p in all_players:
-        print(f"Player {p.player_number}: {p.nickname} (ID: {p.user_id}), Score: {p.score}")
-    
     # プレイヤー情報をプレイヤー番号順に整理
     players_by_number = {}
     for player in all_players:
@@ -228,7 +219,7 @@ def process_normal_game(game, user, user_id, game_history):
             game_data['user_avatar'] = None
             game_data['user_player_number'] = None
     except Exception as e:
-        print(f"Error getting user data: {e}")
+        logger.warning('Error getting user data: %s', e)
         game_data['user_nickname'] = "あなた"
         game_data['user_score'] = 0
         game_data['user_avatar'] = None
@@ -257,8 +248,7 @@ def process_normal_game(game, user, user_id, game_history):
             game_data[f'player{player_number}_avatar'] = player.user.profile.avatar.url if player.user and hasattr(player.user, 'profile') and player.user.profile.avatar else None
             game_data[f'player{player_number}_id'] = str(player.user_id) if player.user_id else None
     
-    # デバッグ情報
-    print(f"Game data: {game_data}")
+    logger.debug('Game data: %s', game_data)
     
     game_history.append(game_data)
 
@@ -0,0 +1,25 @@
+import secrets
+from django.conf import settings
+from django.http import HttpResponse
+from pong.utils.metrics import REGISTRY
+
+
+def authorized(request):
+    """スタッフのセッションか、PONG_METRICS_TOKEN と一致する Bearer トークンがあれば True"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = getattr(settings, 'PONG_METRICS_TOKEN', None)
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not header.startswith('Bearer '):
+        return False
+    return secrets.compare_digest(header[len('Bearer '):].encode(), token.encode())
+
+
+def metrics(request):
+    """このワーカーのメトリクスを Prometheus のテキスト形式で返す (取得されたときにだけ集計する)"""
+    if not authorized(request):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -43,7 +43,7 @@ def oauth_42_callback(request):
         token_json = token_response.json()
         
         # トークンレスポンスのステータスだけ出力
-        print(f"42 API Token Status: {'success' if 'access_token' in token_json else 'failure'}")
+        logger.info('42 API token status: %s', 'success' if 'access_token' in token_json else 'failure')
         
         if 'access_token' not in token_json:
             return JsonResponse({'status': 'error', 'message': 'Failed to obtain access token'}, status=400)
@@ -56,31 +56,22 @@ def oauth_42_callback(request):
         user_response = requests.get(user_url, headers=headers)
         user_data = user_response.json()
         
-        # 画像データの部分だけを抽出してログ出力
         image_data = user_data.get('image', {})
-        print(f"User image data: {json.dumps(image_data, indent=2)}")
         avatar_url = image_data.get('link')
-        print(f"Extracted avatar URL: {avatar_url}")
+        logger.debug('Extracted avatar URL: %s', avatar_url)
         
         # 42のユーザーIDを取得
         intra_id = user_data.get('id')
         if not intra_id:
             return JsonResponse({'status': 'error', 'message': 'Could not get user information'}, status=400)
             
-        # ユーザーモデルのフィールドを確認
         User = get_user_model()
-        user_model_fields = [f.name for f in User._meta.get_fields()]
-        print(f"User model fields: {user_model_fields}")
         
         # 42のIDをもとにユーザーを検索または作成
         try:
-            # 42認証用のカスタムフィールドがあるか確認
-            has_intra_field = hasattr(User(), 'intra_42_id')
-            print(f"Model has intra_42_id field: {has_intra_field}")
-            
             # 42認証用のカスタムフィールドがあると仮定
             user = User.objects.get(intra_42_id=intra_id)
-            print(f"Found existing user: {user.username}")
+            logger.debug('Found existing user: %s', user.username)
         except User.DoesNotExist:
             # 新規ユーザー作成
             email = user_data.get('email', f'{user_data.get("login")}@42oauth.com')
@@ -125,25 +116,17 @@ def oauth_42_callback(request):
                     
                     # 一時ファイルを削除
                     os.remove(temp_path)
-                    print(f"Created avatar file for user {user.id} using 42 default avatar")
+                    logger.debug('Created avatar file for user %s using 42 default avatar', user.id)
                 else:
-                    print(f"Default avatar file not found at {default_avatar_path}")
+                    logger.warning('Default avatar file not found at %s', default_avatar_path)
             
             user.save()
             
-            # 作成したユーザーの重要フィールドだけ出力
-            user_data = {
-                'id': str(user.id),
-                'username': user.username,
-                'email': user.email,
-                'has_avatar_url': hasattr(user, 'avatar_url'),
-                'avatar_url_value': getattr(user, 'avatar_url', None) if hasattr(user, 'avatar_url') else None
-            }
-            print(f"Created new user: {json.dumps(user_data, indent=2)}")
+            logger.info('Created new user %s (%s)', user.id, user.username)
         
         # ★ ここが重要: ユーザーをDjangoのセッションにログインさせる
         login(request, user)
-        print(f"User logged in as: {user.username}")
+        logger.info('User logged in as: %s', user.username)
         
         # ユーザーのオンライン状態を更新
         user_status, created = UserStatus.objects.get_or_create(user=user)
@@ -161,7 +144,6 @@ def oauth_42_callback(request):
             'nickname': getattr(user, 'nickname', user.username) if hasattr(user, 'nickname') else user.username,
             'avatar': user.get_avatar_url()  # ユーザーモデルのメソッドを使用
         }
-        print(f"Response user data: {json.dumps(user_data_response, indent=2)}")
         
         # クッキーにJWTを設定
         from pong.views.auth_view import set_jwt_cookies
@@ -181,9 +163,7 @@ def oauth_42_callback(request):
         return response
         
     except Exception as e:
-        import traceback
-        print(f"OAuth error: {str(e)}")
-        traceback.print_exc()
+        logger.exception('OAuth error')
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500) 
 
 @require_http_methods(["GET"])
@@ -1,9 +1,12 @@
+import logging
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from pong.models import Game, GamePlayers
 import json
 
+logger = logging.getLogger('pong.views')
+
 @csrf_exempt
 @login_required  # ログインが必要
 def create_player(request):
@@ -12,7 +15,6 @@ def create_player(request):
         game_id = data.get('game_id')
         player_number = data.get('player_number')
         nickname = data.get('nickname')
-        print(f"Debug: Received data - game_id: {game_id}, player_number: {player_number}, nickname: {nickname}")  # デバッグログ
         try:
             game = Game.objects.get(id=game_id)
             user_id = request.user.id if player_number == 1 else None  # player1の場合はuser_idを設定
@@ -22,7 +24,7 @@ def create_player(request):
                 nickname=nickname,
                 user_id=user_id  # user_idを追加
             )
-            print(f"Debug: Created player {player.id} for game_id {game_id}")  # デバッグログ
+            logger.debug('Created player %s for game %s', player.id, game_id)
             return JsonResponse({
                 'id': str(player.id),
                 'message': 'Player created successfully',
@@ -31,7 +33,7 @@ def create_player(request):
         except Game.DoesNotExist:
             return JsonResponse({'error': 'Game not found'}, status=404)
         except Exception as e:
-            print(f"Debug: Exception occurred - {str(e)}")  # デバッグログ
+            logger.warning('Error creating player: %s', e)
             return JsonResponse({'error': str(e)}, status=400)
 
 @login_required
@@ -41,7 +43,6 @@ def get_players(request):
         return JsonResponse({'error': 'Game ID is required'}, status=400)
     try:
         players = GamePlayers.objects.filter(game_id=game_id).order_by('player_number')  # player_numberでソート
-        print(f"Debug: Found {players.count()} players for game_id {game_id}")  # デバッグログ
         player_data = [
             {
                 'id': str(player.id),
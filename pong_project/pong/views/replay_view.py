@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from pong.consumers.protocol import encode_state_text
+from pong.engine.replay import decode_log, replay_path, simulate
+from pong.models import GamePlayers
+
+FRAMES_PER_CHUNK = 60  # ストリームの1チャンクにまとめるフレーム数
+
+
+def replay_frames(data, rate):
+    """記録から再計算したゲーム状態を、1行1フレームの JSON (ゲーム中と同じ形式) で返すジェネレータ"""
+    header, _ = decode_log(data)
+    every = max(1, round(header['simulation_rate'] / rate))
+    lines = []
+    for seq, (step, state) in enumerate(simulate(data, every)):
+        fields = {'ball': state.ball.to_dict(), 'score': state.score(), 'paddles': state.paddles()}
+        lines.append(encode_state_text(seq, step, fields, keyframe=True))
+        if len(lines) >= FRAMES_PER_CHUNK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+@login_required
+def game_replay(request):
+    """ゲームのリプレイを分割して返す
+
+    format=log なら記録 (シードと入力) をそのまま、それ以外は物理演算をやり直したゲーム状態を返す。
+    取得できるのはゲームに参加したプレイヤーとスタッフだけ。
+    """
+    game_id = request.GET.get('game_id')
+    if not game_id:
+        return JsonResponse({'error': 'Game ID is required'}, status=400)
+    path = replay_path(game_id)
+    if path is None:
+        return JsonResponse({'error': 'Invalid game ID'}, status=400)
+    if not request.user.is_staff and not GamePlayers.objects.filter(game_id=game_id, user=request.user).exists():
+        return JsonResponse({'error': 'Not a player in this game'}, status=403)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Replay not found'}, status=404)
+
+    if request.GET.get('format') == 'log':
+        return FileResponse(f, content_type='application/octet-stream')
+
+    with f:
+        data = f.read()
+    try:
+        decode_log(data)
+        rate = int(request.GET.get('rate', getattr(settings, 'PONG_REPLAY_RATE', 30)))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if rate <= 0:
+        return JsonResponse({'error': 'rate must be positive'}, status=400)
+    return StreamingHttpResponse(replay_frames(data, rate), content_type='application/x-ndjson')
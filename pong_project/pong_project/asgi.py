@@ -20,8 +20,10 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import pong.routing
+from pong.consumers import shard
 
 application = ProtocolTypeRouter({
+    "lifespan": shard.lifespan,
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
@@ -29,3 +31,6 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+# 複数ワーカーでルームを分担しているときは、接続を待たずに担当分の転送を受け付ける
+shard.start_with_server()
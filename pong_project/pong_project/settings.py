@@ -176,8 +176,93 @@ FORTY_TWO_REDIRECT_URI = os.environ.get('FORTY_TWO_REDIRECT_URI')
 
 # Channels設定
 ASGI_APPLICATION = 'pong_project.asgi.application'
+# 既定はプロセス内だけで動く InMemoryChannelLayer (1台・1プロセスでの開発とテスト用)。
+# 複数ワーカーでルームを分担するときは、プロセス間で共有できる channel layer
+# (例: channels_redis.core.RedisChannelLayer、channels-redis が必要) を環境変数で指定する。
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': os.environ.get('PONG_CHANNEL_LAYER_BACKEND', 'channels.layers.InMemoryChannelLayer'),
     },
 }
+if os.environ.get('PONG_CHANNEL_LAYER_HOSTS'):
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'hosts': os.environ['PONG_CHANNEL_LAYER_HOSTS'].split(','),
+    }
+
+# ゲームエンジン設定
+PONG_TICK_RATE = 60  # 全ゲームルーム共通のティックレート (Hz)
+# 物理演算のバックエンド: 'python' (ルームごと) または 'numpy' (全ルームを配列で一括計算、numpy が必要)
+PONG_PHYSICS_BACKEND = os.environ.get('PONG_PHYSICS_BACKEND', 'python')
+PONG_KEYFRAME_INTERVAL = 60  # ゲーム状態のキーフレーム (全項目) を送るフレーム間隔
+PONG_INPUT_RATE_LIMIT = 120  # 接続ごとに受け付けるパドル入力数の上限 (毎秒)
+# 負荷が高いとき (ティックの予算の使用率がこれを超えたとき) はゲーム状態の送信頻度を下げる
+PONG_LOAD_SHED_BUDGET = 0.8
+PONG_MIN_SNAPSHOT_RATE = 20  # 送信頻度を下げるときの下限 (Hz)
+# ゲームルームを分担するワーカー数と、このプロセスの番号 (ルームはゲームIDのハッシュで割り当てる)
+PONG_SHARD_COUNT = int(os.environ.get('PONG_SHARD_COUNT', 1))
+PONG_SHARD_INDEX = int(os.environ.get('PONG_SHARD_INDEX', 0))
+PONG_RECONNECT_GRACE = 20  # 切断したプレイヤーの再接続を待つ秒数 (その間ルームを残して物理演算を止める)
+# 動いているルームの状態を定期的に追記するファイル (未設定なら無効、{shard} はシャード番号に置き換える)
+# プロセスが再起動しても、プレイヤーは再接続トークンで最後のチェックポイントから再開できる
+PONG_CHECKPOINT_PATH = os.environ.get('PONG_CHECKPOINT_PATH')
+PONG_CHECKPOINT_INTERVAL = 5.0  # チェックポイントの間隔 (秒)
+PONG_SPECTATOR_RATE = 15  # 観戦者へのゲーム状態の送信頻度 (Hz)
+PONG_SPECTATOR_LIMIT = 50  # ルームごとの観戦者数の上限
+PONG_COUNTDOWN_SECONDS = 3  # 2人揃ってからゲーム開始までの秒数
+PONG_GOAL_PAUSE_SECONDS = 1  # ゴール後にボールを止めておく秒数
+PONG_BOT_DIFFICULTY = 'normal'  # join_game で難易度の指定がないときのボットの難易度 (easy / normal / hard)
+# 接続ごとの送信キューの長さ (超えたら送れていないゲーム状態を捨てて最新のものだけ送る)
+PONG_OUTBOUND_LIMIT = 8
+PONG_SLOW_CLIENT_TIMEOUT = 5.0  # キューのメッセージがこの秒数送れなければ切断する (再接続で追いつく)
+# 終了したゲームのリプレイ (シードとパドル入力の記録) を保存するディレクトリ
+# ファイルはゲームごとに増え続けるので、未設定か空なら記録しない (古いファイルの削除は運用側で行う)
+PONG_REPLAY_DIR = os.environ.get('PONG_REPLAY_DIR')
+PONG_REPLAY_RATE = 30  # リプレイを再生するときに送るフレームの頻度 (Hz)
+# 終了したゲームの結果は、このファイル (アウトボックス) に追記してからまとめてデータベースに書き込む
+# (空なら追記しない、{shard} はシャード番号に置き換える)。起動時に残っている結果は書き込み直す
+PONG_RESULT_OUTBOX = os.environ.get('PONG_RESULT_OUTBOX', os.path.join(BASE_DIR, 'outbox', 'game_results-{shard}.jsonl'))
+PONG_RESULT_FLUSH_INTERVAL = 0.5  # 結果をまとめる間隔 (秒)
+PONG_RESULT_BATCH_SIZE = 100  # 1回のトランザクションで書き込む結果の数
+# マッチングで許容するレーティングの差 (待ち時間 PONG_MATCH_WIDEN_INTERVAL 秒ごとに GROWTH ずつ広げ、MAX_WINDOW まで)
+PONG_MATCH_WINDOW = 100
+PONG_MATCH_WINDOW_GROWTH = 50
+PONG_MATCH_WIDEN_INTERVAL = 5.0
+PONG_MATCH_MAX_WINDOW = 1000
+# /metrics/ を取得するための Bearer トークン (未設定ならスタッフのセッションでしか取得できない)
+PONG_METRICS_TOKEN = os.environ.get('PONG_METRICS_TOKEN')
+
+# ログ設定
+# pong.* のロガーはキュー経由で別スレッドが stderr に書き込む (イベントループを書き込みで止めない)。
+# 同じメッセージは1秒あたり PONG_LOG_SAMPLE_RATE 件までに間引く。
+# レベルは PONG_LOG_LEVEL (全体) と PONG_LOG_LEVELS (例: "pong.game=DEBUG,pong.views=WARNING") で変えられる。
+PONG_LOG_LEVEL = os.environ.get('PONG_LOG_LEVEL', 'INFO').upper()
+PONG_LOG_SAMPLE_RATE = 10
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {'()': 'pong.utils.log.StructuredFormatter'},
+    },
+    'filters': {
+        'sampling': {'()': 'pong.utils.log.SamplingFilter', 'rate': PONG_LOG_SAMPLE_RATE, 'burst': PONG_LOG_SAMPLE_RATE * 2},
+    },
+    'handlers': {
+        'pong': {
+            'class': 'pong.utils.log.QueueStreamHandler',
+            'formatter': 'structured',
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        'pong': {'handlers': ['pong'], 'level': PONG_LOG_LEVEL, 'propagate': False},
+        # サブシステムごとの既定のレベル
+        'pong.game': {'level': PONG_LOG_LEVEL},         # ゲームルーム (受信・送信メッセージは DEBUG)
+        'pong.matchmaking': {'level': PONG_LOG_LEVEL},
+        'pong.shard': {'level': PONG_LOG_LEVEL},
+        'pong.engine': {'level': PONG_LOG_LEVEL},       # スケジューラ・チェックポイント
+        'pong.views': {'level': PONG_LOG_LEVEL},
+    },
+}
+for _item in filter(None, os.environ.get('PONG_LOG_LEVELS', '').split(',')):
+    _name, _, _level = _item.partition('=')
+    LOGGING['loggers'].setdefault(_name.strip(), {})['level'] = _level.strip().upper()
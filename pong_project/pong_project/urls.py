@@ -17,10 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, re_path, include
 from pong.views import index, health_check, signup_api  # indexビューとsignup_apiをインポート
+from pong.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health/', health_check, name='health_check'),  # ヘルスチェック用のURL
+    path('metrics/', metrics, name='metrics'),  # Prometheus 用のメトリクス (nginx からは公開しない)
     path('pong/', include('pong.urls')),  # pongアプリのURLをインクルード
     re_path(r'^.*$', index, name='index'),  # すべてのパスをindexビューにリダイレクト
 ]
\ No newline at end of file